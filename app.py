@@ -1,512 +1,754 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import plotly.express as px
 import folium
-from streamlit_folium import folium_static
-from folium.plugins import HeatMap
+from streamlit_folium import st_folium
 from datetime import datetime
+from collections import OrderedDict
 import os
 import math
 
-# Pro transformaci souřadnic z EPSG:5514 na WGS84 (EPSG:4326)
-from pyproj import Transformer
+from ndop_data import (
+    Dataset, EmptyExportError, install_latest_export, source_stat, species_cube, species_count_by_year,
+    heatmap_html, heatmap_animation_html, TABLE_COLUMNS, format_table_page,
+    table_rows_html, table_html, StageProfiler, PROFILING, Warmup, WARMUP, read_previous_snapshot, CUBE_SUFFIX,
+    MONTH_NAMES, LAYER_COLORS, squares_map_html, value_colors, area_species_summary, TREND_MEASURES,
+)
+from ndop_report import figure_species_yearly, figure_monthly, PHENOLOGY_TITLES
 
-# -------------------------------------------------------------
-# KÓD S PODPOROU ENCODING CP1250
-# -------------------------------------------------------------
-#   1) Datum je ve formátu YYYYMMDD (parsováno přes %Y%m%d)
-#   2) Souřadnice EPSG:5514 -> WGS84
-#   3) Změna encodingu na cp1250 (místo utf-8-sig)
-#   4) Přidáno low_memory=False, abychom předešli DtypeWarning
-# -------------------------------------------------------------
 
 # ========================
-# Konfigurace sloupců:
+# Nastavení Streamlit aplikace
 # ========================
-
-CONFIG = {
-    # Sloupec s datem od (YYYYMMDD):
-    'col_date': 'CXAKCE_DATI_OD',
-    # Sloupec s datem do (YYYYMMDD):
-    'col_date2': 'CXAKCE_DATI_DO',
-    # Sloupec s názvem druhu:
-    'col_species': 'CXTAXON_NAME_CZ',
-    # Sloupec s pozorovateli:
-    'col_observer': 'CXAKCE_AUTOR',
-    # Sloupec s názvem města/obce:
-    'col_city': 'CXKATASTR_NAZEV',
-    # Sloupec s názvem místa pozorování:
-    'col_location_name': 'CXLOKAL_NAZEV',
-    # Sloupec s minimálním počtem jedinců (pokud existuje):
-    'col_count_min': 'POCET',
-    # Sloupec s počtem (pokud existuje):
-    'col_count': 'POCET',
-    # Sloupec s odkazem (ID):
-    'col_link': 'ID_ND_NALEZ',
-    # Sloupec kvadrátem:
-    'col_kvadrat': 'CXLOKAL_KVADRAT_XY',
-    # Sloupec se souřadnicí X (EPSG:5514):
-    'col_lng': 'CXLOKAL_X',
-    # Sloupec se souřadnicí Y (EPSG:5514):
-    'col_lat': 'CXLOKAL_Y',
-    # Nepovinný sloupec s aktivitou (pokud CSV obsahuje):
-    'col_activity': 'Activity',
-}
+st.set_page_config(page_title="Statistika pozorování", layout="wide")
 
 # ========================
-# Nastavení Streamlit aplikace
+# Sdílená data pro všechny relace
 # ========================
-st.set_page_config(page_title="Statistika pozorování", layout="wide")
+# Dataset (data, kostka, index - viz ndop_data.py) je ve st.cache_resource:
+# všechny relace dostávají tentýž objekt, nic se nedeserializuje ani nekopíruje
+# a paměť nezávisí na počtu uživatelů. Data se proto nesmí měnit na místě -
+# filtrování vrací jen výřezy (viz select_species_range), nové sloupce přes assign().
+# Copy-on-Write navíc zaručí, že ani nechtěný zápis do výřezu nezmění sdílený df
+# (v pandas 3 je Copy-on-Write výchozí chování).
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
-# Cesta k souboru CSV (lze nahradit jiným způsobem, např. upload přes st.file_uploader)
+# Cesta k souboru CSV (lze nahradit jiným způsobem, např. upload přes st.file_uploader);
+# může to být i adresář s exportem rozděleným do více CSV (viz ndop_data.EXPORT_PARTS)
 FILE_PATH = "uploaded_file.csv"
 #https://drive.google.com/file/d/1aZF_k46UCLIXHj8HGrclXntiT3AsM2rO/view?usp=drive_link
 # ID souboru na Google Drive (pokud nechcete používat Google Drive, stačí vymazat)
 FILE_ID = "1uIopJz3VCX8wpyqLVZKaGOwofR_G8YG-"
 FILE_URL = f"https://drive.google.com/uc?id={FILE_ID}"
+# Adresář s exporty z NDOP; je-li nastaven, nejnovější CSV v něm nahradí FILE_PATH
+# a připravená data se aktualizují přírůstkově (None = stahovat z Google Drive)
+EXPORT_DIR = None
+
 
 # ========================
-# Funkce pro načtení dat z CSV
+# Načtení dat (sdílené pro všechny relace)
 # ========================
-@st.cache_data
-def load_data(file_path: str) -> pd.DataFrame:
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_dataset(file_path: str, version: tuple) -> Dataset:
     """
-    Načte a připraví data z CSV na základě sloupců definovaných v CONFIG.
-    Nově: encoding cp1250 a low_memory=False
+    Připravená data pro CSV (viz ndop_data.Dataset); jeden objekt pro všechny relace.
+    version (velikost a čas změny souborů, viz source_stat) zajistí nové načtení po výměně exportu;
+    starší verze se z cache uvolní.
     """
-    try:
-        df = pd.read_csv(
-            file_path,
-            delimiter=';',
-            decimal=',',  # <-- říká, že desetinný oddělovač je čárka
-            encoding='utf-8-sig',  # ZMĚNA NA CP1250
-            low_memory=False    # Zamezení DtypeWarning
-        )
-        if df.empty:
-            st.error("Nahraný soubor je prázdný. Nahrajte prosím platný CSV soubor.")
-            st.stop()
-    except pd.errors.EmptyDataError:
-        st.error("Soubor je prázdný nebo neplatný. Nahrajte prosím platný CSV soubor.")
-        st.stop()
+    return Dataset(file_path)
 
-    # Převod a sjednocení názvů sloupců dle CONFIG
-    rename_dict = {
-        CONFIG['col_date']: "Datum",
-        CONFIG['col_date2']: "Datum2",
-        CONFIG['col_observer']: "Pozorovatel",
-        CONFIG['col_city']: "Město",
-        CONFIG['col_location_name']: "Místo pozorování",
-        CONFIG['col_count_min']: "Počet_min",
-        CONFIG['col_count']: "Počet",
-        CONFIG['col_kvadrat']: "Kvadrát",
-        CONFIG['col_link']: "Odkaz",
-        CONFIG['col_lat']: "SouradniceY",
-        CONFIG['col_lng']: "SouradniceX",
-        CONFIG['col_species']: "Druh"
-    }
-
-    # Sloupce, které neexistují, ignorujeme (aby to nespadlo, pokud v CSV nejsou)
-    rename_dict = {old: new for old, new in rename_dict.items() if old in df.columns}
-    df.rename(columns=rename_dict, inplace=True)
-
-    # 1) Převod datumu (YYYYMMDD) -> datetime
-    if "Datum" in df.columns:
-        df["Datum"] = pd.to_datetime(df["Datum"], format="%Y%m%d", errors="coerce")
-
-    # 1a) Převod datumu (YYYYMMDD) -> datetime
-    if "Datum2" in df.columns:
-        df["Datum2"] = pd.to_datetime(df["Datum2"], format="%Y%m%d", errors="coerce")
-
-
-    # 2) Pokud máme souřadnice ve sloupcích SouradniceX a SouradniceY, převedeme je na číslo
-    if "SouradniceX" in df.columns:
-        df["SouradniceX"] = pd.to_numeric(df["SouradniceX"], errors="coerce")
-    if "SouradniceY" in df.columns:
-        df["SouradniceY"] = pd.to_numeric(df["SouradniceY"], errors="coerce")
-
-    # 3) Transformace souřadnic (EPSG:5514 -> WGS84)
-    if "SouradniceX" in df.columns and "SouradniceY" in df.columns:
-        transformer = Transformer.from_crs("EPSG:5514", "EPSG:4326", always_xy=True)
-        # always_xy=True => (x, y) = (lon, lat)
-        # V EPSG:5514 je X = Easting, Y = Northing, transform vrátí (lon, lat) v EPSG:4326
-        lon_list, lat_list = transformer.transform(df["SouradniceX"].values, df["SouradniceY"].values)
-        # Uložíme do dvou nových sloupců:
-        df["Zeměpisná délka"] = lon_list
-        df["Zeměpisná šířka"] = lat_list
-    else:
-        # Pokud neexistují X/Y, jen je vytvoříme prázdné
-        df["Zeměpisná délka"] = None
-        df["Zeměpisná šířka"] = None
-
-    # Pokud sloupec Odkaz (ID) existuje, vytvoříme reálnou URL do sloupce
-    if "Odkaz" in df.columns:
-        df["Odkaz"] = df["Odkaz"].apply(
-            lambda x: f'<a href="https://portal23.nature.cz/nd/find.php?akce=view&akce2=stopValidaci&karta_id={x}" target="_blank">link</a>' if pd.notna(x) else ""
-        )
 
-    # Sloupce s počty, pokud existují
-    if "Počet" in df.columns:
-        df["Počet"].fillna(1, inplace=True)
-        df["Počet"] = df["Počet"].astype(int)
 
-    if "Počet_min" in df.columns:
-        df["Počet_min"].fillna(1, inplace=True)
-        df["Počet_min"] = df["Počet_min"].astype(int)
+# ========================
+# Grafy
+# ========================
+def figure_species_count_by_year(cube: pd.DataFrame):
+    """Graf: celkový počet pozorovaných druhů podle roku."""
+    yearly_counts = species_count_by_year(cube)
+
+    fig_yearly = px.bar(
+        yearly_counts,
+        x="Rok",
+        y="Počet druhů",
+        title="Celkový počet pozorovaných druhů podle roku",
+    )
+
+    fig_yearly.update_xaxes(type='category')
+
+    # Nastavíme osu Y na celé hodnoty:
+    fig_yearly.update_yaxes(dtick=max(1, yearly_counts["Počet druhů"].max() // 5))
+    return fig_yearly
+
+
+# Grafy jednoho druhu (počet podle roku, fenologie) jsou v ndop_report.py,
+# protože je používá i hromadný export přehledů.
+
+
+def figure_compare_yearly(yearly_counts: pd.DataFrame):
+    """Graf: počet pozorování porovnávaných druhů podle roku (vstup z Dataset.yearly_counts_many)."""
+    fig = px.line(
+        yearly_counts,
+        x="Rok",
+        y="Počet pozorování",
+        color="Druh",
+        markers=True,
+        color_discrete_sequence=LAYER_COLORS,
+        title="Počet pozorování vybraných druhů podle roku",
+    )
+    fig.update_xaxes(type='category')
+    return fig
+
+
+def figure_compare_monthly(monthly_counts: pd.DataFrame):
+    """Graf: počet pozorování porovnávaných druhů podle měsíců (vstup z Dataset.phenology_many)."""
+    fig = px.line(
+        monthly_counts,
+        x="Měsíc",
+        y="Počet pozorování",
+        color="Druh",
+        markers=True,
+        color_discrete_sequence=LAYER_COLORS,
+        category_orders={"Měsíc": list(MONTH_NAMES.values())},
+        title="Počet pozorování vybraných druhů podle měsíců",
+    )
+    return fig
+
+
+def figure_species_shares(shares: pd.DataFrame, species: str):
+    """Graf: podíl druhu na úsilí v jednotlivých letech (vstup z SpeciesTrends.species_shares)."""
+    fig = px.line(
+        shares,
+        x="Rok",
+        y="Podíl (%)",
+        color="Míra",
+        markers=True,
+        title=f"Podíl druhu {species} na úsilí podle roku",
+    )
+    fig.update_xaxes(type='category')
+    return fig
+
+
+# ========================
+# Memoizace výsledků v rámci relace
+# ========================
+# Každá změna widgetu spustí celý skript znovu. Výřez dat, grafy a HTML mapy se
+# proto pamatují v session_state pod klíčem (otisk dat, druh, datum od, datum do, typ),
+# takže stránkování tabulky nebo přepnutí checkboxu nic nepřepočítává.
+MEMO_MAX_ENTRIES = 32
+
+
+class SessionMemo:
+    """Jednoduchá LRU cache s omezeným počtem položek a počítadly zásahů/výpadků."""
 
-    # Vyčištění nepovinných sloupců, pokud existují
-    for col in ["Město", "Pozorovatel", "Místo pozorování", "Druh", "Kvadrát"]:
-        if col in df.columns:
-            df[col].fillna("", inplace=True)
+    def __init__(self, max_entries: int = MEMO_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-    # Reset indexu
-    df = df.reset_index(drop=True)
+    def get_or_compute(self, key, compute):
+        """Vrátí uloženou hodnotu pro key, nebo ji spočítá přes compute() a uloží."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
 
-    return df
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+
+def session_memo() -> SessionMemo:
+    """Memoizační cache aktuální relace (vytvoří se při prvním použití)."""
+    if "memo" not in st.session_state:
+        st.session_state.memo = SessionMemo()
+    return st.session_state.memo
 
 
 # ========================
 # Funkce pro stažení a uložení souboru z Google Drive (volitelné)
 # ========================
-@st.cache_data
 def load_data_from_drive():
     """
     Pokud chcete používat Google Drive, tato funkce stáhne CSV z drive.
     V opačném případě ji můžete vynechat a data nahrávat rovnou z disku
-    nebo přes st.file_uploader.
+    nebo přes st.file_uploader. S nastaveným EXPORT_DIR převezme nejnovější
+    export z adresáře (nový export se do dat doplní přírůstkově).
     """
+    if EXPORT_DIR:
+        install_latest_export(EXPORT_DIR, FILE_PATH)
+    else:
+        download_from_drive()
+    return load_dataset(FILE_PATH, source_stat(FILE_PATH))
+
+
+def download_from_drive():
+    """Stáhne CSV z Google Drive, pokud ještě není na disku."""
     import gdown
     if not os.path.exists(FILE_PATH):
         gdown.download(FILE_URL, FILE_PATH, quiet=False)
-    return load_data(FILE_PATH)
 
 
-# ========================
-# Načtení (nebo stažení) dat
-# ========================
-df = load_data_from_drive()  # Pro data z Google Drive
-# df = load_data(FILE_PATH)  # Pro data z lokálního souboru (alternativa)
+@st.cache_resource
+def start_warmup() -> Warmup:
+    """
+    Spustí stažení a přípravu dat na pozadí - jednou za běh serveru, při první relaci
+    (Streamlit nemá háček pro start serveru; při nasazení lze data připravit předem
+    přes "python ndop_data.py uploaded_file.csv warm"). Další relace čekají na totéž vlákno.
+    """
+    return Warmup(load_data_from_drive, WARMUP['status_file'])
 
 
 # ========================
-# Příprava checkboxů pro volitelné grafy / mapy
+# Načtení (nebo stažení) dat
 # ========================
-c1, c2, c3, c4 = st.columns(4)
-with c1:
-    show_bar_yearly = st.checkbox("Graf: Počet druhů v jednotlivých letech", value=True)
-with c2:
-#    show_pie_top_species = st.checkbox("Koláč: Nejčastější druhy", value=True)
-    show_bar_species_yearly = st.checkbox("Graf: Počet pozorování vybraného druhu", value=True)
-with c3:
-#    show_map_markers = st.checkbox("Mapa s body pozorování", value=True)
-    show_map_heat = st.checkbox("Heatmapa pozorování", value=True)
-with c4:
-    show_bar_monthly_obs = st.checkbox("Graf: Počty pozorování podle měsíců", value=True)
+if WARMUP['enabled']:
+    warmup = start_warmup()
+    if not warmup.ready:
+        # Než se data připraví, ukážeme stav načítání a náhled z předchozí verze dat
+        # (kostka je malá a načte se hned)
+        loading = st.empty()
+        with loading.container():
+            st.info("Data se připravují, stránka se zobrazí automaticky po jejich načtení.")
+            preview_cube, _ = read_previous_snapshot(FILE_PATH, CUBE_SUFFIX)
+            if preview_cube is not None:
+                st.caption("Náhled z předchozí verze dat:")
+                st.plotly_chart(figure_species_count_by_year(preview_cube), key="preview_yearly")
+            with st.spinner("Načítám data ..."):
+                warmup.done.wait()
+        loading.empty()
+
+# Měření fází tohoto překreslení (zapíná se v PROFILING, vypnuté nic neměří)
+profiler = StageProfiler(PROFILING['enabled'], PROFILING['trace_memory'])
+try:
+    try:
+        # Pro data z Google Drive (pokud CSV ještě není na disku); po načtení na pozadí už jen z cache
+        with st.spinner("Načítám data ..."):
+            dataset = profiler.run("load_data", load_data_from_drive)
+    except EmptyExportError as e:
+        st.error(str(e))
+        st.stop()
 
+    cube = dataset.cube  # Předpočítané součty druh × rok × měsíc
+    data_info = dataset.info
+    data_columns = data_info["columns"]
+    dataset_key = dataset.key  # Otisk dat pro klíče memoizace
+    memo = session_memo()
+
+
+    # ========================
+    # Příprava checkboxů pro volitelné grafy / mapy
+    # ========================
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        show_bar_yearly = st.checkbox("Graf: Počet druhů v jednotlivých letech", value=True)
+    with c2:
+    #    show_pie_top_species = st.checkbox("Koláč: Nejčastější druhy", value=True)
+        show_bar_species_yearly = st.checkbox("Graf: Počet pozorování vybraného druhu", value=True)
+    with c3:
+    #    show_map_markers = st.checkbox("Mapa s body pozorování", value=True)
+        show_map_heat = st.checkbox("Heatmapa pozorování", value=True)
+    with c4:
+        show_bar_monthly_obs = st.checkbox("Graf: Počty pozorování podle měsíců", value=True)
+
+
+    # ========================
+    # Definice proměnných pro sloupce v aplikaci
+    # (abychom se nemuseli spoléhat na "tvrdé" názvy sloupců)
+    # ========================
+    COL_DATE = "Datum"
+    COL_DATE2 = "Datum2"
+    COL_SPECIES = "Druh"
+    COL_LAT = "Zeměpisná šířka"
+    COL_LNG = "Zeměpisná délka"
+    COL_COUNT = "Počet"
+
+
+    # ========================
+    # Filtr: Druh (jeden druh, nebo porovnání více druhů)
+    # ========================
+    COMPARE_MAX_SPECIES = 20
+
+    mode = st.radio(
+        "Režim:", ["Jeden druh", "Porovnání druhů", "Síťové mapy", "Oblast na mapě", "Trendy druhů"], horizontal=True
+    )
+    compare_mode = mode == "Porovnání druhů"
+    atlas_mode = mode == "Síťové mapy"
+    area_mode = mode == "Oblast na mapě"
+    trends_mode = mode == "Trendy druhů"
+    if compare_mode:
+        compare_species = st.multiselect(
+            "Vyberte druhy k porovnání:", data_info["species"], max_selections=COMPARE_MAX_SPECIES
+        )
+        selected_species = "Vyber"
+    else:
+        compare_species = []
+        species_list = ["Vyber"] + data_info["species"]
+        selected_species = st.selectbox("Vyberte druh:", species_list)
+
+    # ========================
+    # Filtr: Datum (Rok nebo vlastní rozsah)
+    # ========================
+    if data_info["date_min"] is not None:
+        date_min = data_info["date_min"]
+        date_max = data_info["date_max"]
+        years = data_info["years"]
+    else:
+        date_min = datetime.today().date()
+        date_max = datetime.today().date()
+        years = []
+
+    selected_year = st.selectbox("Vyberte rok:", ["Všechny roky"] + [str(y) for y in years])
+
+    if selected_year == "Všechny roky":
+        col_date_from, col_date_to = st.columns(2)
+        with col_date_from:
+            date_from = st.date_input("Datum od:", date_min, min_value=date_min, max_value=date_max)
+        with col_date_to:
+            date_to = st.date_input("Datum do:", date_max, min_value=date_min, max_value=date_max)
+    else:
+        # Pokud uživatel vybral rok, bereme 1.1. a 31.12. daného roku
+        try:
+            selected_year_int = int(selected_year)
+            date_from = datetime(selected_year_int, 1, 1).date()
+            date_to = datetime(selected_year_int, 12, 31).date()
+        except:
+            # Pro jistotu fallback:
+            date_from = date_min
+            date_to = date_max
+
+    # ========================
+    # Ladění: měření fází (jen se zapnutým PROFILING)
+    # ========================
+    def show_profile(species) -> None:
+        """Zapíše měření tohoto překreslení do logu a zobrazí je v rozbalovacím panelu."""
+        if not profiler.enabled:
+            return
+        profiler.write_log(
+            PROFILING['log_file'],
+            species=species, date_from=date_from, date_to=date_to,
+            memo_hits=memo.hits, memo_misses=memo.misses,
+        )
+        with st.expander(f"Ladění: měření fází ({profiler.total_seconds():.3f} s)"):
+            st.dataframe(pd.DataFrame(profiler.records), hide_index=True)
+            st.caption(
+                f"Memoizace v relaci: {memo.hits} zásahů, {memo.misses} výpočtů. "
+                f"Záznamy se připisují do {PROFILING['log_file']}."
+            )
 
-# ========================
-# Definice proměnných pro sloupce v aplikaci
-# (abychom se nemuseli spoléhat na "tvrdé" názvy sloupců)
-# ========================
-COL_DATE = "Datum"
-COL_DATE2 = "Datum2"
-COL_SPECIES = "Druh"
-COL_LAT = "Zeměpisná šířka"
-COL_LNG = "Zeměpisná délka"
-COL_COUNT = "Počet"
 
+    # ========================
+    # Porovnání více druhů
+    # ========================
+    # Všechny vybrané druhy se vyberou jedním výběrem řádků a roční i měsíční součty
+    # se spočítají jedním groupby (většinou rovnou z kostky a předpočítané fenologie), takže porovnání 20 druhů
+    # stojí zhruba tolik jako zobrazení jednoho.
+    if compare_mode:
+        if not compare_species:
+            st.info("Pro porovnání vyberte nahoře alespoň jeden druh.")
+        else:
+            compare_key = (dataset_key, tuple(compare_species), date_from, date_to)
+
+            with profiler.stage("compare_filter", rows_in=data_info["n_rows"]) as record:
+                compare_data = memo.get_or_compute(
+                    compare_key + ("filter",), lambda: dataset.select_many(compare_species, date_from, date_to)
+                )
+                record["rows_out"] = len(compare_data)
+
+            if show_bar_species_yearly and COL_DATE in data_columns:
+                with profiler.stage("compare_yearly_figure", rows_in=len(cube)):
+                    fig_compare_yearly = memo.get_or_compute(
+                        (dataset_key, tuple(compare_species), "fig_yearly"),
+                        lambda: figure_compare_yearly(dataset.yearly_counts_many(compare_species))
+                    )
+                with profiler.stage("compare_yearly_render"):
+                    st.plotly_chart(fig_compare_yearly)
+
+            if show_bar_monthly_obs and COL_DATE in data_columns:
+                with profiler.stage("compare_monthly_figure", rows_in=len(compare_data)):
+                    fig_compare_monthly = memo.get_or_compute(compare_key + ("fig_monthly",), lambda: figure_compare_monthly(
+                        dataset.phenology_many(compare_species, date_from, date_to)
+                    ))
+                with profiler.stage("compare_monthly_render"):
+                    st.plotly_chart(fig_compare_monthly)
+
+            if show_map_heat:
+                if not compare_data.empty:
+                    heat_mode = st.radio("Heatmapa:", ["Společná", "Po druzích"], horizontal=True)
+                    heat_by = "Druh" if heat_mode == "Po druzích" else None
+                    with profiler.stage("compare_heatmap_build", rows_in=len(compare_data)):
+                        heat_html = memo.get_or_compute(
+                            compare_key + ("heatmap", heat_by), lambda: heatmap_html(compare_data, by=heat_by)
+                        )
+                    st.write("### Mapa pozorování")
+                    with profiler.stage("compare_heatmap_render"):
+                        components.html(heat_html, height=510, width=700)
+                else:
+                    st.info("Vybrané druhy nemají v tomto období žádná pozorování.")
+
+        show_profile(compare_species)
+        st.stop()
 
-# ========================
-# Filtr: Druh
-# ========================
-species_list = ["Vyber"]
-if df is not None and not df.empty and COL_SPECIES in df.columns:
-    species_list = ["Vyber"] + sorted(set(df[COL_SPECIES].dropna().unique()))
-selected_species = st.selectbox("Vyberte druh:", species_list)
 
-# ========================
-# Filtr: Datum (Rok nebo vlastní rozsah)
-# ========================
-if COL_DATE in df.columns and not df.empty:
-    date_min = df[COL_DATE].min().date()
-    date_max = df[COL_DATE].max().date()
-    years = sorted(df[COL_DATE].dropna().dt.year.unique(), reverse=True)
-else:
-    date_min = datetime.today().date()
-    date_max = datetime.today().date()
-    years = []
-
-selected_year = st.selectbox("Vyberte rok:", ["Všechny roky"] + [str(y) for y in years])
-
-if selected_year == "Všechny roky":
-    col_date_from, col_date_to = st.columns(2)
-    with col_date_from:
-        date_from = st.date_input("Datum od:", date_min, min_value=date_min, max_value=date_max)
-    with col_date_to:
-        date_to = st.date_input("Datum do:", date_max, min_value=date_min, max_value=date_max)
-else:
-    # Pokud uživatel vybral rok, bereme 1.1. a 31.12. daného roku
-    try:
-        selected_year_int = int(selected_year)
-        date_from = datetime(selected_year_int, 1, 1).date()
-        date_to = datetime(selected_year_int, 12, 31).date()
-    except:
-        # Pro jistotu fallback:
-        date_from = date_min
-        date_to = date_max
+    # ========================
+    # Síťové mapy (obsazenost kvadrátů)
+    # ========================
+    # Mapy se počítají z předpočítaných bitových map kvadrátů (viz ndop_data.Occupancy)
+    # po celých letech vybraného rozsahu dat.
+    SQUARE_STATUS_COLORS = {"nově obsazený": "#2ca02c", "opuštěný": "#d62728", "trvale obsazený": "#1f77b4"}
 
-# ========================
-# Filtrování dat
-# ========================
-filtered_data = df.copy()
+    if atlas_mode:
+        occupancy = dataset.occupancy
+        if occupancy.empty:
+            st.info("Data neobsahují záznamy s kvadrátem a datem.")
+            show_profile(selected_species)
+            st.stop()
 
-if not filtered_data.empty and COL_DATE in filtered_data.columns:
-    filtered_data = filtered_data[
-        (filtered_data[COL_DATE].dt.date >= date_from) &
-        (filtered_data[COL_DATE].dt.date <= date_to)
-    ]
+        atlas_view = st.radio(
+            "Síťová mapa:", ["Rozšíření druhu", "Druhová bohatost", "Změny rozšíření", "Spoluvýskyt druhů"], horizontal=True
+        )
+        period = (date_from.year, date_to.year)
+        st.caption(f"Období {period[0]}–{period[1]} (kvadráty se počítají po celých letech).")
+        atlas_key = (dataset_key, "atlas", atlas_view, period)
+
+        if atlas_view == "Změny rozšíření":
+            atlas_years = [int(year) for year in occupancy.years]
+            reference = st.select_slider(
+                "Srovnávací (dřívější) období:", options=atlas_years, value=(atlas_years[0], atlas_years[len(atlas_years) // 2])
+            )
+            atlas_key += (reference,)
+
+        if atlas_view == "Druhová bohatost":
+            with profiler.stage("atlas_query"):
+                squares = occupancy.richness(*period)
+            with profiler.stage("atlas_map_build", rows_in=len(squares)):
+                atlas_html = memo.get_or_compute(atlas_key, lambda: squares_map_html(
+                    squares.assign(Barva=value_colors(squares["Počet druhů"])), "Barva", "Počet druhů"
+                ))
+            st.write(f"### Druhová bohatost kvadrátů (nejvýše {squares['Počet druhů'].max() if not squares.empty else 0} druhů)")
+            components.html(atlas_html, height=510, width=700)
+
+        elif selected_species == "Vyber":
+            st.info("Pro zobrazení nahoře vyberte druh.")
+
+        elif atlas_view == "Rozšíření druhu":
+            with profiler.stage("atlas_query"):
+                squares = occupancy.distribution(selected_species, *period)
+            with profiler.stage("atlas_map_build", rows_in=len(squares)):
+                atlas_html = memo.get_or_compute(atlas_key + (selected_species,), lambda: squares_map_html(
+                    squares.assign(Barva=value_colors(squares["Počet let"])), "Barva", "Počet let"
+                ))
+            st.write(f"### Rozšíření druhu {selected_species}: {len(squares)} kvadrátů")
+            components.html(atlas_html, height=510, width=700)
+
+        elif atlas_view == "Změny rozšíření":
+            with profiler.stage("atlas_query"):
+                squares = occupancy.changes(selected_species, reference, period)
+                summary = occupancy.change_summary(reference, period)
+            counts = squares["Stav"].value_counts()
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Nově obsazené kvadráty", int(counts.get("nově obsazený", 0)))
+            m2.metric("Opuštěné kvadráty", int(counts.get("opuštěný", 0)))
+            m3.metric("Trvale obsazené kvadráty", int(counts.get("trvale obsazený", 0)))
+            with profiler.stage("atlas_map_build", rows_in=len(squares)):
+                atlas_html = memo.get_or_compute(atlas_key + (selected_species,), lambda: squares_map_html(
+                    squares.assign(Barva=squares["Stav"].map(SQUARE_STATUS_COLORS)), "Barva", "Stav"
+                ))
+            components.html(atlas_html, height=510, width=700)
+            st.write(f"### Změny rozšíření všech druhů ({reference[0]}–{reference[1]} → {period[0]}–{period[1]})")
+            st.dataframe(summary.sort_values("Změna"), hide_index=True)
 
-if selected_species == "Vyber":
-    # Když není vybraný žádný konkrétní druh, vyprázdníme data:
-    filtered_data = filtered_data.iloc[0:0]
-elif selected_species != "Vyber":
-    # Filtr na vybraný druh
-    if COL_SPECIES in filtered_data.columns:
-        filtered_data = filtered_data[filtered_data[COL_SPECIES] == selected_species]
+        else:
+            with profiler.stage("atlas_query"):
+                cooccurring = occupancy.cooccurrence(selected_species, *period)
+            st.write(f"### Druhy se společnými kvadráty s druhem {selected_species}")
+            st.dataframe(cooccurring, hide_index=True)
 
+        show_profile(selected_species)
+        st.stop()
 
-# ========================
-# Graf: Počet pozorovaných DRUHŮ v jednotlivých letech (z celých DF)
-# ========================
-if df is not None and not df.empty and COL_DATE in df.columns and COL_SPECIES in df.columns:
-    yearly_counts = df.groupby(df[COL_DATE].dt.year)[COL_SPECIES].nunique().reset_index()
-    yearly_counts.columns = ["Rok", "Počet druhů"]
-else:
-    yearly_counts = pd.DataFrame(columns=["Rok", "Počet druhů"])
-
-fig_yearly = px.bar(
-    yearly_counts,
-    x="Rok",
-    y="Počet druhů",
-    title="Celkový počet pozorovaných druhů podle roku",
-)
 
-fig_yearly.update_xaxes(type='category')
+    # ========================
+    # Oblast na mapě (prostorový index)
+    # ========================
+    # Okruh kolem bodu i aktuální výřez mapy se hledají v mřížkovém indexu bodů
+    # (viz ndop_data.SpatialIndex), takže dotaz nezávisí na počtu všech záznamů.
+    # Podkladová mapa se nemění; okruh se do ní jen přidává (feature_group_to_add),
+    # aby se při každém kliknutí nepřekreslila a neztratila přiblížení.
+    AREA_CENTER = (49.80, 15.47)  # Výchozí střed okruhu (střed ČR)
+
+    if area_mode:
+        area_view = st.radio("Oblast:", ["Okruh kolem bodu", "Výřez mapy"], horizontal=True)
+        area_center = st.session_state.get("area_center", AREA_CENTER)
+        area_species = None if selected_species == "Vyber" else selected_species
+
+        area_layer = folium.FeatureGroup(name="Oblast")
+        if area_view == "Okruh kolem bodu":
+            radius_km = st.slider("Poloměr (km):", 1, 50, 5)
+            st.caption(f"Střed okruhu: {area_center[0]:.4f}, {area_center[1]:.4f} (změníte kliknutím do mapy).")
+            folium.Circle(area_center, radius=radius_km * 1000, color="#d62728", fill=True, fill_opacity=0.1).add_to(area_layer)
+        else:
+            st.caption("Zobrazí se pozorování v aktuálním výřezu mapy (posuňte nebo přibližte mapu).")
 
-# Nastavíme osu Y na celé hodnoty:
-fig_yearly.update_yaxes(dtick=max(1, yearly_counts["Počet druhů"].max() // 5))
-                       
+        area_map = folium.Map(location=AREA_CENTER, zoom_start=7)
+        map_state = st_folium(
+            area_map, key="area_map", height=450, width=700,
+            feature_group_to_add=area_layer, returned_objects=["last_clicked", "bounds"],
+        )
+        clicked = (map_state or {}).get("last_clicked")
+        if clicked and (clicked["lat"], clicked["lng"]) != area_center:
+            st.session_state["area_center"] = (clicked["lat"], clicked["lng"])
+            st.rerun()
+
+        if area_view == "Okruh kolem bodu":
+            area_key = (dataset_key, "area", area_center, radius_km, area_species, date_from, date_to)
+            with profiler.stage("area_query", rows_in=len(dataset.spatial)) as record:
+                area_data = memo.get_or_compute(area_key, lambda: dataset.select_radius(
+                    *area_center, radius_km, date_from, date_to, area_species
+                ))
+                record["rows_out"] = len(area_data)
+            area_title = f"do {radius_km} km od zvoleného bodu"
+        else:
+            bounds = (map_state or {}).get("bounds") or {}
+            south_west, north_east = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+            if south_west.get("lat") is None or north_east.get("lat") is None:
+                st.info("Výřez mapy se načítá.")
+                show_profile(selected_species)
+                st.stop()
+            # Zaokrouhlení hranic, aby drobné posuny mapy nevytvářely stále nové klíče memoizace
+            view = tuple(round(value, 4) for value in (
+                south_west["lat"], south_west["lng"], north_east["lat"], north_east["lng"]
+            ))
+            area_key = (dataset_key, "area_view", view, area_species, date_from, date_to)
+            with profiler.stage("area_query", rows_in=len(dataset.spatial)) as record:
+                area_data = memo.get_or_compute(area_key, lambda: dataset.select_bbox(
+                    *view, date_from, date_to, area_species
+                ))
+                record["rows_out"] = len(area_data)
+            area_title = "ve výřezu mapy"
+
+        with profiler.stage("area_summary", rows_in=len(area_data)):
+            area_summary = memo.get_or_compute(area_key + ("summary",), lambda: area_species_summary(area_data))
+        m1, m2 = st.columns(2)
+        m1.metric("Počet pozorování", len(area_data))
+        m2.metric("Počet druhů", len(area_summary))
+        st.write(f"### Druhy pozorované {area_title}")
+        st.dataframe(area_summary, hide_index=True)
+
+        show_profile(selected_species)
+        st.stop()
 
-# Podmínka pro zobrazení grafu pouze pokud je ve filtru vybráno "vyber"
-if show_bar_yearly and selected_species == "Vyber":
- #   st.write("### Počet pozorovaných druhů v jednotlivých letech")
-    st.plotly_chart(fig_yearly)
 
-# ========================
-# Graf: Počet pozorovaných DRUHŮ v jednotlivých letech (z celých DF)
-# ========================
-if df is not None and not df.empty and COL_DATE in df.columns and COL_SPECIES in df.columns:
-    yearly_counts = df.groupby(df[COL_DATE].dt.year)[COL_SPECIES].nunique().reset_index()
-    yearly_counts.columns = ["Rok", "Počet druhů"]
-else:
-    yearly_counts = pd.DataFrame(columns=["Rok", "Počet druhů"])
-
-fig_yearly = px.bar(
-    yearly_counts,
-    x="Rok",
-    y="Počet druhů",
-    title="Celkový počet pozorovaných druhů podle roku",
-)
+    # ========================
+    # Trendy druhů (očištěné o úsilí)
+    # ========================
+    # Žebříček všech druhů se počítá najednou z předpočítaných matic druh × rok
+    # (viz ndop_data.SpeciesTrends) po celých letech vybraného rozsahu dat.
+    if trends_mode:
+        period = (date_from.year, date_to.year)
+        measure = st.radio(
+            "Řadit podle trendu:", list(TREND_MEASURES), horizontal=True,
+            format_func=lambda key: f"Podíl {TREND_MEASURES[key]}",
+        )
+        min_records = st.slider("Nejméně záznamů druhu v období:", 1, 500, 20)
+        st.caption(
+            f"Období {period[0]}–{period[1]}. Trend je sklon podílu druhu na celkovém úsilí v roce "
+            "(záznamy, aktivní pozorovatelé, navštívené kvadráty) v % průměrného podílu za rok: "
+            "kladný = druh přibývá rychleji než úsilí, záporný = ubývá."
+        )
 
-fig_yearly.update_xaxes(type='category')
+        with profiler.stage("trends_ranking", rows_in=len(dataset.trends.species)):
+            ranking = memo.get_or_compute((dataset_key, "trends", period), lambda: dataset.trends.ranking(*period))
+        sort_column = f"Trend podílu {TREND_MEASURES[measure]} (%/rok)"
+        shown = ranking[ranking["Záznamů"] >= min_records].sort_values(sort_column, ascending=False)
+
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Druhů v žebříčku", len(shown))
+        m2.metric("Přibývající", int((shown[sort_column] > 0).sum()))
+        m3.metric("Ubývající", int((shown[sort_column] < 0).sum()))
+        if period[0] == period[1]:
+            st.info("Trend vyžaduje rozsah dat alespoň přes dva roky.")
+        st.dataframe(shown, hide_index=True)
+
+        if selected_species != "Vyber":
+            with profiler.stage("trends_species_figure"):
+                fig_shares = memo.get_or_compute(
+                    (dataset_key, "trend_shares", selected_species, period),
+                    lambda: figure_species_shares(dataset.trends.species_shares(selected_species, *period), selected_species)
+                )
+            st.plotly_chart(fig_shares)
+        else:
+            st.info("Pro graf podílu druhu na úsilí nahoře vyberte druh.")
 
-# Podmínka pro zobrazení grafu pouze pokud je ve filtru vybráno "vyber"
-if show_bar_yearly and selected_species == "vyber":
-    st.write("### Počet pozorovaných druhů v jednotlivých letech")
-    st.plotly_chart(fig_yearly)
+        show_profile(selected_species)
+        st.stop()
 
-# Výpočet procentuálního výskytu druhu a četnosti záznamů na jedno pozorování
-if selected_species != "vyber" and selected_species.strip():
-    total_observations = len(df)
-    species_observations = len(df[df[COL_SPECIES] == selected_species])
-    if total_observations > 0 and species_observations > 0:
-        species_percentage = (species_observations / total_observations) * 100
-        st.markdown(f"""
-        <div style='font-size: 25px; font-weight: bold;'>
 
-        </div>
-        <div style='font-size: 25px; font-weight: bold;'>
-            1 z {total_observations // species_observations} pozorování je {selected_species}.
-        </div>
-        """, unsafe_allow_html=True)
+    # ========================
+    # Filtrování dat
+    # ========================
+    def memo_key(kind: str):
+        """Klíč memoizace pro aktuální výběr druhu a rozsahu dat."""
+        return (dataset_key, kind, selected_species, date_from, date_to)
 
 
+    def select_observations():
+        """Záznamy vybraného druhu v rozsahu dat (podle zvoleného backendu)."""
+        if selected_species == "Vyber":
+            # Když není vybraný žádný konkrétní druh, vyprázdníme data:
+            return dataset.empty()
+        return dataset.select(selected_species, date_from, date_to)
 
 
+    with profiler.stage("filter", rows_in=data_info["n_rows"]) as record:
+        filtered_data = memo.get_or_compute(memo_key("filter"), select_observations)
+        record["rows_out"] = len(filtered_data)
 
 
-# ========================
-# Graf: Počet pozorování vybraného druhu v jednotlivých letech
-# ========================
-if selected_species not in ["Vyber", ""]:
-    # Vytvoříme DataFrame se všemi roky, které máme v datech:
-    all_years_df = pd.DataFrame({"Rok": years})
-    # Spočítáme pro vybraný druh
-    if COL_DATE in df.columns and COL_SPECIES in df.columns:
-        yearly_species_counts = (
-            df[df[COL_SPECIES] == selected_species]
-            .groupby(df[COL_DATE].dt.year).size()
-            .reset_index(name="Počet pozorování")
-        )
-        # Propojíme s tabulkou všech roků (aby se zobrazila i nula, kde není pozorování)
-        yearly_species_counts = all_years_df.merge(
-            yearly_species_counts, left_on="Rok", right_on=COL_DATE, how="left"
-        ).fillna(0)
-
-        # Datový typ
-        yearly_species_counts["Počet pozorování"] = yearly_species_counts["Počet pozorování"].astype(int)
-
-        fig_species_yearly = px.bar(
-            yearly_species_counts,
-            x="Rok",
-            y="Počet pozorování",
-            title=f"Počet pozorování druhu {selected_species} podle roku",
-        )
-        fig_species_yearly.update_yaxes(dtick=max(1, yearly_species_counts["Počet pozorování"].max() // 5))
+    # ========================
+    # Graf: Počet pozorovaných DRUHŮ v jednotlivých letech (z předpočítané kostky)
+    # ========================
+    with profiler.stage("yearly_figure", rows_in=len(cube)):
+        fig_yearly = memo.get_or_compute((dataset_key, "fig_yearly"), lambda: figure_species_count_by_year(cube))
 
-        if show_bar_species_yearly:
-         #   st.write(f"### Počet pozorování druhu {selected_species} v jednotlivých letech")
-            st.plotly_chart(fig_species_yearly)
+    # Podmínka pro zobrazení grafu pouze pokud je ve filtru vybráno "vyber"
+    if show_bar_yearly and selected_species == "Vyber":
+     #   st.write("### Počet pozorovaných druhů v jednotlivých letech")
+        with profiler.stage("yearly_render"):
+            st.plotly_chart(fig_yearly)
 
+    # Výpočet procentuálního výskytu druhu a četnosti záznamů na jedno pozorování
+    if selected_species != "vyber" and selected_species.strip():
+        total_observations = data_info["n_rows"]
+        species_observations = int(species_cube(cube, selected_species)["Pozorování"].sum())
+        if total_observations > 0 and species_observations > 0:
+            species_percentage = (species_observations / total_observations) * 100
+            st.markdown(f"""
+        <div style='font-size: 25px; font-weight: bold;'>
 
+        </div>
+        <div style='font-size: 25px; font-weight: bold;'>
+            1 z {total_observations // species_observations} pozorování je {selected_species}.
+        </div>
+        """, unsafe_allow_html=True)
 
 
-# ========================
-# Mapa s body pozorování (MarkerCluster)
-# ========================
 
-#if show_map_markers:
-#    if not filtered_data.empty and COL_LAT in filtered_data.columns and COL_LNG in filtered_data.columns:
-#        # Střed mapy podle průměrné polohy
-#        map_center = [
-#            filtered_data[COL_LAT].mean(),
-#            filtered_data[COL_LNG].mean()
-#        ]
-#    else:
-#        # Fallback: střed ČR
-#        map_center = [49.40099, 15.67521]
-#
-#    m = folium.Map(location=map_center, zoom_start=8.2)
-#
-#    if not filtered_data.empty:
-#        from folium.plugins import MarkerCluster
-#        marker_cluster = MarkerCluster().add_to(m)
-#        for _, row in filtered_data.dropna(subset=[COL_LAT, COL_LNG]).iterrows():
-#            # Popisek v bublině
-#            popup_text = ""
-#            if "Místo pozorování" in row and row["Místo pozorování"]:
-#                popup_text += f"{row['Místo pozorování']}<br>"
-#            if COL_COUNT in row and not pd.isna(row[COL_COUNT]):
-#                popup_text += f"Počet: {row[COL_COUNT]}"
-#            folium.Marker(
-#                location=[row[COL_LAT], row[COL_LNG]],
-#                popup=popup_text,
-#            ).add_to(marker_cluster)
-#
-#        st.write("### Mapa pozorování (body)")
-#        folium_static(m)
-#    else:
-#        st.info("Pro zobrazení nahoře vyberte druh.")
 
-# ========================
-# Heatmapa pozorování
-# ========================
-if show_map_heat:
-    if not filtered_data.empty and COL_LAT in filtered_data.columns and COL_LNG in filtered_data.columns:
-        map_center = [
-            filtered_data[COL_LAT].mean(),
-            filtered_data[COL_LNG].mean()
-        ]
-    else:
-        map_center = [49.40099, 15.67521]
 
-    heat_map = folium.Map(location=map_center, zoom_start=8)
 
-    if not filtered_data.empty:
-        heat_df = filtered_data.dropna(subset=[COL_LAT, COL_LNG])
-        # Pokud máme i počty, můžeme je sečíst
-        if COL_COUNT in heat_df.columns:
-            heat_agg = heat_df.groupby([COL_LAT, COL_LNG])[COL_COUNT].sum().reset_index()
+    # ========================
+    # Graf: Počet pozorování vybraného druhu v jednotlivých letech
+    # ========================
+    if selected_species not in ["Vyber", ""]:
+        # Spočítáme pro vybraný druh z kostky
+        if COL_DATE in data_columns and COL_SPECIES in data_columns:
+            with profiler.stage("species_yearly_figure", rows_in=len(cube)):
+                fig_species_yearly = memo.get_or_compute(
+                    (dataset_key, "fig_species_yearly", selected_species),
+                    lambda: figure_species_yearly(cube, selected_species, years)
+                )
+
+            if show_bar_species_yearly:
+             #   st.write(f"### Počet pozorování druhu {selected_species} v jednotlivých letech")
+                with profiler.stage("species_yearly_render"):
+                    st.plotly_chart(fig_species_yearly)
+
+
+
+
+    # ========================
+    # Mapa s body pozorování (MarkerCluster)
+    # ========================
+
+    #if show_map_markers:
+    #    if not filtered_data.empty and COL_LAT in filtered_data.columns and COL_LNG in filtered_data.columns:
+    #        # Střed mapy podle průměrné polohy
+    #        map_center = [
+    #            filtered_data[COL_LAT].mean(),
+    #            filtered_data[COL_LNG].mean()
+    #        ]
+    #    else:
+    #        # Fallback: střed ČR
+    #        map_center = [49.40099, 15.67521]
+    #
+    #    m = folium.Map(location=map_center, zoom_start=8.2)
+    #
+    #    if not filtered_data.empty:
+    #        from folium.plugins import MarkerCluster
+    #        marker_cluster = MarkerCluster().add_to(m)
+    #        for _, row in filtered_data.dropna(subset=[COL_LAT, COL_LNG]).iterrows():
+    #            # Popisek v bublině
+    #            popup_text = ""
+    #            if "Místo pozorování" in row and row["Místo pozorování"]:
+    #                popup_text += f"{row['Místo pozorování']}<br>"
+    #            if COL_COUNT in row and not pd.isna(row[COL_COUNT]):
+    #                popup_text += f"Počet: {row[COL_COUNT]}"
+    #            folium.Marker(
+    #                location=[row[COL_LAT], row[COL_LNG]],
+    #                popup=popup_text,
+    #            ).add_to(marker_cluster)
+    #
+    #        st.write("### Mapa pozorování (body)")
+    #        folium_static(m)
+    #    else:
+    #        st.info("Pro zobrazení nahoře vyberte druh.")
+
+    # ========================
+    # Heatmapa pozorování
+    # ========================
+    if show_map_heat:
+        if not filtered_data.empty:
+            heat_period = st.radio(
+                "Heatmapa:", ["all", "month", "year"], horizontal=True,
+                format_func={"all": "Celé období", "month": "Animace po měsících", "year": "Animace po letech"}.get,
+            )
+            # Hotové HTML mapy si pamatujeme pro aktuální výběr (viz heatmap_html). Animace se skládá
+            # z předpočítaných buněk (viz HeatmapFrames) a snímky přepíná až prohlížeč, bez nového běhu skriptu.
+            if heat_period == "all":
+                with profiler.stage("heatmap_build", rows_in=len(filtered_data)):
+                    heat_html = memo.get_or_compute(memo_key("heatmap"), lambda: heatmap_html(filtered_data))
+            else:
+                with profiler.stage("heatmap_animation_build"):
+                    heat_html = memo.get_or_compute(memo_key(f"heatmap_{heat_period}"), lambda: heatmap_animation_html(
+                        dataset.heatmap_frames(selected_species, date_from, date_to, heat_period)
+                    ))
+
+            st.write("### Mapa pozorování")
+            with profiler.stage("heatmap_render"):
+                components.html(heat_html, height=510, width=700)
         else:
-            # Pokud nemáme počty, dáme "1" za každé pozorování
-            heat_df["pocty"] = 1
-            heat_agg = heat_df.groupby([COL_LAT, COL_LNG])["pocty"].sum().reset_index()
-
-        heat_data = heat_agg.values.tolist()
-        HeatMap(heat_data, radius=10).add_to(heat_map)
-
-        st.write("### Mapa pozorování")
-        folium_static(heat_map)
-    else:
-        st.info("Pro zobrazení nahoře vyberte druh.")
+            st.info("Pro zobrazení nahoře vyberte druh.")
 
 
 
-# ========================
-# Grafy podle měsíců
-# ========================
-if not filtered_data.empty and COL_DATE in filtered_data.columns and COL_DATE2 in filtered_data.columns:
-    # Filtrovat pouze záznamy, kde COL_DATE a COL_DATE2 jsou ve stejném měsíci
-    filtered_data = filtered_data[
-        (filtered_data[COL_DATE].dt.month == filtered_data[COL_DATE2].dt.month) &
-        (filtered_data[COL_DATE].dt.year == filtered_data[COL_DATE2].dt.year)
-    ]
-
-    if not filtered_data.empty:  # Zkontrolujeme, zda po filtraci nejsou data prázdná
-        # Přidáme textový název měsíce
-        filtered_data["Měsíc"] = filtered_data[COL_DATE].dt.month.map({
-            1: "Leden", 2: "Únor", 3: "Březen", 4: "Duben", 5: "Květen", 6: "Červen",
-            7: "Červenec", 8: "Srpen", 9: "Září", 10: "Říjen", 11: "Listopad", 12: "Prosinec"
-        })
-
-        # Spočítáme počty pozorování a jedinců
-        group_dict = {COL_DATE: "count"}
-        if COL_COUNT in filtered_data.columns:
-            group_dict[COL_COUNT] = "sum"
-
-        monthly_counts = filtered_data.groupby("Měsíc").agg(group_dict).reset_index()
-
-        # Přejmenujeme sloupce
-        monthly_counts.rename(columns={
-            COL_DATE: "Počet pozorování",
-            COL_COUNT: "Počet jedinců" if COL_COUNT in filtered_data.columns else "Počet jedinců (není ve sloupci)"
-        }, inplace=True)
-
-        # Vytvoříme rámec se všemi měsíci (pro správné seřazení a zobrazení i tam, kde jsou 0)
-        all_months_df = pd.DataFrame({
-            "Měsíc": [
-                "Leden", "Únor", "Březen", "Duben", "Květen", "Červen",
-                "Červenec", "Srpen", "Září", "Říjen", "Listopad", "Prosinec"
-            ]
-        })
-
-        # Sloučíme a vyplníme nuly
-        monthly_counts = all_months_df.merge(monthly_counts, on="Měsíc", how="left").fillna(0)
-        monthly_counts["Počet pozorování"] = monthly_counts["Počet pozorování"].astype(int)
-        if "Počet jedinců" in monthly_counts.columns:
-            monthly_counts["Počet jedinců"] = monthly_counts["Počet jedinců"].astype(int)
-
-        # GRAF: Počet pozorování podle měsíců
-        if show_bar_monthly_obs:
-            fig_monthly_obs = px.bar(
-                monthly_counts,
-                x="Měsíc",
-                y="Počet pozorování",
-                title="Počet pozorování podle měsíců"
+    # ========================
+    # Grafy podle měsíců
+    # ========================
+    # Vícedenní záznamy (Datum..Datum2) se rozloží do všech dní, které pokrývají (viz phenology_histogram),
+    # měsíce v rozsahu po celých měsících se berou z předpočítané tabulky
+    if show_bar_monthly_obs and not filtered_data.empty and COL_DATE in filtered_data.columns:
+        phenology_unit = st.radio(
+            "Fenologie podle:", list(PHENOLOGY_TITLES), horizontal=True,
+            format_func={"month": "Měsíce", "week": "Týdny", "day": "Dny v roce"}.get,
+        )
+        with profiler.stage("monthly_counts", rows_in=len(filtered_data)):
+            monthly_counts = memo.get_or_compute(memo_key(f"phenology_{phenology_unit}"), lambda: dataset.phenology(
+                selected_species, date_from, date_to, phenology_unit
+            ))
+
+        # GRAF: Počet pozorování podle měsíců (týdnů, dnů v roce)
+        with profiler.stage("monthly_figure"):
+            fig_monthly_obs = memo.get_or_compute(
+                memo_key(f"fig_monthly_{phenology_unit}"), lambda: figure_monthly(monthly_counts, phenology_unit)
             )
-
-            # Nastavení celočíselné hodnoty na ose Y:
-            fig_monthly_obs.update_yaxes(dtick=max(1, monthly_counts["Počet pozorování"].max() // 5))
-#            st.write("### Počet pozorování podle měsíců")
+    #    st.write("### Počet pozorování podle měsíců")
+        with profiler.stage("monthly_render"):
             st.plotly_chart(fig_monthly_obs)
 
         # (Případně druhý graf pro Počet jedinců)
@@ -517,78 +759,80 @@ if not filtered_data.empty and COL_DATE in filtered_data.columns and COL_DATE2 i
         #     title="Počet jedinců podle měsíců"
         # )
         # st.plotly_chart(fig_monthly_counts)
-    else:
-        st.info("Žádná data po filtrování pro vykreslení grafu.")
-
-# ========================
-# Výpis tabulky s HTML odkazem + STRÁNKOVÁNÍ (100 záznamů na stránku)
-# ========================
-# Toto je verze, která NEpoužívá st.experimental_rerun.
-# Místo toho využívá on_click funkci, která ihned mění session_state a překreslí aplikaci.
-# Tlačítko "Načíst další" je umístěno dole pod tabulkou.
-# Pokud je záznamů méně nebo rovno 300, tlačítko se nezobrazí.
-
-if selected_species != "Vyber":
-    st.write(f"### Pozorování druhu: {selected_species}")
-
-if not filtered_data.empty:
-    # Kopie jen pro úpravu zobrazení
-    filtered_data_display = filtered_data.copy()
-
-    # Zkracování textu
-    if "Místo pozorování" in filtered_data_display.columns:
-        filtered_data_display["Místo pozorování"] = filtered_data_display["Místo pozorování"].apply(
-            lambda x: (x[:50] + "...") if isinstance(x, str) and len(x) > 50 else x
-        )
-    if "Pozorovatel" in filtered_data_display.columns:
-        filtered_data_display["Pozorovatel"] = filtered_data_display["Pozorovatel"].apply(
-            lambda x: (x[:50] + "...") if isinstance(x, str) and len(x) > 50 else x
-        )
-    if "Datum" in filtered_data_display.columns:
-        filtered_data_display["Datum"] = filtered_data_display["Datum"].apply(
-            lambda x: x.strftime('%d. %m. %Y') if pd.notna(x) else ''
-        )
 
-    # Počet řádků na jednu dávku
-    page_size = 300
+    # ========================
+    # Výpis tabulky s HTML odkazem + STRÁNKOVÁNÍ (100 záznamů na stránku)
+    # ========================
+    # Toto je verze, která NEpoužívá st.experimental_rerun.
+    # Místo toho využívá on_click funkci, která ihned mění session_state a překreslí aplikaci.
+    # Tlačítko "Načíst další" je umístěno dole pod tabulkou.
+    # Pokud je záznamů méně nebo rovno 300, tlačítko se nezobrazí.
 
-    # Pokud není v session_state rows_loaded, inicializujeme na 300
-    if "rows_loaded" not in st.session_state:
-        st.session_state.rows_loaded = page_size
+    if selected_species != "Vyber":
+        st.write(f"### Pozorování druhu: {selected_species}")
 
-    total_rows = len(filtered_data_display)
-
-    # Omezený dataframe
-    limited_data = filtered_data_display.iloc[:st.session_state.rows_loaded]
-
-    # Vybereme sloupce k zobrazení
-    columns_to_show = []
-    for col in ["Datum", "Počet", "Místo pozorování", "Město", "Kvadrát", "Pozorovatel", "Odkaz"]:
-        if col in limited_data.columns:
-            columns_to_show.append(col)
+    if not filtered_data.empty:
+        # Počet řádků na jednu dávku
+        page_size = 300
+
+        # Pokud není v session_state rows_loaded, inicializujeme na 300
+        if "rows_loaded" not in st.session_state:
+            st.session_state.rows_loaded = page_size
+
+        total_rows = len(filtered_data)
+
+        # Vykreslené stránky si pamatujeme pro aktuální data a výběr; při jiných začínáme znovu
+        table_key = (dataset_key, selected_species, date_from, date_to, total_rows)
+        if st.session_state.get("table_key") != table_key:
+            st.session_state.table_key = table_key
+            st.session_state.table_pages = []
+
+        # Naformátujeme a vykreslíme jen stránky, které ještě nemáme
+        pages = st.session_state.table_pages
+        rows_to_show = min(st.session_state.rows_loaded, total_rows)
+        with profiler.stage("table_format", rows_in=total_rows) as record:
+            formatted_rows = min(len(pages) * page_size, total_rows)
+            while len(pages) * page_size < rows_to_show:
+                start = len(pages) * page_size
+                page = filtered_data.iloc[start:start + page_size]
+                pages.append(table_rows_html(format_table_page(page)))
+            # Počet nově naformátovaných řádků (dříve vykreslené stránky se berou ze session_state)
+            record["rows_out"] = min(len(pages) * page_size, total_rows) - formatted_rows
+
+        # Vybereme sloupce k zobrazení
+        columns_to_show = [col for col in TABLE_COLUMNS if col in filtered_data.columns]
+
+        # Vykreslíme tabulku
+        with profiler.stage("table_render", rows_in=rows_to_show):
+            st.write(
+                table_html(columns_to_show, "".join(pages[:math.ceil(rows_to_show / page_size)])),
+                unsafe_allow_html=True
+            )
 
-    # Vykreslíme tabulku
-    st.write(
-        limited_data[columns_to_show].to_html(index=False, escape=False),
-        unsafe_allow_html=True
-    )
+        # Funkce pro "načíst další"
+        def load_more():
+            st.session_state.rows_loaded += page_size
+
+        # Podle situace buď zobrazíme tlačítko, nebo info
+        if total_rows <= page_size:
+            # Pokud je celkový počet záznamů menší nebo roven 300, nic nenačítáme
+            st.info("Zobrazeny všechny záznamy.")
+        elif st.session_state.rows_loaded < total_rows:
+            # Pokud je co načíst
+            btn_col_left, btn_col_mid, btn_col_right = st.columns([2,1,2])
+            with btn_col_mid:
+                st.button("Načíst další záznamy", on_click=load_more)
+        else:
+            # Jinak zobrazíme info, že jsme vyčerpali všechny záznamy
+            st.info("Zobrazeny všechny záznamy.")
 
-    # Funkce pro "načíst další"
-    def load_more():
-        st.session_state.rows_loaded += page_size
-
-    # Podle situace buď zobrazíme tlačítko, nebo info
-    if total_rows <= page_size:
-        # Pokud je celkový počet záznamů menší nebo roven 300, nic nenačítáme
-        st.info("Zobrazeny všechny záznamy.")
-    elif st.session_state.rows_loaded < total_rows:
-        # Pokud je co načíst
-        btn_col_left, btn_col_mid, btn_col_right = st.columns([2,1,2])
-        with btn_col_mid:
-            st.button("Načíst další záznamy", on_click=load_more)
     else:
-        # Jinak zobrazíme info, že jsme vyčerpali všechny záznamy
-        st.info("Zobrazeny všechny záznamy.")
+        st.info("Pro zobrazení nahoře vyberte druh.")
 
-else:
-    st.info("Pro zobrazení nahoře vyberte druh.")
+    # ========================
+    # Ladění: měření fází (jen se zapnutým PROFILING)
+    # ========================
+    show_profile(selected_species)
+finally:
+    # tracemalloc spuštěný profilerem se vypne i po st.stop() nebo přerušeném překreslení
+    profiler.stop()
@@ -0,0 +1,508 @@
+"""
+Benchmark zpracování dat aplikace na syntetických exportech z NDOP.
+
+Vygeneruje CSV ve tvaru exportu z NDOP (stejné názvy sloupců jako CONFIG, realistický
+počet druhů, lokalit a pozorovatelů, kódování cp1250 nebo utf-8-sig) a pro každý
+soubor změří čas, změnu a špičku paměti jednotlivých fází (viz StageProfiler): parsování CSV, převod dat,
+transformace souřadnic, příprava, filtrování, agregace, heatmapa a tabulka.
+Výsledky se uloží jako JSON, aby šly porovnat mezi verzemi:
+
+    python benchmark.py --rows 100k 1M --output before.json
+    python benchmark.py --rows 100k 1M --output after.json --compare before.json
+    python benchmark.py --rows 1M --parts 1 8 --workers 4   # export rozdělený do 8 souborů
+
+Každý běh (velikost × kódování × backend) se spouští v samostatném procesu,
+aby se špička paměti procesu (RSS) neovlivňovala mezi běhy. Měření alokací přes
+tracemalloc časy fází prodlužuje (hlavně parsování CSV), proto se porovnávají
+jen běhy se stejným nastavením --no-memory. U exportu po částech (--parts) běží
+příprava částí v pracovních procesech, jejich paměť se proto do měření nezapočítá.
+"""
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import subprocess
+import platform
+import argparse
+import json
+import sys
+import os
+
+from ndop_data import (
+    CONFIG, INGEST, EXPORT_PARTS, DATE_COLUMNS, COORD_CACHE_SUFFIX, CUBE_SUFFIX, STORE_SUFFIX, ROWS_SUFFIX, OCCUPANCY_SUFFIX,
+    PHENOLOGY_SUFFIX, OBSERVERS_SUFFIX, frames_suffix,
+    Dataset, load_data, source_files, source_stat, read_csv_typed, parse_dates, transform_coordinates, prepare_frame, sort_observations,
+    snapshot_path, source_fingerprint, write_snapshot, build_cube, build_store, build_phenology, build_observer_counts,
+    bin_heatmap_points, heatmap_html, build_heatmap_frames, heatmap_animation_html, format_table_page, table_rows_html,
+    table_html, TABLE_COLUMNS, frame_memory_mb, StageProfiler,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ========================
+# Konfigurace syntetických dat:
+# ========================
+
+SYNTHETIC = {
+    # Počet druhů v exportu (četnosti druhů mají Zipfovo rozdělení, jako ve skutečných datech):
+    'species': 2500,
+    # Počet lokalit na milion řádků (nejvýše max_localities):
+    'localities_per_million': 60_000,
+    'max_localities': 400_000,
+    # Počet pozorovatelů a katastrů:
+    'observers': 8000,
+    'cities': 6000,
+    # Rozsah dat pozorování:
+    'date_from': '2000-01-01',
+    'date_to': '2024-12-31',
+    # Podíl záznamů s intervalem Datum-Datum2 (jinak stejný den) a bez počtu jedinců:
+    'interval_share': 0.15,
+    'missing_count_share': 0.1,
+    # Počet řádků generovaných najednou (zápis CSV po dávkách):
+    'chunk_rows': 500_000,
+}
+
+# Slabiky pro české názvy druhů, lokalit a obcí (včetně diakritiky kvůli kódování cp1250)
+GENUS = ["Čáp", "Ťuhýk", "Žluva", "Sýkora", "Pěnice", "Střízlík", "Skřivan", "Rákosník", "Čolek", "Ještěrka",
+         "Kuňka", "Vážka", "Střevlík", "Modrásek", "Bělopásek", "Šídlo", "Hřib", "Vstavač", "Netopýr", "Ježek"]
+EPITHET = ["obecný", "černý", "bílý", "horský", "lesní", "polní", "říční", "luční", "skalní", "zelený",
+           "šedý", "žlutohlavý", "rudohlavý", "menší", "větší", "bahenní", "zahradní", "východní", "severní", "tečkovaný"]
+PLACE = ["Dolní", "Horní", "Nové", "Staré", "Velké", "Malé", "Lhota", "Újezd", "Žďár", "Třebíč",
+         "Hradiště", "Čermná", "Kostelec", "Ústí", "Lužnice", "Březí", "Chlum", "Dvůr", "Pláně", "Rybník"]
+NAMES = ["Jan", "Petr", "Jiří", "Tomáš", "Lucie", "Tereza", "Martin", "Hana", "Kateřina", "Václav"]
+SURNAMES = ["Novák", "Svoboda", "Dvořák", "Černý", "Procházka", "Kučera", "Veselý", "Horák", "Němec", "Růžička"]
+
+# Rozsah souřadnic ČR v EPSG:5514 (S-JTSK, záporné hodnoty)
+X_RANGE = (-905_000, -430_000)
+Y_RANGE = (-1_230_000, -935_000)
+
+ENCODINGS = ["utf-8-sig", "cp1250"]
+ENGINES = ["pandas", "duckdb"]
+
+
+def parse_rows(text: str) -> int:
+    """Počet řádků z textu: 100000, 100k, 1M, 10M."""
+    units = {"k": 1_000, "m": 1_000_000}
+    text = text.strip().lower().replace("_", "")
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def format_rows(n_rows: int) -> str:
+    """Zkrácený zápis počtu řádků pro názvy souborů (100k, 1M)."""
+    if n_rows % 1_000_000 == 0:
+        return f"{n_rows // 1_000_000}M"
+    if n_rows % 1_000 == 0:
+        return f"{n_rows // 1_000}k"
+    return str(n_rows)
+
+
+# ========================
+# Generátor syntetického exportu
+# ========================
+def combine_names(rng, size: int, first, second) -> np.ndarray:
+    """Pole size různých názvů složených z dvojic slov (s pořadovým číslem, pokud dvojice nestačí)."""
+    pairs = np.array([f"{a} {b}" for a in first for b in second], dtype=object)
+    position = np.arange(size)
+    names = pairs[position % len(pairs)]
+    rounds = position // len(pairs)
+    names = np.where(rounds == 0, names, names + " " + rounds.astype(str).astype(object))
+    return rng.permutation(names)
+
+
+def synthetic_tables(n_rows: int, seed: int = 0) -> dict:
+    """Číselníky pro generátor: druhy a jejich četnosti, lokality (souřadnice, kvadrát, obec), pozorovatelé."""
+    rng = np.random.default_rng(seed)
+    n_localities = min(SYNTHETIC['max_localities'], max(1000, n_rows * SYNTHETIC['localities_per_million'] // 1_000_000))
+
+    species = combine_names(rng, SYNTHETIC['species'], GENUS, EPITHET)
+    weights = 1.0 / np.arange(1, len(species) + 1) ** 1.1
+    species_p = weights / weights.sum()
+
+    cities = combine_names(rng, SYNTHETIC['cities'], PLACE, PLACE + GENUS)
+    observers = combine_names(rng, SYNTHETIC['observers'], SURNAMES, NAMES)
+
+    # Lokality se shlukují kolem obcí; kvadrát (mapovací síť KFME) se odvodí ze souřadnic
+    city_x = rng.uniform(*X_RANGE, len(cities))
+    city_y = rng.uniform(*Y_RANGE, len(cities))
+    locality_city = rng.integers(0, len(cities), n_localities)
+    x = np.clip(city_x[locality_city] + rng.normal(0, 3000, n_localities), *X_RANGE).round(2)
+    y = np.clip(city_y[locality_city] + rng.normal(0, 3000, n_localities), *Y_RANGE).round(2)
+    kvadrat_col = 50 + ((x - X_RANGE[0]) / (X_RANGE[1] - X_RANGE[0]) * 30).astype(int)
+    kvadrat_row = 63 - ((y - Y_RANGE[0]) / (Y_RANGE[1] - Y_RANGE[0]) * 9).astype(int)
+    kvadrat = (kvadrat_row * 100 + kvadrat_col).astype(str).astype(object)
+    locality_names = cities[locality_city] + ", lokalita " + np.arange(n_localities).astype(str).astype(object)
+
+    return {
+        "species": species,
+        "species_p": species_p,
+        "cities": cities,
+        "observers": observers,
+        "locality_city": locality_city,
+        "locality_names": locality_names,
+        "x": x,
+        "y": y,
+        "kvadrat": kvadrat,
+    }
+
+
+def synthetic_chunk(tables: dict, start_id: int, n_rows: int, rng) -> pd.DataFrame:
+    """Jedna dávka řádků exportu se sloupci podle CONFIG (a několika navíc, které aplikace nečte)."""
+    day_from = np.datetime64(SYNTHETIC['date_from'])
+    n_days = (np.datetime64(SYNTHETIC['date_to']) - day_from).astype(int)
+    # Víc pozorování v posledních letech (roste počet uživatelů NDOP)
+    offsets = (n_days * np.sqrt(rng.random(n_rows))).astype(int)
+    date_from = day_from + offsets
+    interval = np.where(rng.random(n_rows) < SYNTHETIC['interval_share'], rng.integers(1, 90, n_rows), 0)
+    date_to = np.minimum(date_from + interval, np.datetime64(SYNTHETIC['date_to']))
+
+    species = rng.choice(len(tables["species"]), n_rows, p=tables["species_p"])
+    locality = rng.integers(0, len(tables["x"]), n_rows)
+    counts = pd.array(rng.geometric(0.3, n_rows), dtype="Int64")
+    counts[rng.random(n_rows) < SYNTHETIC['missing_count_share']] = pd.NA
+
+    return pd.DataFrame({
+        CONFIG['col_link']: np.arange(start_id, start_id + n_rows),
+        CONFIG['col_date']: yyyymmdd(date_from),
+        CONFIG['col_date2']: yyyymmdd(date_to),
+        CONFIG['col_species']: tables["species"][species],
+        CONFIG['col_observer']: tables["observers"][rng.integers(0, len(tables["observers"]), n_rows)],
+        CONFIG['col_city']: tables["cities"][tables["locality_city"][locality]],
+        CONFIG['col_location_name']: tables["locality_names"][locality],
+        CONFIG['col_count']: counts,
+        CONFIG['col_kvadrat']: tables["kvadrat"][locality],
+        CONFIG['col_lng']: tables["x"][locality],
+        CONFIG['col_lat']: tables["y"][locality],
+        "CXLOKAL_PRESNOST": rng.choice([1, 10, 100, 1000], n_rows),
+        "CXAKCE_POZNAMKA": np.where(rng.random(n_rows) < 0.2, "Pozorování při sčítání", ""),
+    })
+
+
+def yyyymmdd(dates: np.ndarray) -> np.ndarray:
+    """Data jako čísla YYYYMMDD (formát sloupců CXAKCE_DATI_OD/DO)."""
+    dates = pd.DatetimeIndex(dates)
+    return dates.year * 10000 + dates.month * 100 + dates.day
+
+
+def generate_export(path: str, n_rows: int, encoding: str, seed: int = 0) -> None:
+    """Zapíše syntetický export do path (středník, desetinná čárka, po dávkách)."""
+    tables = synthetic_tables(n_rows, seed)
+    rng = np.random.default_rng(seed + 1)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding=encoding, newline="") as f:
+        for start in range(0, n_rows, SYNTHETIC['chunk_rows']):
+            chunk = synthetic_chunk(tables, 1_000_000 + start, min(SYNTHETIC['chunk_rows'], n_rows - start), rng)
+            chunk.to_csv(f, sep=";", decimal=",", index=False, header=start == 0)
+    os.replace(tmp_path, path)
+
+
+def export_path(data_dir: str, n_rows: int, encoding: str) -> str:
+    """Cesta k syntetickému exportu dané velikosti a kódování (vygeneruje se, pokud chybí)."""
+    path = os.path.join(data_dir, f"ndop_{format_rows(n_rows)}_{encoding.replace('-', '')}.csv")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generuji {path} ...", file=sys.stderr)
+        generate_export(path, n_rows, encoding)
+    return path
+
+
+def split_export(file_path: str, n_parts: int) -> str:
+    """
+    Rozdělí export na n_parts souborů se stejnou hlavičkou (jako export po regionech
+    a letech) do adresáře vedle něj; vrátí cestu k adresáři (vytvoří se, pokud chybí).
+    """
+    dir_path = f"{os.path.splitext(file_path)[0]}_parts{n_parts}"
+    if os.path.isdir(dir_path):
+        return dir_path
+    print(f"Rozděluji {file_path} do {dir_path} ...", file=sys.stderr)
+    with open(file_path, "rb") as f:
+        n_lines = sum(1 for _ in f) - 1
+    tmp_dir = f"{dir_path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir)
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        for part in range(n_parts):
+            with open(os.path.join(tmp_dir, f"part-{part:03d}.csv"), "wb") as out:
+                out.write(header)
+                for _ in range(n_lines * (part + 1) // n_parts - n_lines * part // n_parts):
+                    out.write(f.readline())
+    os.replace(tmp_dir, dir_path)
+    return dir_path
+
+
+def clear_caches(file_path: str) -> None:
+    """Smaže snapshoty, cache souřadnic, kostku a DuckDB úložiště, aby se měřil studený start."""
+    paths = [file_path] + (source_files(file_path) if os.path.isdir(file_path) else [])
+    for source in paths:
+        for suffix in [".parquet", COORD_CACHE_SUFFIX, CUBE_SUFFIX, ROWS_SUFFIX, OCCUPANCY_SUFFIX, PHENOLOGY_SUFFIX, OBSERVERS_SUFFIX, frames_suffix(), STORE_SUFFIX]:
+            path = snapshot_path(source, suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# ========================
+# Měření fází
+# ========================
+def peak_rss_mb() -> float:
+    """Dosavadní špička paměti procesu (RSS) v MB, nebo None, pokud ji systém neposkytuje."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
+
+
+def ingest_pandas(timer: StageProfiler, file_path: str) -> None:
+    """Studený start pandas backendu po fázích (stejné kroky jako prepare_data a load_data)."""
+    fingerprint = source_fingerprint(file_path)
+    df, _ = timer.run("csv_parse", read_csv_typed, file_path, convert_dates=False)
+
+    def convert_dates():
+        for col in [CONFIG[key] for key in DATE_COLUMNS if CONFIG[key] in df.columns]:
+            df[col] = parse_dates(df[col])
+    timer.run("date_parse", convert_dates)
+
+    # Transformace souřadnic se měří zvlášť; prepare_frame pak čte výsledky z cache souřadnic
+    x = pd.to_numeric(df[CONFIG['col_lng']], errors="coerce").values
+    y = pd.to_numeric(df[CONFIG['col_lat']], errors="coerce").values
+    timer.run("coordinate_transform", transform_coordinates, x, y, file_path)
+
+    df = timer.run("prepare", lambda: sort_observations(prepare_frame(df, file_path)))
+    timer.run("snapshot_write", write_snapshot, df, file_path, fingerprint)
+    cube = timer.run("cube_build", build_cube, df)
+    write_snapshot(cube, file_path, fingerprint, CUBE_SUFFIX)
+    phenology = timer.run("phenology_build", build_phenology, df)
+    write_snapshot(phenology, file_path, fingerprint, PHENOLOGY_SUFFIX)
+    observers = timer.run("observers_build", build_observer_counts, df)
+    write_snapshot(observers, file_path, fingerprint, OBSERVERS_SUFFIX)
+    frames = timer.run("frames_build", build_heatmap_frames, df)
+    write_snapshot(frames, file_path, fingerprint, frames_suffix())
+
+
+def ingest_parts(timer: StageProfiler, dir_path: str) -> None:
+    """Studený start exportu po částech: souběžná příprava souborů a jejich spojení (viz load_export_parts)."""
+    fingerprint = source_fingerprint(dir_path)
+    df = timer.run("parts_load", load_data, dir_path)
+    cube = timer.run("cube_build", build_cube, df)
+    write_snapshot(cube, dir_path, fingerprint, CUBE_SUFFIX)
+    phenology = timer.run("phenology_build", build_phenology, df)
+    write_snapshot(phenology, dir_path, fingerprint, PHENOLOGY_SUFFIX)
+    observers = timer.run("observers_build", build_observer_counts, df)
+    write_snapshot(observers, dir_path, fingerprint, OBSERVERS_SUFFIX)
+    frames = timer.run("frames_build", build_heatmap_frames, df)
+    write_snapshot(frames, dir_path, fingerprint, frames_suffix())
+
+
+def ingest_duckdb(timer: StageProfiler, file_path: str) -> None:
+    """Studený start DuckDB backendu: sestavení úložiště."""
+    timer.run("store_build", build_store, file_path, snapshot_path(file_path, STORE_SUFFIX))
+
+
+def run_queries(timer: StageProfiler, dataset: Dataset) -> None:
+    """Dotazy, které aplikace spouští při výběru druhu (nejčastější druh = nejhorší případ)."""
+    info = dataset.info
+    species = dataset.cube.groupby("Druh", observed=True)["Pozorování"].sum().idxmax()
+    year_from = datetime(info["date_max"].year, 1, 1).date()
+    year_to = datetime(info["date_max"].year, 12, 31).date()
+    # Rozsah, který nezačíná ani nekončí na hranici měsíce (fenologie se nevezme z předpočítané tabulky)
+    mid_from = info["date_min"] + timedelta(days=45)
+    mid_to = info["date_max"] - timedelta(days=45)
+
+    data = timer.run("filter_all_years", dataset.select, species, info["date_min"], info["date_max"])
+    timer.run("filter_one_year", dataset.select, species, year_from, year_to)
+    timer.run("agg_species_by_year", dataset.species_count_by_year)
+    timer.run("agg_species_yearly", dataset.species_yearly_counts, species)
+    timer.run("trends_ranking", dataset.trends.ranking)
+    timer.run("agg_monthly_aligned", dataset.phenology, species, info["date_min"], info["date_max"])
+    timer.run("agg_monthly_unaligned", dataset.phenology, species, mid_from, mid_to)
+    timer.run("agg_weekly", dataset.phenology, species, mid_from, mid_to, "week")
+    timer.run("agg_day_of_year", dataset.phenology, species, mid_from, mid_to, "day")
+    lat, lng = data["Zeměpisná šířka"].median(), data["Zeměpisná délka"].median()
+    timer.run("area_radius", dataset.select_radius, lat, lng, 5, info["date_min"], info["date_max"])
+    timer.run("heatmap_bin", bin_heatmap_points, data)
+    timer.run("heatmap_render", heatmap_html, data)
+    frames = timer.run("heatmap_frames", dataset.heatmap_frames, species, info["date_min"], info["date_max"])
+    timer.run("heatmap_animation_render", heatmap_animation_html, frames)
+
+    def render_table():
+        page = format_table_page(data.iloc[:300])
+        columns = [col for col in TABLE_COLUMNS if col in data.columns]
+        return table_html(columns, table_rows_html(page))
+    timer.run("table_render", render_table)
+
+
+def run_case(file_path: str, n_rows: int, encoding: str, engine: str, trace_memory: bool,
+             parts: int = 1, workers: int = None) -> dict:
+    """Jeden běh benchmarku (volá se v samostatném procesu)."""
+    INGEST['encoding'] = encoding
+    EXPORT_PARTS['workers'] = workers
+    clear_caches(file_path)
+    timer = StageProfiler(trace_memory=trace_memory)
+    try:
+        if os.path.isdir(file_path):
+            ingest_parts(timer, file_path)
+        elif engine == "duckdb":
+            ingest_duckdb(timer, file_path)
+        else:
+            ingest_pandas(timer, file_path)
+        # Teplý start: to, co aplikace dělá při každém dalším spuštění (snapshot/úložiště + kostka + index)
+        dataset = timer.run("dataset_load_warm", Dataset, file_path, engine)
+        run_queries(timer, dataset)
+    finally:
+        timer.stop()
+        clear_caches(file_path)
+
+    return {
+        "rows": n_rows,
+        "encoding": encoding,
+        "engine": engine,
+        "trace_memory": trace_memory,
+        "parts": parts,
+        "workers": workers or os.cpu_count(),
+        "file_mb": round(source_stat(file_path)[0] / 2**20, 1),
+        "frame_mb": round(frame_memory_mb(dataset.df), 1) if dataset.df is not None else None,
+        "total_seconds": timer.total_seconds(),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.records,
+    }
+
+
+# ========================
+# Porovnání s předchozím během
+# ========================
+def case_key(result: dict):
+    """Klíč běhu pro porovnání (velikost, kódování, backend, měření alokací, počet částí)."""
+    return result["rows"], result["encoding"], result["engine"], result["trace_memory"], result.get("parts", 1)
+
+
+def compare_results(current: dict, baseline: dict, threshold: float, min_seconds: float = 0.05):
+    """
+    Porovná časy fází s předchozím během. Vrací seznam zpomalení (fáze, které trvají
+    víc než threshold× déle a zároveň aspoň min_seconds, aby šum krátkých fází nevadil).
+    """
+    baseline_cases = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        previous = baseline_cases.get(case_key(result))
+        if previous is None:
+            continue
+        previous_stages = {stage["stage"]: stage for stage in previous["stages"]}
+        for stage in result["stages"]:
+            old = previous_stages.get(stage["stage"])
+            if old is None or stage["seconds"] < min_seconds:
+                continue
+            ratio = stage["seconds"] / max(old["seconds"], 1e-6)
+            if ratio > threshold:
+                regressions.append({
+                    "case": case_key(result),
+                    "stage": stage["stage"],
+                    "before": old["seconds"],
+                    "after": stage["seconds"],
+                    "ratio": round(ratio, 2),
+                })
+    return regressions
+
+
+def git_commit():
+    """Zkrácený hash aktuálního commitu (None mimo git repozitář)."""
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def print_summary(results) -> None:
+    """Přehledná tabulka výsledků na stderr (JSON jde do souboru nebo na stdout)."""
+    for result in results:
+        parts = f" ({result['parts']} částí, {result['workers']} procesů)" if result.get("parts", 1) > 1 else ""
+        print(
+            f"\n{format_rows(result['rows'])} řádků{parts}, {result['encoding']}, {result['engine']}: "
+            f"{result['total_seconds']:.2f} s, špička RSS {result['peak_rss_mb']} MB",
+            file=sys.stderr,
+        )
+        for stage in result["stages"]:
+            delta = f"{stage['memory_delta_mb']:>+9.1f} MB" if "memory_delta_mb" in stage else ""
+            peak = f"{stage['peak_mb']:>9.1f} MB" if "peak_mb" in stage else ""
+            print(f"  {stage['stage']:<24}{stage['seconds']:>9.3f} s{delta}{peak}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark zpracování dat na syntetických exportech z NDOP.")
+    parser.add_argument("--rows", nargs="+", default=["100k", "1M"], help="velikosti exportu (např. 100k 1M 10M)")
+    parser.add_argument("--encoding", nargs="+", choices=ENCODINGS, default=ENCODINGS, help="kódování CSV")
+    parser.add_argument("--engine", nargs="+", choices=ENGINES, default=["pandas"], help="backend pro dotazy")
+    parser.add_argument("--parts", nargs="+", type=int, default=[1],
+                        help="na kolik souborů export rozdělit (1 = jeden soubor; jen backend pandas)")
+    parser.add_argument("--workers", type=int, help="počet procesů pro export po částech (výchozí počet jader)")
+    parser.add_argument("--data-dir", default="bench_data", help="adresář pro vygenerované exporty")
+    parser.add_argument("--no-memory", action="store_true", help="neměřit alokace přes tracemalloc (rychlejší)")
+    parser.add_argument("-o", "--output", help="výstupní JSON (výchozí standardní výstup)")
+    parser.add_argument("--compare", help="JSON z předchozího běhu pro porovnání")
+    parser.add_argument("--threshold", type=float, default=1.25, help="poměr času, od kterého se fáze hlásí jako zpomalení")
+    args = parser.parse_args(argv)
+
+    cases = []
+    for rows in args.rows:
+        n_rows = parse_rows(rows)
+        for encoding in args.encoding:
+            path = export_path(args.data_dir, n_rows, encoding)
+            for parts in args.parts:
+                if parts > 1:
+                    cases.append((split_export(path, parts), n_rows, encoding, "pandas", not args.no_memory, parts, args.workers))
+                else:
+                    cases.extend((path, n_rows, encoding, engine, not args.no_memory) for engine in args.engine)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        # ProcessPoolExecutor (na rozdíl od multiprocessing.Pool) smí spouštět další procesy (viz --parts)
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            results.append(pool.submit(run_case, *case).result())
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ingest": {key: value for key, value in INGEST.items() if key != "encoding"},
+            "commit": git_commit(),
+        },
+        "results": results,
+    }
+    print_summary(results)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_results(report, json.load(f), args.threshold)
+        for item in regressions:
+            rows, encoding, engine, _, parts = item["case"]
+            print(
+                f"ZPOMALENÍ {format_rows(rows)}/{encoding}/{engine}/{parts} {item['stage']}: "
+                f"{item['before']:.3f} s -> {item['after']:.3f} s ({item['ratio']}×)",
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2976 @@
+"""
+Datová vrstva aplikace: načtení a příprava CSV exportu z NDOP, snapshoty,
+agregační kostka, index druhů a dotazy nad daty - bez závislosti na Streamlitu.
+
+Modul lze použít ze skriptu nebo notebooku (třída Dataset), nebo z příkazové řádky:
+    python ndop_data.py uploaded_file.csv yearly
+    python ndop_data.py uploaded_file.csv monthly --species "Ledňáček říční" --date-from 2020-01-01
+    python ndop_data.py uploaded_file.csv area --lat 50.08 --lng 14.42 --radius 5   # druhy v okolí bodu
+    python ndop_data.py uploaded_file.csv heatmap --species "Ledňáček říční" --period year   # snímky animace
+    python ndop_data.py uploaded_file.csv yearly --export-dir exporty/   # převezme nejnovější export
+    python ndop_data.py uploaded_file.csv warm   # připraví snapshoty a kostku předem (při nasazení)
+    python ndop_data.py uploaded_file.csv ready --pid 1234   # sonda připravenosti serveru (návratový kód)
+"""
+import pandas as pd
+import numpy as np
+from pandas.api.types import union_categoricals
+from datetime import date, datetime, timedelta
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import fnmatch
+import tempfile
+from functools import partial
+import threading
+import tracemalloc
+
+# Pro transformaci souřadnic z EPSG:5514 na WGS84 (EPSG:4326)
+from pyproj import Transformer
+
+# -------------------------------------------------------------
+# KÓD S PODPOROU ENCODING CP1250
+# -------------------------------------------------------------
+#   1) Datum je ve formátu YYYYMMDD (parsováno přes %Y%m%d)
+#   2) Souřadnice EPSG:5514 -> WGS84
+#   3) Změna encodingu na cp1250 (místo utf-8-sig)
+#   4) Přidáno low_memory=False, abychom předešli DtypeWarning
+# -------------------------------------------------------------
+
+# ========================
+# Konfigurace sloupců:
+# ========================
+
+CONFIG = {
+    # Sloupec s datem od (YYYYMMDD):
+    'col_date': 'CXAKCE_DATI_OD',
+    # Sloupec s datem do (YYYYMMDD):
+    'col_date2': 'CXAKCE_DATI_DO',
+    # Sloupec s názvem druhu:
+    'col_species': 'CXTAXON_NAME_CZ',
+    # Sloupec s pozorovateli:
+    'col_observer': 'CXAKCE_AUTOR',
+    # Sloupec s názvem města/obce:
+    'col_city': 'CXKATASTR_NAZEV',
+    # Sloupec s názvem místa pozorování:
+    'col_location_name': 'CXLOKAL_NAZEV',
+    # Sloupec s minimálním počtem jedinců (pokud existuje):
+    'col_count_min': 'POCET',
+    # Sloupec s počtem (pokud existuje):
+    'col_count': 'POCET',
+    # Sloupec s odkazem (ID):
+    'col_link': 'ID_ND_NALEZ',
+    # Sloupec kvadrátem:
+    'col_kvadrat': 'CXLOKAL_KVADRAT_XY',
+    # Sloupec se souřadnicí X (EPSG:5514):
+    'col_lng': 'CXLOKAL_X',
+    # Sloupec se souřadnicí Y (EPSG:5514):
+    'col_lat': 'CXLOKAL_Y',
+    # Nepovinný sloupec s aktivitou (pokud CSV obsahuje):
+    'col_activity': 'Activity',
+}
+
+# ========================
+# Konfigurace načítání CSV:
+# ========================
+
+INGEST = {
+    # Načítat jen sloupce uvedené v CONFIG (ostatní sloupce exportu se přeskočí):
+    'only_config_columns': True,
+    # Počet řádků na jednu dávku při parsování CSV (None = celý soubor najednou):
+    'chunk_size': 1_000_000,
+    # Kódování CSV exportu ('utf-8-sig', starší exporty z NDOP 'cp1250'):
+    'encoding': 'utf-8-sig',
+}
+
+# ========================
+# Konfigurace načítání exportu rozděleného do více souborů:
+# ========================
+
+EXPORT_PARTS = {
+    # Pokud je místo CSV zadán adresář, načtou se z něj všechny soubory odpovídající masce
+    # (např. exporty rozdělené podle regionu a roku) a spojí se do jedněch dat:
+    'pattern': '*.csv',
+    # Počet procesů, které soubory připravují souběžně (None = počet jader procesoru):
+    'workers': None,
+}
+
+# ========================
+# Konfigurace backendu pro dotazy:
+# ========================
+
+BACKEND = {
+    # 'pandas' = celá data v paměti, 'duckdb' = dotazy nad diskovým úložištěm (vyžaduje balíček duckdb),
+    # 'auto' = duckdb pro CSV větší než duckdb_min_size_mb (pokud je duckdb nainstalované), jinak pandas
+    'engine': 'auto',
+    'duckdb_min_size_mb': 2048,
+}
+
+# ========================
+# Konfigurace heatmapy:
+# ========================
+
+HEATMAP = {
+    # Mřížka, do které se body před vykreslením sčítají:
+    #   'degrees' = čtverce o straně cell_size stupňů, 'kvadrat' = mapovací kvadráty (sloupec Kvadrát)
+    'grid': 'degrees',
+    # Velikost buňky ve stupních (0.01° ~ 1,1 km severojižně):
+    'cell_size': 0.01,
+    # Maximální počet bodů předaných do HeatMap (při překročení se mřížka zhrubne):
+    'max_points': 5000,
+    # Animovaná heatmapa (po měsících / letech): velikost buňky předpočítané mřížky ve stupních,
+    # nejvýše frame_max_cells nejsilnějších buněk na snímek a nejvýše frame_max_total bodů
+    # za celou animaci (při mnoha snímcích se limit na snímek úměrně sníží):
+    'frame_cell_size': 0.02,
+    'frame_max_cells': 1500,
+    'frame_max_total': 60000,
+}
+
+# ========================
+# Konfigurace prostorového indexu:
+# ========================
+
+SPATIAL = {
+    # Velikost buňky mřížky indexu ve stupních (0.02° ~ 2,2 km severojižně, ~1,4 km východozápadně);
+    # menší buňky = méně bodů navíc ke kontrole, ale více úseků na dotaz:
+    'cell_size': 0.02,
+}
+
+# ========================
+# Konfigurace měření fází (ladění výkonu):
+# ========================
+
+PROFILING = {
+    # Měřit čas, počty řádků a paměť jednotlivých fází při každém překreslení aplikace
+    # (lze zapnout i proměnnou prostředí NDOP_PROFILE=1):
+    'enabled': os.environ.get('NDOP_PROFILE', '') not in ('', '0'),
+    # Soubor, do kterého se výsledky připisují (jeden JSON na řádek; None = nezapisovat):
+    'log_file': 'ndop_profile.jsonl',
+    # Sledovat i špičku alokací přes tracemalloc (přesnější, ale výrazně zpomalí parsování CSV).
+    # tracemalloc je společný celému procesu, takže peak_mb má smysl jen při jednom sezení aplikace:
+    'trace_memory': False,
+}
+
+# ========================
+# Konfigurace načítání na pozadí:
+# ========================
+
+WARMUP = {
+    # Načíst a připravit data na pozadí hned po startu aplikace (uživatel mezitím vidí stav načítání):
+    'enabled': True,
+    # Soubor se stavem načítání ("loading", "ready", "error") a PID serveru pro sondu připravenosti
+    # při nasazení: python ndop_data.py uploaded_file.csv ready --pid <PID serveru> (None = nezapisovat):
+    'status_file': 'ndop_status.json',
+}
+
+# Textové sloupce s malým počtem unikátních hodnot -> pandas "category"
+CATEGORY_COLUMNS = ['col_species', 'col_observer', 'col_city', 'col_location_name', 'col_kvadrat', 'col_activity']
+# Datumové sloupce se čtou jako text a převádí se přes pd.to_datetime (formát YYYYMMDD)
+DATE_COLUMNS = ['col_date', 'col_date2']
+# Číselné sloupce (počty, souřadnice) se čtou jako float64 a zužují se až po přípravě
+FLOAT_COLUMNS = ['col_count_min', 'col_count', 'col_lng', 'col_lat']
+
+logger = logging.getLogger("ndop")
+
+
+class EmptyExportError(ValueError):
+    """CSV export je prázdný nebo ho nelze načíst."""
+
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """Skutečná paměťová stopa DataFrame v MB (včetně obsahu textových sloupců)."""
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Převede data ve formátu YYYYMMDD na datetime (neplatné hodnoty -> NaT)."""
+    return pd.to_datetime(values, format="%Y%m%d", errors="coerce")
+
+
+def iter_csv_chunks(file_path: str, convert_dates: bool = True):
+    """
+    Čte CSV s explicitními datovými typy (viz CATEGORY_COLUMNS, DATE_COLUMNS, FLOAT_COLUMNS),
+    volitelně jen sloupce z CONFIG a po dávkách INGEST['chunk_size'] řádků.
+    Textové sloupce se v každé dávce hned převedou na "category" a data na datetime,
+    takže v paměti nikdy neleží celý soubor jako Python řetězce.
+    Vrací generátor dvojic (dávka, paměť dávky v MB před převodem typů).
+    S convert_dates=False zůstanou data jako text (převod zvlášť přes parse_dates).
+    """
+    read_kwargs = dict(
+        delimiter=';',
+        decimal=',',  # <-- říká, že desetinný oddělovač je čárka
+        encoding=INGEST['encoding'],
+    )
+    header = pd.read_csv(file_path, nrows=0, **read_kwargs).columns
+
+    category_cols = [CONFIG[key] for key in CATEGORY_COLUMNS if CONFIG[key] in header]
+    dtype = {col: str for col in category_cols}
+    date_cols = [CONFIG[key] for key in DATE_COLUMNS if CONFIG[key] in header]
+    dtype.update({col: str for col in date_cols})
+    dtype.update({CONFIG[key]: "float64" for key in FLOAT_COLUMNS if CONFIG[key] in header})
+
+    usecols = None
+    if INGEST['only_config_columns']:
+        usecols = [col for col in header if col in set(CONFIG.values())]
+
+    reader = pd.read_csv(
+        file_path,
+        usecols=usecols,
+        dtype=dtype,
+        chunksize=INGEST['chunk_size'],
+        low_memory=False,    # Zamezení DtypeWarning
+        **read_kwargs
+    )
+    if INGEST['chunk_size'] is None:
+        reader = [reader]
+
+    for chunk in reader:
+        memory_before = frame_memory_mb(chunk)
+        for col in category_cols:
+            chunk[col] = chunk[col].fillna("").astype("category")
+        if convert_dates:
+            for col in date_cols:
+                chunk[col] = parse_dates(chunk[col])
+        yield chunk, memory_before
+
+
+def concat_chunks(chunks) -> pd.DataFrame:
+    """
+    Spojí dávky se stejnými sloupci do jednoho DataFrame. Dávky mají každá vlastní
+    slovník kategorií -> sjednotíme je, jinak by concat vrátil object.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    category_cols = [col for col in chunks[0].columns if isinstance(chunks[0][col].dtype, pd.CategoricalDtype)]
+    merged = {
+        col: union_categoricals([chunk[col] for chunk in chunks], ignore_order=True)
+        for col in category_cols
+    }
+    df = pd.concat([chunk.drop(columns=category_cols) for chunk in chunks], ignore_index=True)
+    for col in category_cols:
+        df[col] = merged[col]
+    return df[chunks[0].columns]
+
+
+def read_csv_typed(file_path: str, convert_dates: bool = True):
+    """
+    Načte celé CSV po dávkách (viz iter_csv_chunks) a spojí je do jednoho DataFrame.
+    Vrací (DataFrame, paměť v MB před převodem na category).
+    """
+    chunks = []
+    memory_before = 0.0
+    for chunk, chunk_memory in iter_csv_chunks(file_path, convert_dates):
+        memory_before += chunk_memory
+        chunks.append(chunk)
+
+    if not chunks:
+        return pd.DataFrame(), memory_before
+    return concat_chunks(chunks), memory_before
+
+
+def prepare_data(file_path: str) -> pd.DataFrame:
+    """
+    Načte a připraví data z CSV na základě sloupců definovaných v CONFIG.
+    Nově: encoding cp1250, explicitní datové typy a načítání po dávkách (viz INGEST)
+    """
+    try:
+        df, memory_before = read_csv_typed(file_path)
+    except pd.errors.EmptyDataError:
+        raise EmptyExportError("Soubor je prázdný nebo neplatný. Nahrajte prosím platný CSV soubor.") from None
+    if df.empty:
+        raise EmptyExportError("Nahraný soubor je prázdný. Nahrajte prosím platný CSV soubor.")
+
+    df = sort_observations(prepare_frame(df, file_path))
+
+    logger.info(
+        "Načteno %d řádků z %s: %.1f MB po parsování, %.1f MB po převodu typů",
+        len(df), file_path, memory_before, frame_memory_mb(df)
+    )
+
+    return df
+
+
+def sort_observations(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Seřadí záznamy podle druhu a data - výběr druhu a rozsahu dat pak stačí
+    dohledat binárním vyhledáváním (viz build_species_index). Index se resetuje.
+    """
+    if "Druh" in df.columns and "Datum" in df.columns:
+        df = df.sort_values(["Druh", "Datum"], kind="stable", na_position="last")
+    return df.reset_index(drop=True)
+
+
+def prepare_frame(df: pd.DataFrame, file_path: str) -> pd.DataFrame:
+    """
+    Přejmenuje sloupce dle CONFIG, převede data, souřadnice a počty.
+    Pracuje nad celým souborem i nad jednotlivými dávkami (viz build_store).
+    """
+    # Převod a sjednocení názvů sloupců dle CONFIG
+    rename_dict = {
+        CONFIG['col_date']: "Datum",
+        CONFIG['col_date2']: "Datum2",
+        CONFIG['col_observer']: "Pozorovatel",
+        CONFIG['col_city']: "Město",
+        CONFIG['col_location_name']: "Místo pozorování",
+        CONFIG['col_count_min']: "Počet_min",
+        CONFIG['col_count']: "Počet",
+        CONFIG['col_kvadrat']: "Kvadrát",
+        CONFIG['col_link']: "Odkaz",
+        CONFIG['col_lat']: "SouradniceY",
+        CONFIG['col_lng']: "SouradniceX",
+        CONFIG['col_species']: "Druh"
+    }
+
+    # Sloupce, které neexistují, ignorujeme (aby to nespadlo, pokud v CSV nejsou)
+    rename_dict = {old: new for old, new in rename_dict.items() if old in df.columns}
+    df.rename(columns=rename_dict, inplace=True)
+
+    # 1) Převod datumu (YYYYMMDD) -> datetime
+    if "Datum" in df.columns:
+        df["Datum"] = parse_dates(df["Datum"])
+
+    # 1a) Převod datumu (YYYYMMDD) -> datetime
+    if "Datum2" in df.columns:
+        df["Datum2"] = parse_dates(df["Datum2"])
+
+
+    # 2) Pokud máme souřadnice ve sloupcích SouradniceX a SouradniceY, převedeme je na číslo
+    if "SouradniceX" in df.columns:
+        df["SouradniceX"] = pd.to_numeric(df["SouradniceX"], errors="coerce")
+    if "SouradniceY" in df.columns:
+        df["SouradniceY"] = pd.to_numeric(df["SouradniceY"], errors="coerce")
+
+    # 3) Transformace souřadnic (EPSG:5514 -> WGS84)
+    if "SouradniceX" in df.columns and "SouradniceY" in df.columns:
+        # V EPSG:5514 je X = Easting, Y = Northing, transform vrátí (lon, lat) v EPSG:4326
+        # Každá unikátní lokalita se transformuje jen jednou (viz transform_coordinates)
+        lon_list, lat_list = transform_coordinates(df["SouradniceX"].values, df["SouradniceY"].values, file_path)
+        # Uložíme do dvou nových sloupců (float32 stačí na přesnost pod 1 m):
+        df["Zeměpisná délka"] = lon_list.astype("float32")
+        df["Zeměpisná šířka"] = lat_list.astype("float32")
+        df["SouradniceX"] = df["SouradniceX"].astype("float32")
+        df["SouradniceY"] = df["SouradniceY"].astype("float32")
+    else:
+        # Pokud neexistují X/Y, jen je vytvoříme prázdné
+        df["Zeměpisná délka"] = None
+        df["Zeměpisná šířka"] = None
+
+    # Sloupec Odkaz zůstává jako ID - HTML odkaz se skládá až pro zobrazenou stránku tabulky (viz link_html)
+
+    # Sloupce s počty, pokud existují (int32 stačí i pro velká hejna)
+    if "Počet" in df.columns:
+        df["Počet"] = df["Počet"].fillna(1).astype("int32")
+
+    if "Počet_min" in df.columns:
+        df["Počet_min"] = df["Počet_min"].fillna(1).astype("int32")
+
+    # Nepovinné textové sloupce jsou už při načtení vyplněné "" a převedené na category
+
+    return df
+
+
+# ========================
+# Perzistentní cache připravených dat (Parquet)
+# ========================
+# Připravený DataFrame se ukládá vedle CSV (uploaded_file.csv -> uploaded_file.parquet).
+# V metadatech Parquet souboru je uložen "otisk" zdrojového CSV (velikost, mtime,
+# SHA-256 obsahu) a mapování sloupců z CONFIG. Pokud se otisk neshoduje, CSV se
+# znovu zparsuje a snapshot se přepíše.
+# Při změně způsobu přípravy dat zvyšte SNAPSHOT_VERSION (zneplatní staré snapshoty).
+SNAPSHOT_VERSION = 4
+SNAPSHOT_META_KEY = b"ndop_fingerprint"
+
+
+def snapshot_path(file_path: str, suffix: str = ".parquet") -> str:
+    """Vrátí cestu k Parquet snapshotu pro daný CSV soubor (u adresáře vedle adresáře)."""
+    return os.path.splitext(os.path.normpath(file_path))[0] + suffix
+
+
+def file_sha256(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """Spočítá SHA-256 obsahu souboru (čte se po blocích, aby se nenačítal celý do paměti)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_files(file_path: str) -> list:
+    """CSV soubory zdroje: u adresáře soubory odpovídající EXPORT_PARTS['pattern'] (seřazené), jinak file_path."""
+    if not os.path.isdir(file_path):
+        return [file_path]
+    return sorted(
+        entry.path for entry in os.scandir(file_path)
+        if entry.is_file() and fnmatch.fnmatch(entry.name, EXPORT_PARTS['pattern'])
+    )
+
+
+def source_stat(file_path: str) -> tuple:
+    """Celková velikost a nejnovější mtime (ns) zdrojových CSV - levný otisk pro klíče cache."""
+    stats = [os.stat(path) for path in source_files(file_path)]
+    return sum(stat.st_size for stat in stats), max((stat.st_mtime_ns for stat in stats), default=0)
+
+
+def source_fingerprint(file_path: str, with_hash: bool = True) -> dict:
+    """
+    Otisk zdrojového CSV: velikost, mtime, (volitelně) hash obsahu a mapování sloupců.
+    U adresáře se exportem po částech navíc seznam souborů s jejich velikostmi.
+    """
+    size, mtime_ns = source_stat(file_path)
+    fingerprint = {
+        "version": SNAPSHOT_VERSION,
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "config": CONFIG,
+        "ingest": INGEST,
+    }
+    if os.path.isdir(file_path):
+        fingerprint["files"] = [[os.path.basename(path), os.path.getsize(path)] for path in source_files(file_path)]
+    if with_hash:
+        fingerprint["sha256"] = source_sha256(file_path)
+    return fingerprint
+
+
+def source_sha256(file_path: str) -> str:
+    """SHA-256 obsahu CSV; u adresáře otisk z názvů a hashů všech jeho souborů."""
+    if not os.path.isdir(file_path):
+        return file_sha256(file_path)
+    digest = hashlib.sha256()
+    for path in source_files(file_path):
+        digest.update(f"{os.path.basename(path)}:{file_sha256(path)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Klíče otisku, které musí souhlasit, aby snapshot platil (mtime ne - rozhoduje hash obsahu)
+SOURCE_KEYS = ("version", "size", "config", "ingest", "files")
+
+
+def check_fingerprint(stored: dict, file_path: str):
+    """
+    Vrátí aktuální otisk CSV, pokud uložený otisk stored odpovídá souboru, jinak None.
+    Hash obsahu se počítá jen tehdy, když nesedí mtime.
+    """
+    current = source_fingerprint(file_path, with_hash=False)
+    if any(stored.get(key) != current.get(key) for key in SOURCE_KEYS):
+        return None
+    if stored.get("mtime_ns") != current["mtime_ns"]:
+        current["sha256"] = source_sha256(file_path)
+        if stored.get("sha256") != current["sha256"]:
+            return None
+    else:
+        current["sha256"] = stored.get("sha256")
+    return current
+
+
+def current_fingerprint(file_path: str) -> dict:
+    """
+    Aktuální otisk CSV včetně hashe obsahu - počítá se jednou na načtení a předává se
+    všem snapshotům. Hash se převezme z hlavního snapshotu, pokud sedí velikost i mtime;
+    jinak se spočítá (jen jednou, i když se pak kontroluje víc snapshotů).
+    """
+    current = source_fingerprint(file_path, with_hash=False)
+    stored = read_snapshot_fingerprint(file_path) or {}
+    if "sha256" in stored and all(stored.get(key) == current.get(key) for key in ("mtime_ns", *SOURCE_KEYS)):
+        current["sha256"] = stored["sha256"]
+    else:
+        current["sha256"] = source_sha256(file_path)
+    return current
+
+
+def same_source(stored: dict, current: dict) -> bool:
+    """Zda dva otisky popisují stejný obsah CSV se stejnou přípravou (mtime se neporovnává)."""
+    return all(stored.get(key) == current.get(key) for key in (*SOURCE_KEYS, "sha256"))
+
+
+def read_snapshot(file_path: str, suffix: str = ".parquet", fingerprint: dict = None):
+    """
+    Vrátí DataFrame ze snapshotu, pokud odpovídá aktuálnímu CSV, jinak None.
+    fingerprint je aktuální otisk (viz current_fingerprint); bez něj se zjistí zde.
+    Rozhoduje obsah, ne mtime - snapshot platí i po novém stažení stejného souboru.
+    """
+    stored = read_snapshot_fingerprint(file_path, suffix)
+    if stored is None or not same_source(stored, fingerprint or current_fingerprint(file_path)):
+        return None
+    try:
+        return pd.read_parquet(snapshot_path(file_path, suffix), memory_map=True)
+    except Exception:
+        return None
+
+
+def read_snapshot_fingerprint(file_path: str, suffix: str = ".parquet"):
+    """Otisk CSV uložený v metadatech snapshotu (None, pokud snapshot chybí nebo je poškozený)."""
+    import pyarrow.parquet as pq
+
+    path = snapshot_path(file_path, suffix)
+    if not os.path.exists(path):
+        return None
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+        return json.loads(metadata.get(SNAPSHOT_META_KEY, b"{}"))
+    except Exception:
+        return None
+
+
+def read_previous_snapshot(file_path: str, suffix: str = ".parquet"):
+    """
+    Snapshot předchozí verze CSV (bez kontroly velikosti a obsahu souboru), pokud byl
+    připraven se stejným SNAPSHOT_VERSION, CONFIG a INGEST. Vrací (DataFrame, otisk),
+    nebo (None, None). Slouží jako základ pro přírůstkovou aktualizaci (viz merge_export).
+    """
+    stored = read_snapshot_fingerprint(file_path, suffix)
+    current = {"version": SNAPSHOT_VERSION, "config": CONFIG, "ingest": INGEST}
+    if stored is None or any(stored.get(key) != value for key, value in current.items()):
+        return None, None
+    try:
+        return pd.read_parquet(snapshot_path(file_path, suffix)), stored
+    except Exception:
+        return None, None
+
+
+def write_snapshot(df: pd.DataFrame, file_path: str, fingerprint: dict, suffix: str = ".parquet") -> None:
+    """Uloží připravený DataFrame jako Parquet snapshot s otiskem v metadatech (atomicky)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = snapshot_path(file_path, suffix)
+    tmp_path = path + ".tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[SNAPSHOT_META_KEY] = json.dumps(fingerprint).encode("utf-8")
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, path)
+    except (OSError, pa.ArrowException):
+        # Snapshot je jen zrychlení - pokud ho nejde zapsat, pokračujeme bez něj
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# ========================
+# Cache transformace souřadnic (EPSG:5514 -> WGS84)
+# ========================
+# Většina pozorování pochází z opakujících se lokalit, proto se transformuje
+# jen každá unikátní dvojice (X, Y) jednou. Převodní tabulka se ukládá vedle CSV
+# (uploaded_file.csv -> uploaded_file.coords.parquet) a při dalším načtení
+# (i po stažení nového exportu) se transformují jen dosud neznámé dvojice.
+COORD_CACHE_SUFFIX = ".coords.parquet"
+
+
+def coord_cache_path(file_path: str) -> str:
+    """Vrátí cestu k převodní tabulce souřadnic pro daný CSV soubor."""
+    return os.path.splitext(file_path)[0] + COORD_CACHE_SUFFIX
+
+
+def read_coord_cache(file_path: str) -> pd.DataFrame:
+    """Načte převodní tabulku (x, y, lon, lat); pokud neexistuje nebo je poškozená, vrátí prázdnou."""
+    path = coord_cache_path(file_path)
+    if os.path.exists(path):
+        try:
+            return pd.read_parquet(path, columns=["x", "y", "lon", "lat"])
+        except Exception:
+            pass
+    return pd.DataFrame({col: pd.Series(dtype="float64") for col in ["x", "y", "lon", "lat"]})
+
+
+def transform_coordinates(x, y, file_path: str):
+    """
+    Převede souřadnice EPSG:5514 (x = Easting, y = Northing) na WGS84 (lon, lat).
+    Transformuje jen unikátní dvojice, které ještě nejsou v převodní tabulce,
+    a výsledky přiřadí zpět ke všem řádkům jedním (vektorovým) joinem.
+    """
+    pairs = pd.DataFrame({"x": x, "y": y}, dtype="float64")
+    lookup = read_coord_cache(file_path)
+
+    unique_pairs = pairs.dropna().drop_duplicates()
+    known = unique_pairs.merge(lookup[["x", "y"]], on=["x", "y"], how="left", indicator=True)
+    missing = known.loc[known["_merge"] == "left_only", ["x", "y"]]
+
+    if not missing.empty:
+        transformer = Transformer.from_crs("EPSG:5514", "EPSG:4326", always_xy=True)
+        # always_xy=True => (x, y) = (lon, lat)
+        lon, lat = transformer.transform(missing["x"].values, missing["y"].values)
+        missing = missing.assign(lon=lon, lat=lat)
+        lookup = pd.concat([lookup, missing], ignore_index=True)
+
+        path = coord_cache_path(file_path)
+        try:
+            lookup.to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            # Cache je jen zrychlení - pokud ji nejde zapsat, pokračujeme bez ní
+            pass
+
+    # how="left" zachovává pořadí řádků; řádky bez souřadnic dostanou NaN
+    result = pairs.merge(lookup, on=["x", "y"], how="left")
+    return result["lon"].values, result["lat"].values
+
+
+# ========================
+# Funkce pro načtení dat z CSV
+# ========================
+def load_data(file_path: str, fingerprint: dict = None) -> pd.DataFrame:
+    """
+    Načte připravená data - ze snapshotu (pokud odpovídá CSV), přírůstkově z předchozí
+    verze (viz merge_export), jinak z celého CSV, a výsledek uloží jako nový snapshot
+    pro další start. file_path může být i adresář s exportem po částech (viz load_export_parts).
+    fingerprint je aktuální otisk CSV (viz current_fingerprint), pokud ho volající už má.
+    """
+    fingerprint = fingerprint or current_fingerprint(file_path)
+    df = read_snapshot(file_path, fingerprint=fingerprint)
+    if df is not None:
+        if read_snapshot_fingerprint(file_path) != fingerprint:
+            # Stejný obsah s novým mtime: obnovený otisk ušetří hash při příštím startu
+            write_snapshot(df, file_path, fingerprint)
+        return df
+
+    if os.path.isdir(file_path):
+        df = load_export_parts(file_path)
+        write_snapshot(df, file_path, fingerprint)
+        return df
+
+    df = merge_export(file_path, fingerprint)
+    if df is not None:
+        return df
+
+    df = prepare_data(file_path)
+    write_snapshot(df, file_path, fingerprint)
+    rows = export_row_state(file_path)
+    if rows is not None:
+        write_snapshot(rows, file_path, fingerprint, ROWS_SUFFIX)
+    return df
+
+
+def load_derived(file_path: str, suffix: str, build, df: pd.DataFrame = None, fingerprint: dict = None) -> pd.DataFrame:
+    """
+    Odvozená tabulka (kostka, fenologie, obsazenost...) ze snapshotu s příponou suffix,
+    pokud odpovídá otisku fingerprint; jinak ji build sestaví z df (nebo load_data) a uloží.
+    """
+    fingerprint = fingerprint or current_fingerprint(file_path)
+    table = read_snapshot(file_path, suffix, fingerprint)
+    if table is None:
+        table = build(df if df is not None else load_data(file_path, fingerprint))
+        write_snapshot(table, file_path, fingerprint, suffix)
+    return table
+
+
+# ========================
+# Přírůstková aktualizace z nového exportu
+# ========================
+# Nové exporty z NDOP většinou opakují předchozí záznamy. Ke každé verzi dat se proto
+# ukládá ID nálezu (ID_ND_NALEZ) a 64bitový otisk každého řádku CSV
+# (uploaded_file.rows.parquet). Nový export se pak jen projde jako surové řádky
+# (bez parsování do sloupců) a parsují se, transformují a do kostky započítají jen
+# nové a změněné záznamy; záznamy, které v exportu chybí, se odeberou.
+ROWS_SUFFIX = ".rows.parquet"
+EXPORT_BLOCK_SIZE = 1 << 26  # Velikost bloku (v bajtech) při čtení surových řádků
+
+
+def iter_export_lines(file_path: str, block_size: int = EXPORT_BLOCK_SIZE):
+    """
+    Čte CSV jako surové řádky (bajty) po blocích. Vrací generátor trojic
+    (hlavička, řádky bloku, ID nálezů řádků); prázdné řádky se přeskočí.
+    Vyhodí ValueError, pokud chybí sloupec s ID nebo záznamy nejsou po jednom
+    na řádek (zalomení uvnitř uvozovek) - pak se data připraví celá znovu.
+
+    Řádek s uvozovkami se rozdělí modulem csv i tehdy, když začal v předchozím bloku:
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False) as f:
+    ...     _ = f.write(b'Pozn;ID_ND_NALEZ;X\\n"a;5;b";7;z\\n"x;y";8;z\\nc;9;z\\n')
+    >>> [ids.tolist() for _, _, ids in iter_export_lines(f.name, block_size=4)]
+    [[7], [8], [9]]
+    >>> os.remove(f.name)
+    """
+    import csv
+
+    encoding = INGEST['encoding']
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        columns = next(csv.reader([header.decode(encoding)], delimiter=';'))
+        id_position = columns.index(CONFIG['col_link'])
+
+        rest = b""
+        while True:
+            block = f.read(block_size)
+            if not block and not rest:
+                break
+            lines = (rest + block).split(b"\n")
+            rest = lines.pop() if block else b""
+            lines = [line for line in lines if line.strip(b"\r")]
+            if not lines:
+                continue
+
+            if any(b'"' in line for line in lines):
+                # Uvozovky mohou skrývat středník nebo zalomení -> pole rozdělí modul csv
+                records = list(csv.reader([line.decode(encoding) for line in lines], delimiter=';'))
+                if len(records) != len(lines):
+                    raise ValueError("záznamy CSV nejsou po jednom na řádek")
+                ids = [record[id_position] for record in records]
+            else:
+                ids = [line.split(b";", id_position + 1)[id_position] for line in lines]
+            yield header, lines, np.array(ids).astype("int64")
+
+
+def export_row_state(file_path: str):
+    """ID nálezu a otisk každého řádku CSV (None, pokud je nejde spočítat, viz iter_export_lines)."""
+    ids = []
+    hashes = []
+    try:
+        for _, lines, line_ids in iter_export_lines(file_path):
+            ids.append(line_ids)
+            hashes.append(pd.util.hash_array(np.array(lines, dtype=object)))
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return None
+    if not ids:
+        return None
+    rows = pd.DataFrame({"id": np.concatenate(ids), "hash": np.concatenate(hashes)})
+    return rows if rows["id"].is_unique else None
+
+
+def merge_export(file_path: str, fingerprint: dict):
+    """
+    Sloučí nový CSV export s předchozí verzí připravených dat podle ID nálezu:
+    připraví jen nové a změněné záznamy, odebere smazané a součtové tabulky (kostku,
+    fenologii a snímky heatmapy) upraví o rozdíl. Zapíše nový snapshot, upravené tabulky
+    i otisky řádků. Obsazenost kvadrátů a počty pozorovatelů jsou počty různých hodnot,
+    které o rozdíl upravit nejde - sestaví se znovu při prvním načtení (viz load_derived).
+    Vrátí None, pokud předchozí verze chybí nebo ji nelze použít (data se pak připraví
+    celá znovu).
+    """
+    old_df, stored = read_previous_snapshot(file_path)
+    old_rows, rows_stored = read_previous_snapshot(file_path, ROWS_SUFFIX)
+    if old_df is None or old_rows is None or not same_source(stored, rows_stored) or "Odkaz" not in old_df.columns:
+        return None
+    old_ids = pd.Index(old_rows["id"].to_numpy())
+    old_hash = old_rows["hash"].to_numpy()
+    if old_ids.empty or not old_ids.is_unique:
+        return None
+
+    # Nové a změněné řádky se zapíšou do dočasného CSV a připraví stejnou cestou jako celý soubor.
+    # Soubor leží v systémovém dočasném adresáři - v adresáři exportu po částech by ho
+    # po pádu procesu načetl source_files jako další část dat.
+    delta_fd, delta_path = tempfile.mkstemp(prefix="ndop-delta-", suffix=".csv")
+    ids = []
+    hashes = []
+    changed = []
+    n_delta = 0
+    try:
+        with os.fdopen(delta_fd, "wb") as delta_file:
+            for header, lines, line_ids in iter_export_lines(file_path):
+                if not ids:
+                    delta_file.write(header)
+                line_hash = pd.util.hash_array(np.array(lines, dtype=object))
+                position = old_ids.get_indexer(line_ids)
+                known = position >= 0
+                same = known & (old_hash[np.where(known, position, 0)] == line_hash)
+                changed.append(line_ids[known & ~same])
+                delta_lines = [lines[i] for i in np.flatnonzero(~same)]
+                if delta_lines:
+                    delta_file.write(b"\n".join(delta_lines) + b"\n")
+                    n_delta += len(delta_lines)
+                ids.append(line_ids)
+                hashes.append(line_hash)
+        if not ids:
+            return None
+        new_rows = pd.DataFrame({"id": np.concatenate(ids), "hash": np.concatenate(hashes)})
+        if not new_rows["id"].is_unique:
+            return None
+
+        delta = old_df.iloc[0:0]
+        if n_delta:
+            delta = prepare_frame(read_csv_typed(delta_path)[0], file_path)
+            if list(delta.columns) != list(old_df.columns):
+                return None
+    except (ValueError, IndexError, UnicodeDecodeError, pd.errors.ParserError):
+        return None
+    finally:
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+
+    # Odebrané řádky = smazané z exportu + předchozí verze změněných záznamů
+    deleted = old_ids[~old_ids.isin(new_rows["id"])]
+    changed = np.concatenate(changed)
+    removed_mask = old_df["Odkaz"].isin(np.concatenate([deleted.to_numpy(), changed])).to_numpy()
+    removed = old_df[removed_mask]
+    df = sort_observations(concat_chunks([old_df[~removed_mask], delta]))
+
+    write_snapshot(df, file_path, fingerprint)
+    # Součtové tabulky předchozí verze se upraví o rozdíl; chybějící se sestaví až při načtení
+    for suffix, update in ((CUBE_SUFFIX, update_cube), (PHENOLOGY_SUFFIX, update_phenology),
+                           (frames_suffix(), update_heatmap_frames)):
+        old_table, table_stored = read_previous_snapshot(file_path, suffix)
+        if old_table is not None and same_source(table_stored, stored):
+            write_snapshot(update(old_table, removed, delta), file_path, fingerprint, suffix)
+    write_snapshot(new_rows, file_path, fingerprint, ROWS_SUFFIX)
+    logger.info(
+        "Přírůstková aktualizace %s: %d nových, %d změněných, %d smazaných záznamů (celkem %d)",
+        file_path, len(delta) - len(changed), len(changed), len(deleted), len(df)
+    )
+    return df
+
+
+def latest_export(export_dir: str):
+    """Nejnovější CSV export v adresáři (podle času změny), nebo None."""
+    if not os.path.isdir(export_dir):
+        return None
+    exports = [entry for entry in os.scandir(export_dir) if entry.is_file() and entry.name.lower().endswith(".csv")]
+    if not exports:
+        return None
+    return max(exports, key=lambda entry: (entry.stat().st_mtime_ns, entry.name)).path
+
+
+# Převzetí exportu volá každé sezení aplikace i zahřívací vlákno (stejný proces)
+INSTALL_LOCK = threading.Lock()
+
+
+def install_latest_export(export_dir: str, file_path: str) -> bool:
+    """
+    Převezme nejnovější export z export_dir jako novou verzi file_path (atomická kopie
+    se zachovaným časem změny). Vrátí True, pokud se file_path změnil.
+    Připravená data se pak při načtení aktualizují přírůstkově (viz merge_export).
+    """
+    import shutil
+
+    source = latest_export(export_dir)
+    if source is None:
+        return False
+    new_stat = os.stat(source)
+    with INSTALL_LOCK:
+        if os.path.exists(file_path):
+            old_stat = os.stat(file_path)
+            if (old_stat.st_size, old_stat.st_mtime_ns) == (new_stat.st_size, new_stat.st_mtime_ns):
+                return False
+
+        # Jedinečný dočasný soubor vedle cíle (os.replace musí zůstat na stejném disku)
+        tmp_fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(file_path) + ".", suffix=".tmp",
+                                            dir=os.path.dirname(file_path) or None)
+        os.close(tmp_fd)
+        try:
+            shutil.copy2(source, tmp_path)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    logger.info("Převzat export %s jako %s", source, file_path)
+    return True
+
+
+# ========================
+# Export rozdělený do více souborů (např. podle regionu a roku)
+# ========================
+# Každý soubor se připraví v samostatném procesu přes load_data - tedy včetně převodu
+# dat a souřadnic, vlastního snapshotu a přírůstkové aktualizace, takže se při změně
+# jedné části znovu zpracuje jen ta. Části se pak spojí se sjednocenými slovníky
+# kategorií a záznamy se stejným ID nálezu se ponechají jen jednou.
+def configure_worker(config: dict, ingest: dict) -> None:
+    """Převezme v pracovním procesu nastavení hlavního procesu (CONFIG, INGEST)."""
+    CONFIG.update(config)
+    INGEST.update(ingest)
+
+
+def load_part(file_path: str):
+    """Připravená data jedné části exportu (None, pokud je soubor prázdný)."""
+    try:
+        return load_data(file_path)
+    except EmptyExportError:
+        logger.warning("Přeskakuji prázdnou část exportu %s", file_path)
+        return None
+
+
+def load_export_parts(dir_path: str, workers: int = None) -> pd.DataFrame:
+    """
+    Načte všechny části exportu v adresáři (viz source_files) souběžně v procesech
+    (workers, výchozí EXPORT_PARTS['workers']) a spojí je do jednoho seřazeného DataFrame.
+    Při duplicitním ID nálezu má přednost záznam ze souboru později v abecedním pořadí.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    files = source_files(dir_path)
+    if not files:
+        raise EmptyExportError("Adresář neobsahuje žádné CSV exporty.")
+
+    start = time.perf_counter()
+    # Nezměněné části se načtou rovnou ze snapshotů, procesy se spouští jen pro ostatní
+    parts = {path: read_snapshot(path) for path in files}
+    stale = [path for path, part in parts.items() if part is None]
+    workers = min(workers or EXPORT_PARTS['workers'] or os.cpu_count() or 1, len(stale)) if stale else 0
+    if workers == 1:
+        parts.update((path, load_part(path)) for path in stale)
+    elif workers > 1:
+        # "spawn" - Streamlit i pyarrow běží ve více vláknech, fork by nebyl bezpečný
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_worker, initargs=(CONFIG, INGEST)
+        ) as pool:
+            parts.update(zip(stale, pool.map(load_part, stale)))
+
+    files = [path for path in files if parts[path] is not None]
+    parts = [parts[path] for path in files]
+    if not parts:
+        raise EmptyExportError("Všechny soubory v adresáři jsou prázdné.")
+    columns = list(parts[0].columns)
+    for path, part in zip(files, parts):
+        if list(part.columns) != columns:
+            raise ValueError(f"Soubor {path} má jiné sloupce než ostatní části exportu.")
+
+    df = concat_chunks(parts)
+    duplicates = 0
+    if "Odkaz" in df.columns:
+        duplicated = df["Odkaz"].duplicated(keep="last").to_numpy()
+        duplicates = int(duplicated.sum())
+        if duplicates:
+            df = df[~duplicated]
+    df = sort_observations(df)
+
+    logger.info(
+        "Načteno %d řádků z %d souborů v %s (%d znovu připraveno v %d procesech, %d duplicit odebráno) za %.1f s",
+        len(df), len(parts), dir_path, len(stale), workers, duplicates, time.perf_counter() - start
+    )
+    return df
+
+
+# ========================
+# Index druh/datum nad seřazenými daty
+# ========================
+# Data jsou fyzicky seřazená podle (Druh, Datum), takže každý druh tvoří souvislý
+# blok řádků. Index si pamatuje začátek a konec bloku každého druhu; rozsah dat
+# se v bloku najde binárním vyhledáváním a výsledkem je výřez bez kopírování.
+def build_species_index(df: pd.DataFrame):
+    """Vrátí {druh: (start, stop)} s pozicemi řádků, nebo None, pokud chybí Druh/Datum."""
+    if df.empty or "Druh" not in df.columns or "Datum" not in df.columns:
+        return None
+
+    species = df["Druh"]
+    if isinstance(species.dtype, pd.CategoricalDtype):
+        codes = species.cat.codes.to_numpy()
+    else:
+        codes = pd.factorize(species)[0]
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], boundaries))
+    stops = np.concatenate((boundaries, [len(df)]))
+    names = species.to_numpy()[starts]
+    return {name: (int(start), int(stop)) for name, start, stop in zip(names, starts, stops)}
+
+
+def species_range_bounds(df: pd.DataFrame, species_index: dict, species: str, date_from, date_to):
+    """
+    Pozice (od, do) řádků druhu s Datum v rozsahu date_from..date_to (včetně), nebo None.
+    Řádky bez data (NaT) leží na konci bloku, takže do žádného rozsahu nepatří.
+    """
+    if species not in species_index:
+        return None
+    start, stop = species_index[species]
+    dates = df["Datum"].to_numpy()[start:stop]
+    lo = start + np.searchsorted(dates, np.datetime64(date_from), side="left")
+    hi = start + np.searchsorted(dates, np.datetime64(date_to + timedelta(days=1)), side="left")
+    return int(lo), int(hi)
+
+
+def select_species_range(df: pd.DataFrame, species_index: dict, species: str, date_from, date_to) -> pd.DataFrame:
+    """Vrátí řádky druhu s Datum v rozsahu date_from..date_to (včetně) jako výřez df."""
+    bounds = species_range_bounds(df, species_index, species, date_from, date_to)
+    if bounds is None:
+        return df.iloc[0:0]
+    return df.iloc[bounds[0]:bounds[1]]
+
+
+def select_species_ranges(df: pd.DataFrame, species_index: dict, species, date_from, date_to) -> pd.DataFrame:
+    """
+    Záznamy více druhů v rozsahu dat jedním výběrem řádků: bloky druhů se dohledají
+    v indexu a spojí do jednoho pole pozic (výsledek zůstává seřazený podle druhu a data).
+    """
+    bounds = sorted(
+        bound for bound in (species_range_bounds(df, species_index, name, date_from, date_to) for name in species)
+        if bound is not None
+    )
+    if not bounds:
+        return df.iloc[0:0]
+    return df.iloc[np.concatenate([np.arange(lo, hi) for lo, hi in bounds])]
+
+
+# ========================
+# Agregační kostka: druh × rok × měsíc
+# ========================
+# Grafy a metriky nad celými daty čtou z malé předpočítané tabulky místo
+# opakovaných groupby nad všemi řádky při každém překreslení aplikace.
+# Kostka se ukládá vedle snapshotu (uploaded_file.cube.parquet) se stejným otiskem CSV.
+CUBE_SUFFIX = ".cube.parquet"
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sestaví kostku (Druh, Rok, Měsíc podle Datum) -> počet pozorování a součet jedinců.
+    Řádky bez data mají Rok/Měsíc = <NA>. Rozložení vícedenních záznamů do měsíců
+    počítá fenologie (viz build_phenology).
+    """
+    columns = ["Druh", "Rok", "Měsíc", "Pozorování", "Jedinci"]
+    if df.empty or "Datum" not in df.columns or "Druh" not in df.columns:
+        return pd.DataFrame(columns=columns)
+
+    counts = df["Počet"] if "Počet" in df.columns else pd.Series(1, index=df.index)
+    frame = pd.DataFrame({
+        "Druh": df["Druh"],
+        "Rok": df["Datum"].dt.year.astype("Int16"),
+        "Měsíc": df["Datum"].dt.month.astype("Int8"),
+        "Pozorování": 1,
+        "Jedinci": counts.astype("int64"),
+    })
+    cube = (
+        frame.groupby(["Druh", "Rok", "Měsíc"], observed=True, dropna=False)
+        .sum()
+        .reset_index()
+    )
+    return cube[columns]
+
+
+def update_sums(table: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame, build, keys: list,
+                values: list) -> pd.DataFrame:
+    """
+    Upraví součtovou tabulku (kostka, fenologie, snímky heatmapy) o rozdíl dat: odečte
+    build(removed) a přičte build(added), sečteno po klíčích keys. Řádky, jejichž první
+    hodnota values klesne na nulu, se vynechají. Vrátí None, pokud se nic nemění.
+    """
+    parts = [table]
+    if not added.empty:
+        parts.append(build(added))
+    if not removed.empty:
+        negative = build(removed)
+        negative[values] = -negative[values]
+        parts.append(negative)
+    if len(parts) == 1:
+        return None
+
+    parts = [part.astype({"Druh": "object"}) for part in parts]
+    merged = (
+        pd.concat(parts, ignore_index=True)
+        .groupby(keys, dropna=False)[values]
+        .sum()
+        .reset_index()
+    )
+    # Součty podílů (fenologie) se po odečtení nemusí vrátit přesně na nulu
+    return merged[merged[values[0]].abs() > 1e-9].reset_index(drop=True)
+
+
+def update_cube(cube: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+    """
+    Upraví kostku o rozdíl dat: odečte součty odebraných řádků a přičte přidané
+    (stejný výsledek jako build_cube nad novými daty, jen bez průchodu všemi řádky).
+    """
+    merged = update_sums(cube, removed, added, build_cube, ["Druh", "Rok", "Měsíc"], ["Pozorování", "Jedinci"])
+    if merged is None:
+        return cube
+    return merged.astype({
+        "Druh": "category", "Rok": "Int16", "Měsíc": "Int8", "Pozorování": "int64", "Jedinci": "int64",
+    })
+
+
+def species_count_by_year(cube: pd.DataFrame) -> pd.DataFrame:
+    """Počet různých druhů v jednotlivých letech (sloupce Rok, Počet druhů)."""
+    yearly = cube.dropna(subset=["Rok"]).groupby("Rok")["Druh"].nunique().reset_index()
+    yearly.columns = ["Rok", "Počet druhů"]
+    return yearly
+
+
+def species_cube(cube: pd.DataFrame, species: str) -> pd.DataFrame:
+    """Řádky kostky pro jeden druh."""
+    return cube[cube["Druh"] == species]
+
+
+def species_cube_many(cube: pd.DataFrame, species) -> pd.DataFrame:
+    """Řádky kostky pro více druhů najednou (Druh jako text, aby šel použít v reindex)."""
+    rows = cube[cube["Druh"].isin(species)]
+    return rows.astype({"Druh": "object"})
+
+
+def yearly_counts_many(cube: pd.DataFrame, species, years) -> pd.DataFrame:
+    """
+    Počet pozorování více druhů v letech years jedním groupby nad kostkou
+    (sloupce Druh, Rok, Počet pozorování; všechny kombinace, i s nulami).
+    """
+    rows = species_cube_many(cube, species).dropna(subset=["Rok"])
+    counts = rows.groupby(["Druh", rows["Rok"].astype(int)])["Pozorování"].sum()
+    index = pd.MultiIndex.from_product([list(species), sorted(int(year) for year in years)], names=["Druh", "Rok"])
+    return counts.reindex(index, fill_value=0).astype(int).reset_index(name="Počet pozorování")
+
+
+def species_yearly_counts(cube: pd.DataFrame, species: str, years) -> pd.DataFrame:
+    """Počet pozorování druhu v letech years (sloupce Rok, Počet pozorování), i s nulami."""
+    yearly_species_counts = (
+        species_cube(cube, species)
+        .groupby("Rok")["Pozorování"].sum()
+        .reindex(years, fill_value=0)
+        .rename_axis("Rok")
+        .reset_index(name="Počet pozorování")
+    )
+    yearly_species_counts["Počet pozorování"] = yearly_species_counts["Počet pozorování"].astype(int)
+    return yearly_species_counts
+
+
+MONTH_NAMES = {
+    1: "Leden", 2: "Únor", 3: "Březen", 4: "Duben", 5: "Květen", 6: "Červen",
+    7: "Červenec", 8: "Srpen", 9: "Září", 10: "Říjen", 11: "Listopad", 12: "Prosinec"
+}
+
+
+def month_aligned(date_from, date_to, date_min, date_max) -> bool:
+    """
+    True, pokud rozsah dat pokrývá jen celé měsíce (případně sahá až za okraj dat),
+    takže měsíční součty lze vzít přímo z kostky.
+    """
+    starts_on_month = date_from.day == 1 or date_from <= date_min
+    ends_on_month = (date_to + timedelta(days=1)).day == 1 or date_to >= date_max
+    return starts_on_month and ends_on_month
+
+
+# ========================
+# Fenologie: rozložení záznamů Datum..Datum2 do měsíců, týdnů a dnů v roce
+# ========================
+# Záznam s rozsahem dat (Datum..Datum2) se rovnoměrně rozloží do všech dní, které
+# pokrývá: každý den dostane podíl 1/počet dní (a stejný podíl z Počet). Vícedenní
+# a vícetýdenní záznamy tak v grafech nechybí a součet za celý rozsah dat se rovná
+# počtu záznamů. Měsíční podíly (Druh, Rok, Měsíc) se předpočítají a ukládají vedle
+# snapshotu (uploaded_file.phenology.parquet); týdny, dny v roce a rozsahy, které
+# nezačínají a nekončí na hranici měsíce, se počítají z řádků druhu na požádání.
+PHENOLOGY_SUFFIX = ".phenology.parquet"
+# Jednotky histogramu a názvy sloupce s přihrádkou
+PHENOLOGY_UNITS = {"month": "Měsíc", "week": "Týden", "day": "Den v roce"}
+
+
+def observation_days(data: pd.DataFrame):
+    """
+    Začátek a konec (včetně) záznamů jako datetime64[D]. Bez Datum2, nebo když
+    Datum2 leží před Datum, trvá záznam jen jeden den. Záznamy bez Datum mají NaT.
+    """
+    start = data["Datum"].to_numpy().astype("datetime64[D]")
+    if "Datum2" not in data.columns:
+        return start, start
+    end = data["Datum2"].to_numpy().astype("datetime64[D]")
+    end = np.where(np.isnat(end) | (end < start), start, end)
+    return start, end
+
+
+def observation_weights(data: pd.DataFrame) -> dict:
+    """Váhy záznamů pro fenologii: 1 za pozorování, Počet za jedince (jen pokud sloupec existuje)."""
+    weights = {"Pozorování": np.ones(len(data))}
+    if "Počet" in data.columns:
+        weights["Jedinci"] = data["Počet"].to_numpy(dtype="float64")
+    return weights
+
+
+def month_pieces(start: np.ndarray, end: np.ndarray):
+    """
+    Rozloží intervaly start..end (datetime64[D]) na části po kalendářních měsících.
+    Vrací pozici intervalu, měsíc části (datetime64[M]) a podíl dní intervalu v něm.
+    """
+    first = start.astype("datetime64[M]")
+    n_months = (end.astype("datetime64[M]") - first).astype(np.int64) + 1
+    rows = np.repeat(np.arange(len(start)), n_months)
+    offset = np.arange(len(rows)) - np.repeat(np.cumsum(n_months) - n_months, n_months)
+    month = first[rows] + offset
+    piece_start = np.maximum(month.astype("datetime64[D]"), start[rows])
+    piece_end = np.minimum((month + 1).astype("datetime64[D]") - 1, end[rows])
+    length = (end - start).astype(np.int64) + 1
+    share = ((piece_end - piece_start).astype(np.int64) + 1) / length[rows]
+    return rows, month, share
+
+
+def build_phenology(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sestaví měsíční fenologii (Druh, Rok, Měsíc) -> podíl pozorování a jedinců
+    rozložených podle dní, které záznamy pokrývají (viz month_pieces).
+    """
+    columns = ["Druh", "Rok", "Měsíc", "Pozorování", "Jedinci"]
+    if df.empty or "Datum" not in df.columns or "Druh" not in df.columns:
+        return pd.DataFrame({col: pd.Series(dtype="float64" if col in ("Pozorování", "Jedinci") else "object") for col in columns})
+
+    start, end = observation_days(df)
+    valid = np.flatnonzero(~np.isnat(start) & df["Druh"].notna().to_numpy())
+    rows, month, share = month_pieces(start[valid], end[valid])
+    rows = valid[rows]
+    weights = observation_weights(df)
+    frame = pd.DataFrame({
+        "Druh": df["Druh"].array.take(rows),
+        "Rok": (month.astype("datetime64[Y]").astype(np.int64) + 1970).astype("int16"),
+        "Měsíc": (month.astype(np.int64) % 12 + 1).astype("int8"),
+        "Pozorování": share,
+        "Jedinci": share * weights.get("Jedinci", weights["Pozorování"])[rows],
+    })
+    phenology = frame.groupby(["Druh", "Rok", "Měsíc"], observed=True).sum().reset_index()
+    return phenology[columns]
+
+
+def update_phenology(phenology: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+    """Upraví měsíční fenologii o rozdíl dat (jako update_cube; podíly záznamů se sčítají)."""
+    merged = update_sums(phenology, removed, added, build_phenology, ["Druh", "Rok", "Měsíc"], ["Pozorování", "Jedinci"])
+    if merged is None:
+        return phenology
+    return merged.astype({"Druh": "category", "Rok": "int16", "Měsíc": "int8"})
+
+
+def day_bins(days: pd.DatetimeIndex, unit: str):
+    """
+    Přihrádky histogramu pro dny: pozice přihrádky každého dne a popisky všech přihrádek.
+    month = 12 měsíců, week = ISO týden 1-53, day = den v roce 1-366 (v nepřestupných
+    letech se po únoru posouvá o den, aby stejné datum mělo každý rok stejné číslo).
+    """
+    if unit == "month":
+        return days.month.to_numpy() - 1, list(MONTH_NAMES.values())
+    if unit == "week":
+        return days.isocalendar().week.to_numpy(dtype=np.int64) - 1, list(range(1, 54))
+    if unit == "day":
+        shift = (~days.is_leap_year & (days.month > 2)).astype(np.int64)
+        return days.dayofyear.to_numpy() - 1 + shift, list(range(1, 367))
+    raise ValueError(f"Neznámá jednotka fenologie: {unit}")
+
+
+def phenology_histogram(data: pd.DataFrame, day_from=None, day_to=None, unit: str = "month", by: str = None) -> pd.DataFrame:
+    """
+    Fenologie záznamů data: podíly záznamů (a jedinců) rozložené do dní day_from..day_to
+    a sečtené po měsících, týdnech nebo dnech v roce (unit, viz day_bins). Záznamy,
+    které rozsah přesahují, přispějí jen dny uvnitř; None = bez omezení.
+    S by (např. "Druh") se počítá zvlášť pro každou hodnotu sloupce.
+    Sloupce: [by], Měsíc / Týden / Den v roce, Počet pozorování (a Počet jedinců).
+    """
+    label = PHENOLOGY_UNITS[unit]
+    weights = observation_weights(data)
+    start, end = observation_days(data)
+    valid = ~np.isnat(start)
+    length = (end - start).astype(np.int64) + 1  # Délka celého záznamu (podíl na den se ořezem nemění)
+    if day_from is not None:
+        start = np.maximum(start, np.datetime64(day_from, "D"))
+    if day_to is not None:
+        end = np.minimum(end, np.datetime64(day_to, "D"))
+    valid &= start <= end
+    if by is not None:
+        group_codes, groups = pd.factorize(data[by], sort=True)
+        valid &= group_codes >= 0
+    else:
+        group_codes, groups = np.zeros(len(data), dtype=np.intp), [None]
+
+    if valid.any():
+        first = start[valid].min() if day_from is None else np.datetime64(day_from, "D")
+        last = end[valid].max() if day_to is None else np.datetime64(day_to, "D")
+    else:
+        first = last = np.datetime64(day_from or day_to or "2000-01-01", "D")
+    days = pd.date_range(first, last, freq="D")
+    bins, labels = day_bins(days, unit)
+
+    # Rozdílové pole: +podíl v první den intervalu, -podíl den po posledním, kumulativní
+    # součet pak dá denní součty podílů všech záznamů (bez smyčky přes záznamy)
+    n_days = len(days) + 1
+    base = group_codes[valid] * n_days
+    begin = base + (start[valid] - first).astype(np.int64)
+    stop = base + (end[valid] - first).astype(np.int64) + 1
+    result = {}
+    for name, weight in weights.items():
+        share = weight[valid] / length[valid]
+        diff = (
+            np.bincount(begin, weights=share, minlength=len(groups) * n_days) -
+            np.bincount(stop, weights=share, minlength=len(groups) * n_days)
+        )
+        daily = np.cumsum(diff.reshape(len(groups), n_days)[:, :-1], axis=1)
+        keys = (np.arange(len(groups))[:, None] * len(labels) + bins[None, :]).ravel()
+        result[name] = np.bincount(keys, weights=daily.ravel(), minlength=len(groups) * len(labels))
+
+    histogram = pd.DataFrame({
+        label: np.tile(labels, len(groups)),
+        "Počet pozorování": result["Pozorování"].round(2),
+    })
+    if "Jedinci" in result:
+        histogram["Počet jedinců"] = result["Jedinci"].round(2)
+    if by is not None:
+        histogram.insert(0, by, np.repeat(np.asarray(groups, dtype="object"), len(labels)))
+    return histogram
+
+
+def phenology_from_table(phenology: pd.DataFrame, species, date_from, date_to, with_counts: bool = True) -> pd.DataFrame:
+    """
+    Měsíční fenologie druhů species z předpočítané tabulky (build_phenology) po celých
+    měsících od date_from do date_to (viz month_aligned). Stejné sloupce jako
+    phenology_histogram(..., by="Druh").
+    """
+    rows = phenology[phenology["Druh"].isin(species)].astype({"Druh": "object"})
+    period = rows["Rok"].astype(int) * 12 + rows["Měsíc"].astype(int)
+    rows = rows[
+        (period >= date_from.year * 12 + date_from.month) &
+        (period <= date_to.year * 12 + date_to.month)
+    ]
+    monthly = rows.groupby(["Druh", rows["Měsíc"].astype(int)])[["Pozorování", "Jedinci"]].sum()
+    monthly.columns = ["Počet pozorování", "Počet jedinců"]
+    index = pd.MultiIndex.from_product([list(species), list(MONTH_NAMES)], names=["Druh", "Měsíc"])
+    monthly = monthly.reindex(index, fill_value=0).round(2).reset_index()
+    monthly["Měsíc"] = monthly["Měsíc"].map(MONTH_NAMES)
+    if not with_counts:
+        monthly = monthly.drop(columns=["Počet jedinců"])
+    return monthly
+
+
+# ========================
+# Obsazenost kvadrátů (síťové mapy)
+# ========================
+# Pro každý druh a rok se předpočítá množina obsazených mapovacích kvadrátů jako
+# bitová mapa (jeden bit za kvadrát). Rozšíření druhu, druhová bohatost kvadrátů,
+# nově obsazené a opuštěné kvadráty i spoluvýskyt druhů jsou pak jen bitové
+# operace nad malým polem, ne groupby nad všemi záznamy.
+# Unikátní trojice (Druh, Rok, Kvadrát) se ukládají vedle snapshotu
+# (uploaded_file.occupancy.parquet) se stejným otiskem CSV.
+OCCUPANCY_SUFFIX = ".occupancy.parquet"
+# Počet jedniček v bajtu (pro rychlé sčítání bitů)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def build_occupancy_triples(df: pd.DataFrame) -> pd.DataFrame:
+    """Unikátní trojice (Druh, Rok, Kvadrát) ze záznamů s datem a kvadrátem."""
+    columns = ["Druh", "Rok", "Kvadrát"]
+    if df.empty or not {"Druh", "Datum", "Kvadrát"} <= set(df.columns):
+        return pd.DataFrame({col: pd.Series(dtype="object") for col in columns})
+    frame = pd.DataFrame({
+        "Druh": df["Druh"],
+        "Rok": df["Datum"].dt.year.astype("Int16"),
+        "Kvadrát": df["Kvadrát"],
+    })
+    frame = frame[frame["Rok"].notna().to_numpy() & ~frame["Kvadrát"].isin([""]).to_numpy()]
+    return frame.drop_duplicates().reset_index(drop=True)
+
+
+class Occupancy:
+    """
+    Obsazené kvadráty po druzích a letech: bits[druh, rok] je bitová mapa kvadrátů
+    (pořadí podle squares). Období se zadává rozsahem let (year_from, year_to, včetně).
+    """
+
+    def __init__(self, triples: pd.DataFrame):
+        triples = triples.dropna()
+        species_codes, self.species = self.factorize(triples["Druh"])
+        square_codes, self.squares = self.factorize(triples["Kvadrát"])
+        year_codes, years = pd.factorize(triples["Rok"].astype(int), sort=True)
+        self.years = np.asarray(years, dtype="int64")
+
+        # Bity se nastavují přímo v zabalených bajtech (pořadí jako np.packbits: nejvyšší bit = první kvadrát),
+        # bez mezikroku s polem bool o jednom bajtu za kvadrát
+        self.bits = np.zeros((len(self.species), len(self.years), (len(self.squares) + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(
+            self.bits, (species_codes, year_codes, square_codes >> 3), (0x80 >> (square_codes & 7)).astype(np.uint8)
+        )
+
+    @staticmethod
+    def factorize(values: pd.Series):
+        """Kódy hodnot a jejich abecedně seřazený seznam (u category bez převodu všech řádků na text)."""
+        codes, uniques = pd.factorize(values)
+        uniques = np.asarray(uniques, dtype="object").astype(str)
+        order = np.argsort(uniques, kind="stable")
+        rank = np.empty(len(order), dtype=np.intp)
+        rank[order] = np.arange(len(order))
+        return rank[codes], pd.Index(uniques[order])
+
+    @property
+    def empty(self) -> bool:
+        return len(self.squares) == 0
+
+    def year_mask(self, year_from=None, year_to=None) -> np.ndarray:
+        """Které roky z years patří do období (None = bez omezení)."""
+        mask = np.ones(len(self.years), dtype=bool)
+        if year_from is not None:
+            mask &= self.years >= year_from
+        if year_to is not None:
+            mask &= self.years <= year_to
+        return mask
+
+    def period(self, year_from=None, year_to=None) -> np.ndarray:
+        """Bitové mapy všech druhů za období (kvadrát obsazený aspoň v jednom roce)."""
+        mask = self.year_mask(year_from, year_to)
+        if not mask.any():
+            return np.zeros((self.bits.shape[0], self.bits.shape[2]), dtype=np.uint8)
+        return np.bitwise_or.reduce(self.bits[:, mask, :], axis=1)
+
+    def unpack(self, bits: np.ndarray) -> np.ndarray:
+        """Bitové mapy -> pole bool s jedním prvkem za kvadrát (poslední osa)."""
+        return np.unpackbits(bits, axis=-1, count=len(self.squares)).astype(bool)
+
+    def species_position(self, species: str):
+        """Pozice druhu v species (None, pokud druh nemá žádný kvadrát)."""
+        position = self.species.get_indexer([species])[0]
+        return None if position < 0 else position
+
+    def distribution(self, species: str, year_from=None, year_to=None) -> pd.DataFrame:
+        """Kvadráty obsazené druhem v období a počet let, ve kterých byl v kvadrátu zjištěn."""
+        position = self.species_position(species)
+        if position is None:
+            return pd.DataFrame({"Kvadrát": pd.Series(dtype="object"), "Počet let": pd.Series(dtype="int64")})
+        years_present = self.unpack(self.bits[position, self.year_mask(year_from, year_to), :]).sum(axis=0)
+        occupied = np.flatnonzero(years_present)
+        return pd.DataFrame({"Kvadrát": self.squares[occupied], "Počet let": years_present[occupied].astype("int64")})
+
+    def richness(self, year_from=None, year_to=None) -> pd.DataFrame:
+        """Druhová bohatost: počet druhů zjištěných v jednotlivých kvadrátech za období."""
+        counts = self.unpack(self.period(year_from, year_to)).sum(axis=0)
+        occupied = np.flatnonzero(counts)
+        return pd.DataFrame({"Kvadrát": self.squares[occupied], "Počet druhů": counts[occupied].astype("int64")})
+
+    def changes(self, species: str, before: tuple, after: tuple) -> pd.DataFrame:
+        """
+        Kvadráty druhu ve dvou obdobích (before, after = (rok od, rok do)) se stavem
+        "nově obsazený", "opuštěný" nebo "trvale obsazený".
+        """
+        position = self.species_position(species)
+        if position is None:
+            return pd.DataFrame({"Kvadrát": pd.Series(dtype="object"), "Stav": pd.Series(dtype="object")})
+        old = self.unpack(self.period(*before)[position])
+        new = self.unpack(self.period(*after)[position])
+        status = np.select([new & ~old, old & ~new, old & new], ["nově obsazený", "opuštěný", "trvale obsazený"], "")
+        occupied = np.flatnonzero(old | new)
+        return pd.DataFrame({"Kvadrát": self.squares[occupied], "Stav": status[occupied]})
+
+    def change_summary(self, before: tuple, after: tuple) -> pd.DataFrame:
+        """Počty obsazených, nově obsazených a opuštěných kvadrátů pro všechny druhy najednou."""
+        old = self.period(*before)
+        new = self.period(*after)
+        summary = pd.DataFrame({
+            "Druh": self.species,
+            "Kvadráty před": POPCOUNT[old].sum(axis=1, dtype="int64"),
+            "Kvadráty po": POPCOUNT[new].sum(axis=1, dtype="int64"),
+            "Nově obsazené": POPCOUNT[new & ~old].sum(axis=1, dtype="int64"),
+            "Opuštěné": POPCOUNT[old & ~new].sum(axis=1, dtype="int64"),
+        })
+        summary["Změna"] = summary["Kvadráty po"] - summary["Kvadráty před"]
+        return summary[(summary["Kvadráty před"] > 0) | (summary["Kvadráty po"] > 0)].reset_index(drop=True)
+
+    def cooccurrence(self, species: str, year_from=None, year_to=None) -> pd.DataFrame:
+        """
+        Druhy, které v období sdílí kvadráty s druhem species: počet společných kvadrátů
+        a Jaccardův index (společné / obsazené aspoň jedním z dvojice), seřazeno sestupně.
+        """
+        columns = {"Druh": "object", "Společné kvadráty": "int64", "Jaccard": "float64"}
+        position = self.species_position(species)
+        if position is None:
+            return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in columns.items()})
+        bits = self.period(year_from, year_to)
+        shared = POPCOUNT[bits & bits[position]].sum(axis=1, dtype="int64")
+        union = POPCOUNT[bits | bits[position]].sum(axis=1, dtype="int64")
+        result = pd.DataFrame({
+            "Druh": self.species,
+            "Společné kvadráty": shared,
+            "Jaccard": (shared / np.maximum(union, 1)).round(3),
+        })
+        result = result[(result["Společné kvadráty"] > 0) & (result.index != position)]
+        return result.sort_values(["Společné kvadráty", "Jaccard"], ascending=False).reset_index(drop=True)
+
+
+def kvadrat_bounds(squares) -> pd.DataFrame:
+    """
+    Hranice kvadrátů síťového mapování (KFME, kód "řřss": řada a sloupec) ve WGS84:
+    kvadrát má 10' zeměpisné délky × 6' šířky, řada 00 začíná na 56° s. š., sloupec 00 na 5°40' v. d.
+    Kódy v jiném tvaru mají hranice NaN.
+
+    Kvadrát 5952 pokrývá Prahu (50,0-50,1° s. š., 14,333-14,5° v. d.):
+
+    >>> kvadrat_bounds(["5952"]).round(3).iloc[0].tolist()
+    [50.0, 14.333, 50.1, 14.5]
+    """
+    parts = pd.Series(squares, dtype="object").astype(str).str.extract(r"^(\d{2})(\d{2})").astype("float64")
+    north = 56 - parts[0] / 10
+    west = 5 + 40 / 60 + parts[1] / 6
+    return pd.DataFrame({"south": north - 0.1, "west": west, "north": north, "east": west + 1 / 6})
+
+
+# ========================
+# Trendy druhů očištěné o úsilí
+# ========================
+# Počty pozorování rostou hlavně s počtem pozorovatelů, proto se trend druhu počítá
+# z podílu na celkovém úsilí v roce: podíl záznamů, podíl aktivních pozorovatelů, kteří
+# druh zaznamenali, a podíl navštívených kvadrátů, kde byl zjištěn. Matice druh × rok se
+# sestaví jednou (z kostky, obsazenosti kvadrátů a počtů pozorovatelů) a trendy všech
+# druhů jsou pak jedna lineární regrese nad celou maticí najednou.
+# Počty pozorovatelů se ukládají vedle snapshotu (uploaded_file.observers.parquet).
+OBSERVERS_SUFFIX = ".observers.parquet"
+# Míry úsilí: název matice v SpeciesTrends -> popisek ve výsledcích
+TREND_MEASURES = {"observations": "záznamů", "observers": "pozorovatelů", "squares": "kvadrátů"}
+
+
+def build_observer_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Počet různých pozorovatelů druhu v roce (Druh, Rok, Pozorovatelé). Řádky s prázdným
+    Druh obsahují počet všech aktivních pozorovatelů v roce (úsilí pro normalizaci).
+    """
+    columns = {"Druh": "object", "Rok": "int16", "Pozorovatelé": "int64"}
+    if df.empty or not {"Druh", "Datum", "Pozorovatel"} <= set(df.columns):
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in columns.items()})
+
+    species_codes, species = pd.factorize(df["Druh"])
+    observer_codes, observers = pd.factorize(df["Pozorovatel"])
+    years = df["Datum"].dt.year.to_numpy(dtype="float64")
+    valid = (species_codes >= 0) & (observer_codes >= 0) & ~np.isnan(years)
+    blank = np.flatnonzero(np.asarray(observers, dtype="object") == "")
+    valid &= ~np.isin(observer_codes, blank)
+    year_min = int(years[valid].min()) if valid.any() else 0
+    year_codes = years[valid].astype(np.int64) - year_min
+    n_years = int(year_codes.max()) + 1 if valid.any() else 0
+
+    # Unikátní dvojice (rok, pozorovatel) a trojice (druh, rok, pozorovatel) jako celočíselné
+    # klíče; pd.unique (hašování) je tu výrazně rychlejší než np.unique
+    year_observer = year_codes * len(observers) + observer_codes[valid]
+    totals = np.bincount(pd.unique(year_observer) // len(observers), minlength=n_years)
+    triples = pd.unique(species_codes[valid].astype(np.int64) * (n_years * len(observers)) + year_observer)
+    counts = np.bincount(triples // len(observers), minlength=len(species) * n_years)
+    pairs = np.flatnonzero(counts)
+    counts = counts[pairs]
+
+    per_species = pd.DataFrame({
+        "Druh": np.asarray(species, dtype="object")[pairs // n_years],
+        "Rok": (pairs % n_years + year_min).astype("int16"),
+        "Pozorovatelé": counts.astype("int64"),
+    })
+    per_year = pd.DataFrame({
+        "Druh": None,
+        "Rok": (np.flatnonzero(totals) + year_min).astype("int16"),
+        "Pozorovatelé": totals[totals > 0].astype("int64"),
+    })
+    return pd.concat([per_species, per_year], ignore_index=True).astype(columns)
+
+
+def species_year_matrix(species: pd.Index, years: np.ndarray, rows_species, rows_years, values) -> np.ndarray:
+    """Matice druh × rok ze sloupců dlouhé tabulky (řádky s neznámým druhem nebo rokem se vynechají)."""
+    species_positions = species.get_indexer(rows_species)
+    year_positions = pd.Index(years).get_indexer(rows_years)
+    keep = (species_positions >= 0) & (year_positions >= 0)
+    matrix = np.zeros((len(species), len(years)), dtype="float64")
+    np.add.at(matrix, (species_positions[keep], year_positions[keep]), np.asarray(values, dtype="float64")[keep])
+    return matrix
+
+
+class SpeciesTrends:
+    """
+    Matice druh × rok (počty záznamů, pozorovatelů a obsazených kvadrátů) a celkové
+    úsilí v jednotlivých letech; ranking() z nich spočítá trendy všech druhů najednou.
+    """
+
+    def __init__(self, cube: pd.DataFrame, occupancy: Occupancy, observers: pd.DataFrame):
+        rows = cube.dropna(subset=["Rok"])
+        self.species = pd.Index(sorted(rows["Druh"].astype(str).unique()))
+        self.years = np.array(sorted(rows["Rok"].astype(int).unique()), dtype="int64")
+        self.counts = {
+            "observations": species_year_matrix(
+                self.species, self.years, rows["Druh"].astype(str), rows["Rok"].astype(int), rows["Pozorování"]
+            ),
+        }
+        self.effort = {"observations": self.counts["observations"].sum(axis=0)}
+
+        per_species = observers[observers["Druh"].notna()]
+        per_year = observers[observers["Druh"].isna()]
+        self.counts["observers"] = species_year_matrix(
+            self.species, self.years, per_species["Druh"].astype(str), per_species["Rok"].astype(int), per_species["Pozorovatelé"]
+        )
+        self.effort["observers"] = (
+            pd.Series(per_year["Pozorovatelé"].to_numpy(), index=per_year["Rok"].astype(int).to_numpy())
+            .reindex(self.years, fill_value=0).to_numpy(dtype="float64")
+        )
+
+        # Kvadráty druhu v roce a všechny navštívené kvadráty v roce rovnou z bitových map
+        squares = POPCOUNT[occupancy.bits].sum(axis=2, dtype="int64")
+        species_positions = self.species.get_indexer(occupancy.species)
+        year_positions = pd.Index(self.years).get_indexer(occupancy.years)
+        self.counts["squares"] = np.zeros((len(self.species), len(self.years)), dtype="float64")
+        self.effort["squares"] = np.zeros(len(self.years), dtype="float64")
+        if not occupancy.empty:
+            known_species = species_positions >= 0
+            known_years = year_positions >= 0
+            self.counts["squares"][np.ix_(species_positions[known_species], year_positions[known_years])] = (
+                squares[np.ix_(known_species, known_years)]
+            )
+            visited = np.bitwise_or.reduce(occupancy.bits, axis=0)
+            self.effort["squares"][year_positions[known_years]] = POPCOUNT[visited[known_years]].sum(axis=1)
+
+    def shares(self, measure: str, year_from=None, year_to=None):
+        """Podíly druhů na úsilí v letech období (matice druh × rok) a vybrané roky."""
+        mask = np.ones(len(self.years), dtype=bool)
+        if year_from is not None:
+            mask &= self.years >= year_from
+        if year_to is not None:
+            mask &= self.years <= year_to
+        mask &= self.effort[measure] > 0  # Roky bez úsilí (např. bez kvadrátů) se do trendu nepočítají
+        return self.counts[measure][:, mask] / self.effort[measure][mask], self.years[mask]
+
+    def species_shares(self, species: str, year_from=None, year_to=None) -> pd.DataFrame:
+        """Podíly jednoho druhu v jednotlivých letech pro všechny míry úsilí (v procentech, pro graf)."""
+        position = self.species.get_indexer([species])[0]
+        frames = []
+        for measure, label in TREND_MEASURES.items():
+            shares, years = self.shares(measure, year_from, year_to)
+            values = shares[position] * 100 if position >= 0 else np.zeros(len(years))
+            frames.append(pd.DataFrame({"Rok": years, "Míra": f"Podíl {label}", "Podíl (%)": values.round(3)}))
+        return pd.concat(frames, ignore_index=True)
+
+    def ranking(self, year_from=None, year_to=None) -> pd.DataFrame:
+        """
+        Trendy všech druhů v období: pro každou míru úsilí sklon lineární regrese podílu
+        na roce vztažený k průměrnému podílu (%/rok; kladný = druh přibývá nezávisle na
+        růstu úsilí). Druhy s méně než dvěma roky dat mají trend NaN.
+        """
+        result = pd.DataFrame({"Druh": self.species.to_numpy(dtype="object")})
+        observations, years = self.shares("observations", year_from, year_to)
+        year_mask = np.isin(self.years, years)
+        result["Záznamů"] = self.counts["observations"][:, year_mask].sum(axis=1).astype("int64")
+        result["Roků s výskytem"] = (self.counts["observations"][:, year_mask] > 0).sum(axis=1)
+
+        for measure, label in TREND_MEASURES.items():
+            shares, years = self.shares(measure, year_from, year_to)
+            if len(years) < 2:
+                result[f"Trend podílu {label} (%/rok)"] = np.nan
+                continue
+            # Sklon OLS pro všechny druhy najednou: cov(rok, podíl) / var(rok)
+            x = years - years.mean()
+            mean = shares.mean(axis=1)
+            slope = (shares - mean[:, None]) @ x / (x @ x)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                relative = np.where(mean > 0, slope / mean * 100, np.nan)
+            result[f"Trend podílu {label} (%/rok)"] = relative.round(2)
+
+        result.loc[result["Roků s výskytem"] < 2, [col for col in result.columns if col.startswith("Trend")]] = np.nan
+        return result[result["Záznamů"] > 0].reset_index(drop=True)
+
+
+# ========================
+# Prostorový index bodů pozorování
+# ========================
+# Body (WGS84) se jednou při načtení seřadí podle buňky pravidelné mřížky. Okruh kolem
+# bodu i výřez mapy pak projdou jen souvislé úseky bodů v dotčených buňkách (jeden úsek
+# za řadu buněk, dohledaný binárně), takže dotaz stojí úměrně počtu nalezených bodů,
+# ne počtu všech záznamů.
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180  # Délka jednoho stupně zeměpisné šířky (na téže kouli jako haversine_km)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Vzdálenost bodů po povrchu Země v km (vstupy ve stupních, funguje i po prvcích polí)."""
+    lat1, lng1, lat2, lng2 = (np.radians(value) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def radius_box(lat: float, lng: float, radius_km: float, pad: float = 0.0):
+    """
+    Obdélník (south, west, north, east) ve stupních, který obsahuje celý kruh o poloměru
+    radius_km kolem bodu, rozšířený o pad stupňů na každou stranu. Šířka se bere podle
+    rovnoběžky nejdál od rovníku (tam je stupeň délky nejkratší).
+    """
+    d_lat = radius_km / KM_PER_DEGREE
+    far_lat = min(abs(lat) + d_lat, 90)
+    d_lng = min(radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(far_lat)), 1e-6)), 180)
+    return lat - d_lat - pad, lng - d_lng - pad, lat + d_lat + pad, lng + d_lng + pad
+
+
+def concat_ranges(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """Spojené rozsahy starts[i]..stops[i] (bez stops[i]) jako jedno pole pozic."""
+    lengths = stops - starts
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.intp)
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+class SpatialIndex:
+    """
+    Mřížkový index bodů pozorování ve WGS84 (buňky o straně cell_size stupňů, viz SPATIAL).
+    Dotazy vrací pozice řádků v datech (vzestupně), body bez souřadnic se neindexují.
+    """
+
+    def __init__(self, lat, lng, cell_size: float = None):
+        self.cell_size = cell_size or SPATIAL['cell_size']
+        lat = np.asarray(lat, dtype="float64")
+        lng = np.asarray(lng, dtype="float64")
+        valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lng))
+        rows = np.floor(lat[valid] / self.cell_size).astype(np.int64)
+        cols = np.floor(lng[valid] / self.cell_size).astype(np.int64)
+        self.row_min = int(rows.min()) if len(valid) else 0
+        self.col_min = int(cols.min()) if len(valid) else 0
+        self.n_rows = int(rows.max()) - self.row_min + 1 if len(valid) else 0
+        self.n_cols = int(cols.max()) - self.col_min + 1 if len(valid) else 0
+
+        cells = (rows - self.row_min) * self.n_cols + (cols - self.col_min)
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.positions = valid[order]
+        self.lat = lat[self.positions]
+        self.lng = lng[self.positions]
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def candidates(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Pozice v indexu (ne v datech) všech bodů v buňkách, které obdélník zasahuje."""
+        row_from = max(int(np.floor(south / self.cell_size)) - self.row_min, 0)
+        row_to = min(int(np.floor(north / self.cell_size)) - self.row_min, self.n_rows - 1)
+        col_from = max(int(np.floor(west / self.cell_size)) - self.col_min, 0)
+        col_to = min(int(np.floor(east / self.cell_size)) - self.col_min, self.n_cols - 1)
+        if row_from > row_to or col_from > col_to:
+            return np.empty(0, dtype=np.intp)
+        # Buňky jedné řady s po sobě jdoucími sloupci tvoří v seřazeném indexu souvislý úsek
+        first_cells = np.arange(row_from, row_to + 1) * self.n_cols
+        starts = np.searchsorted(self.cells, first_cells + col_from, side="left")
+        stops = np.searchsorted(self.cells, first_cells + col_to, side="right")
+        return concat_ranges(starts, stops)
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Pozice řádků s body uvnitř obdélníku (včetně hranic)."""
+        found = self.candidates(south, west, north, east)
+        inside = (
+            (self.lat[found] >= south) & (self.lat[found] <= north) &
+            (self.lng[found] >= west) & (self.lng[found] <= east)
+        )
+        return np.sort(self.positions[found[inside]])
+
+    def radius(self, lat: float, lng: float, radius_km: float):
+        """Pozice řádků do vzdálenosti radius_km od bodu a jejich vzdálenosti v km (seřazené podle pozice)."""
+        # Obdélník kolem kruhu navíc o buňku na každou stranu; přesná vzdálenost se ověří haversine_km
+        found = self.candidates(*radius_box(lat, lng, radius_km, self.cell_size))
+        distances = haversine_km(lat, lng, self.lat[found], self.lng[found])
+        inside = distances <= radius_km
+        order = np.argsort(self.positions[found[inside]])
+        return self.positions[found[inside]][order], distances[inside][order]
+
+
+def area_species_summary(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Druhy zjištěné v oblasti (vstup z Dataset.select_radius / select_bbox): počet pozorování,
+    jedinců, poslední pozorování a nejmenší vzdálenost od středu, seřazeno podle počtu.
+    """
+    aggregations = {"Počet pozorování": ("Druh", "size")}
+    if "Počet" in data.columns:
+        aggregations["Počet jedinců"] = ("Počet", "sum")
+    if "Datum" in data.columns:
+        aggregations["Poslední pozorování"] = ("Datum", "max")
+    if "Vzdálenost (km)" in data.columns:
+        aggregations["Nejblíže (km)"] = ("Vzdálenost (km)", "min")
+    if data.empty or "Druh" not in data.columns:
+        return pd.DataFrame(columns=["Druh", *aggregations])
+
+    summary = data.groupby("Druh", observed=True).agg(**aggregations).reset_index()
+    if "Poslední pozorování" in summary.columns:
+        summary["Poslední pozorování"] = summary["Poslední pozorování"].dt.date
+    if "Nejblíže (km)" in summary.columns:
+        summary["Nejblíže (km)"] = summary["Nejblíže (km)"].round(2)
+    summary["Druh"] = summary["Druh"].astype("object")
+    return summary.sort_values(["Počet pozorování", "Druh"], ascending=[False, True]).reset_index(drop=True)
+
+
+# ========================
+# Heatmapa: agregace bodů do mřížky
+# ========================
+# Místo každé unikátní souřadnice se do HeatMap posílá jen jeden bod za buňku
+# mřížky (se součtem Počet), takže velikost stránky nezávisí na počtu pozorování.
+def bin_points_degrees(data: pd.DataFrame, weights: pd.Series, cell_size: float, max_points: int) -> pd.DataFrame:
+    """
+    Sečte váhy do čtverců cell_size × cell_size stupňů (bod = střed buňky).
+    Dokud je buněk víc než max_points, velikost buňky se zdvojnásobuje.
+    """
+    lat = data["Zeměpisná šířka"].to_numpy(dtype="float64")
+    lng = data["Zeměpisná délka"].to_numpy(dtype="float64")
+    while True:
+        row = np.floor(lat / cell_size)
+        col = np.floor(lng / cell_size)
+        binned = (
+            pd.DataFrame({"row": row, "col": col, "weight": weights.to_numpy()})
+            .groupby(["row", "col"], sort=False)["weight"].sum()
+            .reset_index()
+        )
+        if len(binned) <= max_points:
+            break
+        cell_size *= 2
+    return pd.DataFrame({
+        "lat": ((binned["row"] + 0.5) * cell_size).round(5),
+        "lng": ((binned["col"] + 0.5) * cell_size).round(5),
+        "weight": binned["weight"],
+    })
+
+
+def bin_points_kvadrat(data: pd.DataFrame, weights: pd.Series, max_points: int) -> pd.DataFrame:
+    """
+    Sečte váhy po mapovacích kvadrátech (bod = průměrná poloha pozorování v kvadrátu).
+    Při překročení max_points se ponechají kvadráty s největším součtem.
+    """
+    binned = (
+        pd.DataFrame({
+            "kvadrat": data["Kvadrát"].astype(str).to_numpy(),
+            "lat": data["Zeměpisná šířka"].to_numpy(dtype="float64"),
+            "lng": data["Zeměpisná délka"].to_numpy(dtype="float64"),
+            "weight": weights.to_numpy(),
+        })
+        .groupby("kvadrat", sort=False)
+        .agg(lat=("lat", "mean"), lng=("lng", "mean"), weight=("weight", "sum"))
+        .reset_index(drop=True)
+    )
+    binned[["lat", "lng"]] = binned[["lat", "lng"]].round(5)
+    if len(binned) > max_points:
+        binned = binned.nlargest(max_points, "weight")
+    return binned
+
+
+def bin_heatmap_points(data: pd.DataFrame, grid: str = None, cell_size: float = None, max_points: int = None) -> pd.DataFrame:
+    """
+    Připraví body pro HeatMap: DataFrame (lat, lng, weight) s nejvýše max_points řádky.
+    Váha je součet Počet (nebo počet pozorování, pokud sloupec Počet chybí).
+    Výchozí hodnoty parametrů jsou v HEATMAP.
+    """
+    grid = grid or HEATMAP['grid']
+    cell_size = cell_size or HEATMAP['cell_size']
+    max_points = max_points or HEATMAP['max_points']
+
+    data = data.dropna(subset=["Zeměpisná šířka", "Zeměpisná délka"])
+    if data.empty:
+        return pd.DataFrame(columns=["lat", "lng", "weight"])
+    weights = data["Počet"] if "Počet" in data.columns else pd.Series(1, index=data.index)
+
+    if grid == 'kvadrat' and "Kvadrát" in data.columns:
+        # Záznamy bez kvadrátu se sčítají do stupňové mřížky, aby z mapy nezmizely
+        has_square = data["Kvadrát"].astype(str) != ""
+        parts = [bin_points_kvadrat(data[has_square], weights[has_square], max_points)]
+        if not has_square.all():
+            parts.append(bin_points_degrees(data[~has_square], weights[~has_square], cell_size, max_points))
+        binned = pd.concat(parts, ignore_index=True)
+        if len(binned) > max_points:
+            binned = binned.nlargest(max_points, "weight")
+        return binned
+
+    return bin_points_degrees(data, weights, cell_size, max_points)
+
+
+# Barvy vrstev heatmapy po druzích (stejné lze použít v grafech porovnání druhů)
+LAYER_COLORS = [
+    "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf",
+]
+
+
+def heatmap_html(data: pd.DataFrame, by: str = None) -> str:
+    """
+    Vykreslí heatmapu pozorování do HTML (stejný výstup jako folium_static).
+    S by (např. "Druh") vykreslí každou skupinu jako samostatnou vrstvu ve vlastní
+    barvě (viz LAYER_COLORS), kterou lze v mapě vypnout.
+    """
+    # folium se importuje až tady - pracovní procesy pro export po částech ho nepotřebují
+    import folium
+    from folium.plugins import HeatMap
+
+    if "Zeměpisná šířka" in data.columns and "Zeměpisná délka" in data.columns:
+        map_center = [
+            data["Zeměpisná šířka"].mean(),
+            data["Zeměpisná délka"].mean()
+        ]
+    else:
+        map_center = [49.40099, 15.67521]
+
+    heat_map = folium.Map(location=map_center, zoom_start=8)
+
+    if by is not None and by in data.columns:
+        # Vrstva za skupinu; body se sčítají do mřížky po skupinách z jednoho groupby
+        for i, (name, group) in enumerate(data.groupby(by, observed=True, sort=False)):
+            color = LAYER_COLORS[i % len(LAYER_COLORS)]
+            layer = folium.FeatureGroup(name=str(name))
+            HeatMap(bin_heatmap_points(group).values.tolist(), radius=10, gradient={0.4: color, 1: color}).add_to(layer)
+            layer.add_to(heat_map)
+        folium.LayerControl(collapsed=False).add_to(heat_map)
+        return folium.Figure().add_child(heat_map).render()
+
+    # Body sečteme do mřížky (součet Počet za buňku, nejvýše HEATMAP['max_points'] bodů)
+    heat_agg = bin_heatmap_points(data)
+
+    heat_data = heat_agg.values.tolist()
+    HeatMap(heat_data, radius=10).add_to(heat_map)
+    return folium.Figure().add_child(heat_map).render()
+
+
+# Barevná škála síťových map (od nejnižší hodnoty k nejvyšší)
+SQUARE_COLORS = ["#ffffcc", "#ffeda0", "#fed976", "#feb24c", "#fd8d3c", "#fc4e2a", "#e31a1c", "#b10026"]
+
+
+def value_colors(values: pd.Series) -> pd.Series:
+    """Barvy ze SQUARE_COLORS podle hodnoty (lineárně mezi nejmenší a největší hodnotou)."""
+    values = pd.Series(values, dtype="float64")
+    low, high = values.min(), values.max()
+    scaled = (values - low) / (high - low) if high > low else values * 0 + 1
+    positions = (scaled * (len(SQUARE_COLORS) - 1)).round().astype(int)
+    return positions.map(dict(enumerate(SQUARE_COLORS)))
+
+
+def squares_map_html(squares: pd.DataFrame, color: str, tooltip: str = None) -> str:
+    """
+    Síťová mapa: vybarvené kvadráty (sloupec Kvadrát) do HTML. color = sloupec s barvou
+    kvadrátu, tooltip = sloupec s textem při najetí myší (kromě kódu kvadrátu).
+    Kvadráty, jejichž kód neodpovídá síti KFME, se vynechají (viz kvadrat_bounds).
+    """
+    import folium
+
+    bounds = kvadrat_bounds(squares["Kvadrát"]).set_index(squares.index)
+    squares = squares[bounds["north"].notna()]
+    bounds = bounds.loc[squares.index]
+    if squares.empty:
+        center = [49.8, 15.5]
+    else:
+        center = [(bounds["south"].min() + bounds["north"].max()) / 2, (bounds["west"].min() + bounds["east"].max()) / 2]
+
+    square_map = folium.Map(location=center, zoom_start=7)
+    for (square, fill, text), (south, west, north, east) in zip(
+        squares[["Kvadrát", color, tooltip or color]].itertuples(index=False, name=None),
+        bounds[["south", "west", "north", "east"]].itertuples(index=False, name=None),
+    ):
+        folium.Rectangle(
+            bounds=[[south, west], [north, east]],
+            color="#555555", weight=0.5, fill=True, fill_color=fill, fill_opacity=0.7,
+            tooltip=f"{square}: {text}" if tooltip else str(square),
+        ).add_to(square_map)
+    return folium.Figure().add_child(square_map).render()
+
+
+# ========================
+# Animovaná heatmapa: předpočítané snímky po měsících
+# ========================
+# Záznamy všech druhů se jednou sečtou do tabulky (Druh, Rok, Měsíc, buňka mřížky) -> Váha
+# (součet Počet jako u heatmapy). Snímky animace po měsících nebo letech se pak jen
+# vyříznou z bloku druhu (a pro roky sečtou), bez průchodu záznamy. Všechny snímky
+# jdou do jednoho HTML dokumentu, takže posun na časové ose neprovádí v aplikaci nic.
+FRAME_PERIODS = {"month": "Měsíc", "year": "Rok"}
+
+
+def frames_suffix(cell_size: float = None) -> str:
+    """Přípona snapshotu snímků; obsahuje velikost buňky, aby se po změně konfigurace sestavil znovu."""
+    return f".frames{cell_size or HEATMAP['frame_cell_size']:g}.parquet"
+
+
+def build_heatmap_frames(df: pd.DataFrame, cell_size: float = None) -> pd.DataFrame:
+    """
+    Sestaví tabulku (Druh, Rok, Měsíc, Řada, Sloupec) -> Váha, kde Řada a Sloupec jsou
+    indexy buňky cell_size × cell_size stupňů (výchozí HEATMAP['frame_cell_size']).
+    Měsíc se bere z Datum; záznamy bez data nebo souřadnic se vynechají.
+    """
+    cell_size = cell_size or HEATMAP['frame_cell_size']
+    dtypes = {"Druh": "object", "Rok": "int16", "Měsíc": "int8", "Řada": "int32", "Sloupec": "int32", "Váha": "float32"}
+    if df.empty or not {"Druh", "Datum", "Zeměpisná šířka", "Zeměpisná délka"} <= set(df.columns):
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+
+    lat = df["Zeměpisná šířka"].to_numpy(dtype="float64")
+    lng = df["Zeměpisná délka"].to_numpy(dtype="float64")
+    dates = df["Datum"]
+    keep = dates.notna().to_numpy() & df["Druh"].notna().to_numpy() & ~np.isnan(lat) & ~np.isnan(lng)
+    frame = pd.DataFrame({
+        "Druh": df["Druh"].array[keep],
+        "Rok": dates.dt.year.to_numpy()[keep].astype("int16"),
+        "Měsíc": dates.dt.month.to_numpy()[keep].astype("int8"),
+        "Řada": np.floor(lat[keep] / cell_size).astype("int32"),
+        "Sloupec": np.floor(lng[keep] / cell_size).astype("int32"),
+        "Váha": df["Počet"].to_numpy(dtype="float64")[keep] if "Počet" in df.columns else 1.0,
+    })
+    frames = frame.groupby(["Druh", "Rok", "Měsíc", "Řada", "Sloupec"], observed=True)["Váha"].sum().reset_index()
+    return frames.astype({"Váha": "float32"})
+
+
+def update_heatmap_frames(frames: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+    """Upraví tabulku snímků heatmapy o rozdíl dat (jako update_cube; váhy buněk se sčítají)."""
+    keys = ["Druh", "Rok", "Měsíc", "Řada", "Sloupec"]
+    merged = update_sums(frames.astype({"Váha": "float64"}), removed, added, build_heatmap_frames, keys, ["Váha"])
+    if merged is None:
+        return frames
+    return merged.astype({"Druh": "category", "Rok": "int16", "Měsíc": "int8", "Řada": "int32", "Sloupec": "int32",
+                          "Váha": "float32"})
+
+
+class HeatmapFrames:
+    """
+    Snímky animované heatmapy ve sloupcových polích: každý druh je souvislý blok řádků
+    seřazený podle měsíce (rok * 12 + měsíc - 1), takže výběr rozsahu dat je binární
+    hledání v bloku druhu.
+    """
+
+    def __init__(self, table: pd.DataFrame, cell_size: float = None):
+        self.cell_size = cell_size or HEATMAP['frame_cell_size']
+        species_codes, species = pd.factorize(table["Druh"], sort=True)
+        months = table["Rok"].to_numpy(dtype="int32") * 12 + table["Měsíc"].to_numpy(dtype="int32") - 1
+        order = np.lexsort((months, species_codes))
+        self.months = months[order]
+        self.rows = table["Řada"].to_numpy(dtype="int32")[order]
+        self.cols = table["Sloupec"].to_numpy(dtype="int32")[order]
+        self.weights = table["Váha"].to_numpy(dtype="float32")[order]
+        bounds = np.searchsorted(species_codes[order], np.arange(len(species) + 1))
+        self.blocks = {name: (bounds[i], bounds[i + 1]) for i, name in enumerate(species)}
+
+    def frames(self, species: str, date_from, date_to, period: str = "month", max_cells: int = None,
+               max_total: int = None) -> dict:
+        """
+        Snímky druhu species po měsících nebo letech (period, viz FRAME_PERIODS) od prvního
+        do posledního období s daty v rozsahu date_from..date_to (po celých měsících).
+        Vrací {"index": popisky snímků, "data": seznam snímků [[lat, lng, váha], ...]};
+        váhy jsou vydělené největší váhou ze všech snímků (0-1, jednotná škála celé animace).
+        V každém snímku zůstane nejvýše max_cells nejsilnějších buněk a nejvýše max_total
+        bodů celkem (výchozí HEATMAP['frame_max_cells'] a HEATMAP['frame_max_total']).
+        """
+        if period not in FRAME_PERIODS:
+            raise ValueError(f"Neznámé období animace: {period}")
+        max_cells = max_cells or HEATMAP['frame_max_cells']
+        max_total = max_total or HEATMAP['frame_max_total']
+
+        start, stop = self.blocks.get(species, (0, 0))
+        months = self.months[start:stop]
+        lo = start + np.searchsorted(months, date_from.year * 12 + date_from.month - 1, side="left")
+        hi = start + np.searchsorted(months, date_to.year * 12 + date_to.month - 1, side="right")
+        keep = lo + np.flatnonzero(self.weights[lo:hi] > 0)
+        if len(keep) == 0:
+            return {"index": [], "data": []}
+
+        keys = self.months[keep] if period == "month" else self.months[keep] // 12
+        cells = pd.DataFrame({"frame": keys - keys[0], "row": self.rows[keep], "col": self.cols[keep], "weight": self.weights[keep]})
+        if period == "year":
+            # Roční snímek = součet měsíčních buněk (jen nad blokem druhu, ne nad záznamy)
+            cells = cells.groupby(["frame", "row", "col"], sort=False)["weight"].sum().reset_index()
+        n_frames = int(keys[-1] - keys[0]) + 1
+
+        # V každém snímku nejsilnější buňky jako první; pořadí uvnitř snímku = rank
+        cells = cells.sort_values(["frame", "weight"], ascending=[True, False], kind="stable")
+        frame = cells["frame"].to_numpy()
+        bounds = np.searchsorted(frame, np.arange(n_frames + 1))
+        rank = np.arange(len(frame)) - bounds[frame]
+        cells = cells[rank < max(1, min(max_cells, max_total // n_frames))]
+
+        points = np.column_stack([
+            ((cells["row"].to_numpy() + 0.5) * self.cell_size).round(5),
+            ((cells["col"].to_numpy() + 0.5) * self.cell_size).round(5),
+            (cells["weight"].to_numpy(dtype="float64") / cells["weight"].max()).round(4),
+        ])
+        bounds = np.searchsorted(cells["frame"].to_numpy(), np.arange(n_frames + 1))
+        first = int(keys[0])
+        if period == "month":
+            index = [f"{(first + i) // 12}-{(first + i) % 12 + 1:02d}" for i in range(n_frames)]
+        else:
+            index = [str(first + i) for i in range(n_frames)]
+        return {"index": index, "data": [points[bounds[i]:bounds[i + 1]].tolist() for i in range(n_frames)]}
+
+
+def heatmap_animation_html(frames: dict) -> str:
+    """
+    Vykreslí snímky z HeatmapFrames.frames do jedné mapy s časovou osou (HeatMapWithTime);
+    přehrávání i posun mezi snímky běží v prohlížeči.
+    """
+    import folium
+    from folium.plugins import HeatMapWithTime
+
+    points = [point for frame in frames["data"] for point in frame]
+    if points:
+        map_center = np.asarray(points)[:, :2].mean(axis=0).tolist()
+    else:
+        map_center = [49.40099, 15.67521]
+
+    heat_map = folium.Map(location=map_center, zoom_start=8)
+    HeatMapWithTime(
+        frames["data"], index=frames["index"], radius=10, max_opacity=0.8, min_speed=0.5, max_speed=12,
+        position="bottomleft", control=False,
+    ).add_to(heat_map)
+    return folium.Figure().add_child(heat_map).render()
+
+
+# ========================
+# Tabulka pozorování: vykreslení po stránkách
+# ========================
+# Formátuje se vždy jen jedna stránka řádků (vektorově, bez apply po řádcích)
+# a hotové HTML stránek se drží v session_state, takže "Načíst další" vykreslí
+# jen nově přidanou stránku.
+TABLE_COLUMNS = ["Datum", "Počet", "Místo pozorování", "Město", "Kvadrát", "Pozorovatel", "Odkaz"]
+LINK_URL = "https://portal23.nature.cz/nd/find.php?akce=view&akce2=stopValidaci&karta_id="
+
+
+def link_html(ids: pd.Series) -> pd.Series:
+    """HTML odkazy na nálezovou kartu v NDOP pro ID nálezů (prázdný text, pokud ID chybí)."""
+    links = '<a href="' + LINK_URL + ids.astype(str) + '" target="_blank">link</a>'
+    return links.where(ids.notna(), "")
+
+
+def truncate_text(values: pd.Series, limit: int = 50) -> pd.Series:
+    """Zkrátí texty delší než limit znaků a přidá '...'."""
+    values = values.astype(str)
+    return values.where(values.str.len() <= limit, values.str.slice(0, limit) + "...")
+
+
+def format_table_page(page: pd.DataFrame) -> pd.DataFrame:
+    """Připraví řádky jedné stránky k zobrazení (texty, datum, odkazy) jako sloupce řetězců."""
+    columns = [col for col in TABLE_COLUMNS if col in page.columns]
+    formatted = page[columns].astype(str)
+    for col in ["Místo pozorování", "Pozorovatel"]:
+        if col in formatted.columns:
+            formatted[col] = truncate_text(page[col])
+    if "Datum" in formatted.columns:
+        formatted["Datum"] = page["Datum"].dt.strftime('%d. %m. %Y').fillna('')
+    if "Odkaz" in formatted.columns:
+        formatted["Odkaz"] = link_html(page["Odkaz"])
+    return formatted
+
+
+def table_rows_html(formatted: pd.DataFrame) -> str:
+    """HTML řádky (<tr>) pro naformátovanou stránku - stejné značky jako DataFrame.to_html."""
+    if formatted.empty:
+        return ""
+    rows = "    <tr>\n"
+    for col in formatted.columns:
+        rows = rows + "      <td>" + formatted[col] + "</td>\n"
+    rows = rows + "    </tr>\n"
+    return "".join(rows.tolist())
+
+
+def table_html(columns, rows_html: str) -> str:
+    """Složí celou tabulku z hlavičky a předem vykreslených řádků."""
+    header = "".join(f"      <th>{col}</th>\n" for col in columns)
+    return (
+        '<table border="1" class="dataframe">\n'
+        '  <thead>\n    <tr style="text-align: right;">\n' + header + '    </tr>\n  </thead>\n'
+        '  <tbody>\n' + rows_html + '  </tbody>\n</table>'
+    )
+
+
+# ========================
+# Volitelný diskový backend (DuckDB) pro exporty větší než RAM
+# ========================
+# CSV se po dávkách připraví stejně jako pro pandas (prepare_frame) a uloží do
+# DuckDB souboru vedle CSV (uploaded_file.csv -> uploaded_file.duckdb), seřazené
+# podle (Druh, Datum). Dotazy na druh a rozsah dat pak díky min/max statistikám
+# bloků čtou jen potřebnou část souboru a do paměti se načtou jen výsledné řádky.
+STORE_SUFFIX = ".duckdb"
+# Verze uspořádání tabulek v úložišti; úložiště se starší verzí (nebo jinou mřížkou) se sestaví znovu
+STORE_VERSION = 3
+
+
+def store_layout() -> dict:
+    """Uspořádání úložiště, se kterým počítají dotazy (ukládá se do otisku v tabulce meta)."""
+    return {"version": STORE_VERSION, "cell_size": SPATIAL['cell_size'], "frame_cell_size": HEATMAP['frame_cell_size']}
+
+
+def use_store(file_path: str, engine: str = None) -> bool:
+    """Rozhodne podle engine (výchozí BACKEND['engine']), zda se dotazy mají posílat do DuckDB úložiště."""
+    engine = engine or BACKEND['engine']
+    if engine == 'pandas':
+        return False
+    if os.path.isdir(file_path):
+        if engine == 'duckdb':
+            logger.warning("DuckDB úložiště neumí export po částech (%s) - používám pandas", file_path)
+        return False
+    if engine == 'auto':
+        if not os.path.exists(file_path) or os.path.getsize(file_path) < BACKEND['duckdb_min_size_mb'] * 2**20:
+            return False
+        try:
+            import duckdb  # noqa: F401
+        except ImportError:
+            logger.warning("CSV je větší než %d MB, ale balíček duckdb není nainstalovaný - používám pandas",
+                           BACKEND['duckdb_min_size_mb'])
+            return False
+    return True
+
+
+def read_store_fingerprint(store_path: str) -> dict:
+    """Načte otisk CSV uložený v DuckDB úložišti (prázdný slovník, pokud chybí)."""
+    import duckdb
+
+    if not os.path.exists(store_path):
+        return {}
+    try:
+        with duckdb.connect(store_path, read_only=True) as con:
+            return json.loads(con.execute("SELECT fingerprint FROM meta").fetchone()[0])
+    except (duckdb.Error, TypeError, ValueError):
+        return {}
+
+
+def build_store(file_path: str, store_path: str) -> None:
+    """
+    Vytvoří DuckDB úložiště z CSV: dávky se připraví přes prepare_frame, zapíšou
+    jako Parquet a DuckDB je seřadí (i mimo paměť) do tabulky observations.
+    Zároveň se v SQL spočítá agregační kostka (tabulka cube, viz build_cube), tabulka
+    points s rowid a souřadnicemi záznamů seřazenými podle buňky mřížky (viz StoreSpatialIndex)
+    a odvozené tabulky phenology, occupancy, observers a frames - při startu se jen načtou.
+    """
+    import shutil
+    import duckdb
+
+    fingerprint = dict(source_fingerprint(file_path), store=store_layout())
+    tmp_store = f"{store_path}.{os.getpid()}.tmp"
+    parts_dir = tmp_store + ".parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    try:
+        for i, (chunk, _) in enumerate(iter_csv_chunks(file_path)):
+            prepare_frame(chunk, file_path).to_parquet(os.path.join(parts_dir, f"part-{i:05d}.parquet"), index=False)
+
+        with duckdb.connect(tmp_store) as con:
+            parts = os.path.join(parts_dir, "*.parquet").replace("'", "''")
+            con.execute(f"CREATE TABLE observations AS SELECT * FROM read_parquet('{parts}', union_by_name = true)")
+            columns = [row[0] for row in con.execute("DESCRIBE observations").fetchall()]
+            if "Druh" in columns and "Datum" in columns:
+                con.execute('CREATE OR REPLACE TABLE observations AS SELECT * FROM observations ORDER BY "Druh", "Datum"')
+            con.execute(f"CREATE TABLE cube AS {store_cube_sql(columns)}")
+            con.execute(f"CREATE TABLE points AS {store_points_sql(columns)}", [SPATIAL['cell_size']] * 2)
+            derived = {
+                "phenology": store_phenology_sql(columns),
+                "occupancy": store_occupancy_sql(columns),
+                "observers": store_observers_sql(columns),
+                "frames": store_frames_sql(columns, HEATMAP['frame_cell_size']),
+            }
+            for name, sql in derived.items():
+                if sql is not None:
+                    con.execute(f"CREATE TABLE {name} AS {sql}")
+            con.execute("CREATE TABLE meta (fingerprint VARCHAR)")
+            con.execute("INSERT INTO meta VALUES (?)", [json.dumps(fingerprint)])
+        os.replace(tmp_store, store_path)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        if os.path.exists(tmp_store):
+            os.remove(tmp_store)
+
+
+def store_cube_sql(columns) -> str:
+    """SQL pro agregační kostku se stejnými sloupci jako build_cube."""
+    if "Druh" not in columns or "Datum" not in columns:
+        return 'SELECT NULL::VARCHAR AS "Druh" WHERE false'
+    count = '"Počet"' if "Počet" in columns else "1"
+    return f"""
+        SELECT "Druh",
+               CAST(year("Datum") AS SMALLINT) AS "Rok",
+               CAST(month("Datum") AS TINYINT) AS "Měsíc",
+               count(*) AS "Pozorování",
+               sum({count}) AS "Jedinci"
+        FROM observations
+        GROUP BY ALL
+        ORDER BY ALL
+    """
+
+
+def store_points_sql(columns) -> str:
+    """SQL pro tabulku points: rowid záznamu, buňka mřížky SPATIAL (Řada, Sloupec) a souřadnice."""
+    if not {"Zeměpisná šířka", "Zeměpisná délka"} <= set(columns):
+        return 'SELECT NULL::BIGINT AS "row", NULL::INTEGER AS "Řada", NULL::INTEGER AS "Sloupec" WHERE false'
+    return """
+        SELECT rowid AS "row",
+               CAST(floor(CAST("Zeměpisná šířka" AS DOUBLE) / ?) AS INTEGER) AS "Řada",
+               CAST(floor(CAST("Zeměpisná délka" AS DOUBLE) / ?) AS INTEGER) AS "Sloupec",
+               CAST("Zeměpisná šířka" AS DOUBLE) AS "Zeměpisná šířka",
+               CAST("Zeměpisná délka" AS DOUBLE) AS "Zeměpisná délka"
+        FROM observations
+        WHERE isfinite("Zeměpisná šířka") AND isfinite("Zeměpisná délka")
+        ORDER BY "Řada", "Sloupec"
+    """
+
+
+def open_store(file_path: str):
+    """Otevře (případně nejdřív vytvoří) DuckDB úložiště pro CSV, jen pro čtení."""
+    import duckdb
+
+    store_path = snapshot_path(file_path, STORE_SUFFIX)
+    stored = read_store_fingerprint(store_path)
+    if stored.get("store") != store_layout() or check_fingerprint(stored, file_path) is None:
+        build_store(file_path, store_path)
+    return duckdb.connect(store_path, read_only=True)
+
+
+def store_cube(con) -> pd.DataFrame:
+    """Agregační kostka z DuckDB úložiště (stejný tvar jako build_cube)."""
+    cube = con.cursor().execute("SELECT * FROM cube").df()
+    if cube.empty:
+        return build_cube(pd.DataFrame())
+    return cube.astype({"Rok": "Int16", "Měsíc": "Int8", "Pozorování": "int64", "Jedinci": "int64"})
+
+
+def store_table(con, name: str):
+    """Předpočítaná tabulka z úložiště (viz build_store), nebo None, pokud ji data nemají."""
+    con = con.cursor()
+    if name not in {row[0] for row in con.execute("SHOW TABLES").fetchall()}:
+        return None
+    return con.execute(f'SELECT * FROM "{name}"').df()
+
+
+def describe_store(con) -> dict:
+    """Sloupce, počet řádků, seznam druhů a rozsah dat v DuckDB úložišti."""
+    con = con.cursor()
+    columns = [row[0] for row in con.execute("DESCRIBE observations").fetchall()]
+    info = {
+        "columns": columns,
+        "n_rows": con.execute("SELECT count(*) FROM observations").fetchone()[0],
+        "species": [],
+        "date_min": None,
+        "date_max": None,
+        "years": [],
+    }
+    if "Druh" in columns:
+        info["species"] = sorted(
+            row[0] for row in con.execute('SELECT DISTINCT "Druh" FROM observations WHERE "Druh" IS NOT NULL').fetchall()
+        )
+    if "Datum" in columns:
+        date_min, date_max = con.execute('SELECT min("Datum"), max("Datum") FROM observations').fetchone()
+        info["date_min"] = date_min.date() if date_min is not None else None
+        info["date_max"] = date_max.date() if date_max is not None else None
+        info["years"] = [
+            row[0] for row in con.execute(
+                'SELECT DISTINCT year("Datum") AS rok FROM observations WHERE "Datum" IS NOT NULL ORDER BY rok DESC'
+            ).fetchall()
+        ]
+    return info
+
+
+def store_select(con, species: str, date_from, date_to) -> pd.DataFrame:
+    """Řádky druhu s Datum v rozsahu date_from..date_to (včetně) z DuckDB úložiště."""
+    con = con.cursor()
+    return con.execute(
+        'SELECT * FROM observations WHERE "Druh" = ? AND "Datum" >= ? AND "Datum" < ? ORDER BY "Datum"',
+        [species, date_from, date_to + timedelta(days=1)],
+    ).df()
+
+
+def store_select_many(con, species, date_from, date_to) -> pd.DataFrame:
+    """Řádky více druhů s Datum v rozsahu date_from..date_to (včetně) z DuckDB úložiště jedním dotazem."""
+    species = list(species)
+    if not species:
+        return con.cursor().execute("SELECT * FROM observations LIMIT 0").df()
+    con = con.cursor()
+    placeholders = ", ".join("?" * len(species))
+    return con.execute(
+        f'SELECT * FROM observations WHERE "Druh" IN ({placeholders}) AND "Datum" >= ? AND "Datum" < ? '
+        'ORDER BY "Druh", "Datum"',
+        [*species, date_from, date_to + timedelta(days=1)],
+    ).df()
+
+
+def store_occupancy_sql(columns):
+    """SQL pro tabulku occupancy: unikátní trojice (Druh, Rok, Kvadrát), viz build_occupancy_triples (None bez sloupců)."""
+    if not {"Druh", "Datum", "Kvadrát"} <= set(columns):
+        return None
+    return (
+        'SELECT DISTINCT "Druh", CAST(year("Datum") AS SMALLINT) AS "Rok", "Kvadrát" FROM observations '
+        'WHERE "Datum" IS NOT NULL AND "Kvadrát" IS NOT NULL AND "Kvadrát" <> \'\''
+    )
+
+
+def store_occupancy_triples(con) -> pd.DataFrame:
+    """Unikátní trojice (Druh, Rok, Kvadrát) z úložiště (stejný tvar jako build_occupancy_triples)."""
+    triples = store_table(con, "occupancy")
+    return build_occupancy_triples(pd.DataFrame()) if triples is None else triples
+
+
+def store_observers_sql(columns):
+    """SQL pro tabulku observers: počty pozorovatelů druhů a všech pozorovatelů po letech (None bez sloupců)."""
+    if not {"Druh", "Datum", "Pozorovatel"} <= set(columns):
+        return None
+    return (
+        'SELECT "Druh", CAST(year("Datum") AS SMALLINT) AS "Rok", count(DISTINCT "Pozorovatel") AS "Pozorovatelé" '
+        'FROM observations WHERE "Datum" IS NOT NULL AND "Druh" IS NOT NULL '
+        'AND "Pozorovatel" IS NOT NULL AND "Pozorovatel" <> \'\' '
+        'GROUP BY GROUPING SETS (("Druh", "Rok"), ("Rok")) ORDER BY ALL'
+    )
+
+
+def store_observer_counts(con) -> pd.DataFrame:
+    """Počty pozorovatelů druhů a všech pozorovatelů po letech z úložiště (viz build_observer_counts)."""
+    observers = store_table(con, "observers")
+    if observers is None:
+        return build_observer_counts(pd.DataFrame())
+    return observers.astype({"Druh": "object", "Rok": "int16", "Pozorovatelé": "int64"})
+
+
+class StoreSpatialIndex:
+    """
+    Obdoba SpatialIndex nad tabulkou points v DuckDB úložišti: body jsou uložené seřazené
+    podle buňky mřížky, takže dotaz na rozsah buněk čte díky min/max statistikám bloků jen
+    malou část tabulky a do paměti se nic předem nenačítá. Vrací rowid (vzestupně).
+    """
+
+    def __init__(self, con, cell_size: float = None):
+        self.con = con
+        self.cell_size = cell_size or SPATIAL['cell_size']
+        self.size = con.cursor().execute("SELECT count(*) FROM points").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def inside(self, south: float, west: float, north: float, east: float) -> pd.DataFrame:
+        """rowid a souřadnice bodů uvnitř obdélníku (včetně hranic)."""
+        return self.con.cursor().execute(
+            'SELECT "row", "Zeměpisná šířka", "Zeměpisná délka" FROM points '
+            'WHERE "Řada" BETWEEN ? AND ? AND "Sloupec" BETWEEN ? AND ? '
+            'AND "Zeměpisná šířka" BETWEEN ? AND ? AND "Zeměpisná délka" BETWEEN ? AND ? ORDER BY "row"',
+            [
+                int(np.floor(south / self.cell_size)), int(np.floor(north / self.cell_size)),
+                int(np.floor(west / self.cell_size)), int(np.floor(east / self.cell_size)),
+                south, north, west, east,
+            ],
+        ).df()
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """rowid záznamů s body uvnitř obdélníku (včetně hranic)."""
+        return self.inside(south, west, north, east)["row"].to_numpy(dtype=np.int64)
+
+    def radius(self, lat: float, lng: float, radius_km: float):
+        """rowid záznamů do vzdálenosti radius_km od bodu a jejich vzdálenosti v km (seřazené podle rowid)."""
+        found = self.inside(*radius_box(lat, lng, radius_km, self.cell_size))
+        distances = haversine_km(lat, lng, found["Zeměpisná šířka"].to_numpy(), found["Zeměpisná délka"].to_numpy())
+        inside = distances <= radius_km
+        return found["row"].to_numpy(dtype=np.int64)[inside], distances[inside]
+
+
+def store_select_rows(con, rows: pd.DataFrame, date_from, date_to) -> pd.DataFrame:
+    """
+    Řádky observations s rowid ze sloupce rows["row"] (a případně sloupcem Vzdálenost (km))
+    a Datum v rozsahu date_from..date_to z DuckDB úložiště.
+    """
+    con = con.cursor()
+    con.register("area_rows", rows)
+    distance = ', r."Vzdálenost (km)"' if "Vzdálenost (km)" in rows.columns else ""
+    return con.execute(
+        f'SELECT o.*{distance} FROM observations o JOIN area_rows r ON o.rowid = r.row '
+        'WHERE o."Datum" >= ? AND o."Datum" < ? ORDER BY o.rowid',
+        [date_from, date_to + timedelta(days=1)],
+    ).df()
+
+
+def store_phenology_sql(columns):
+    """SQL pro tabulku phenology: měsíční fenologie jako build_phenology (None bez sloupců)."""
+    if not {"Druh", "Datum"} <= set(columns):
+        return None
+    count = 'CAST("Počet" AS DOUBLE)' if "Počet" in columns else "1.0"
+    end = 'CASE WHEN "Datum2" >= "Datum" THEN CAST("Datum2" AS DATE) ELSE CAST("Datum" AS DATE) END' if "Datum2" in columns else 'CAST("Datum" AS DATE)'
+    return f"""
+        WITH intervals AS (
+            SELECT "Druh", CAST("Datum" AS DATE) AS d1, {end} AS d2, {count} AS w
+            FROM observations WHERE "Datum" IS NOT NULL AND "Druh" IS NOT NULL
+        ), pieces AS (
+            SELECT "Druh", d1, d2, w,
+                   CAST(unnest(generate_series(date_trunc('month', d1), date_trunc('month', d2), INTERVAL 1 MONTH)) AS DATE) AS m
+            FROM intervals
+        ), shares AS (
+            SELECT "Druh", m, w,
+                   (date_diff('day', greatest(m, d1), least(CAST(m + INTERVAL 1 MONTH AS DATE) - 1, d2)) + 1)
+                   / (date_diff('day', d1, d2) + 1) AS share
+            FROM pieces
+        )
+        SELECT "Druh", CAST(year(m) AS SMALLINT) AS "Rok", CAST(month(m) AS TINYINT) AS "Měsíc",
+               sum(share) AS "Pozorování", sum(share * w) AS "Jedinci"
+        FROM shares
+        GROUP BY ALL
+        ORDER BY ALL
+    """
+
+
+def store_phenology(con) -> pd.DataFrame:
+    """Měsíční fenologie z úložiště (stejný tvar jako build_phenology)."""
+    phenology = store_table(con, "phenology")
+    if phenology is None:
+        return build_phenology(pd.DataFrame())
+    return phenology.astype({"Druh": "category", "Rok": "int16", "Měsíc": "int8"})
+
+
+def store_frames_sql(columns, cell_size: float):
+    """SQL pro tabulku frames: buňky animované heatmapy jako build_heatmap_frames (None bez sloupců)."""
+    if not {"Druh", "Datum", "Zeměpisná šířka", "Zeměpisná délka"} <= set(columns):
+        return None
+    weight = 'coalesce(sum(CAST("Počet" AS DOUBLE)), 0)' if "Počet" in columns else "count(*)"
+    return (
+        'SELECT "Druh", CAST(year("Datum") AS SMALLINT) AS "Rok", CAST(month("Datum") AS TINYINT) AS "Měsíc", '
+        f'CAST(floor(CAST("Zeměpisná šířka" AS DOUBLE) / {float(cell_size)!r}) AS INTEGER) AS "Řada", '
+        f'CAST(floor(CAST("Zeměpisná délka" AS DOUBLE) / {float(cell_size)!r}) AS INTEGER) AS "Sloupec", '
+        f'CAST({weight} AS FLOAT) AS "Váha" FROM observations '
+        'WHERE "Datum" IS NOT NULL AND "Druh" IS NOT NULL '
+        'AND "Zeměpisná šířka" IS NOT NULL AND "Zeměpisná délka" IS NOT NULL '
+        'GROUP BY ALL ORDER BY ALL'
+    )
+
+
+def store_heatmap_frames(con) -> pd.DataFrame:
+    """Tabulka snímků animované heatmapy z úložiště (stejný tvar jako build_heatmap_frames)."""
+    frames = store_table(con, "frames")
+    if frames is None:
+        return build_heatmap_frames(pd.DataFrame())
+    return frames.astype({"Druh": "category", "Rok": "int16", "Měsíc": "int8", "Řada": "int32", "Sloupec": "int32"})
+
+
+def describe_frame(df: pd.DataFrame, species_index) -> dict:
+    """Stejné údaje jako describe_store, ale pro data v paměti."""
+    info = {
+        "columns": list(df.columns),
+        "n_rows": len(df),
+        "species": [],
+        "date_min": None,
+        "date_max": None,
+        "years": [],
+    }
+    if species_index is not None:
+        info["species"] = sorted(species_index)
+    elif not df.empty and "Druh" in df.columns:
+        info["species"] = sorted(set(df["Druh"].dropna().unique()))
+    if "Datum" in df.columns and not df.empty:
+        info["date_min"] = df["Datum"].min().date()
+        info["date_max"] = df["Datum"].max().date()
+        info["years"] = sorted(df["Datum"].dropna().dt.year.unique(), reverse=True)
+    return info
+
+
+# ========================
+# Měření fází (volitelné)
+# ========================
+# Fáze se obalí "with profiler.stage(...)"; vypnutý profiler vrací sdílený prázdný
+# kontext, takže měření bez zapnutí nestojí prakticky nic.
+def current_rss_mb():
+    """Aktuální paměť procesu (RSS) v MB, nebo None, pokud ji nelze zjistit."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Stage:
+    """Jedna měřená fáze; v záznamu (výsledek "with ... as record") lze doplnit rows_out."""
+
+    def __init__(self, profiler, name: str, rows_in=None):
+        self.profiler = profiler
+        self.record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+
+    def __enter__(self):
+        self.rss_before = current_rss_mb()
+        if self.profiler.trace_memory:
+            tracemalloc.reset_peak()
+            self.traced_before = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc_info):
+        self.record["seconds"] = round(time.perf_counter() - self.start, 4)
+        rss_after = current_rss_mb()
+        if self.rss_before is not None and rss_after is not None:
+            self.record["memory_delta_mb"] = round(rss_after - self.rss_before, 2)
+        if self.profiler.trace_memory:
+            self.record["peak_mb"] = round((tracemalloc.get_traced_memory()[1] - self.traced_before) / 2**20, 2)
+        self.profiler.records.append(self.record)
+        return False
+
+
+class NullStage:
+    """Fáze vypnutého profileru - nic neměří."""
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = NullStage()
+PROFILE_LOG_LOCK = threading.Lock()
+
+
+class StageProfiler:
+    """
+    Sbírá měření fází jednoho běhu (v aplikaci jednoho překreslení): čas, počty řádků
+    na vstupu a výstupu, změnu paměti procesu a volitelně špičku alokací (tracemalloc).
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.records = []
+        self.started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stage(self, name: str, rows_in=None):
+        """Kontext pro měření jedné fáze (with profiler.stage("filter", rows_in=n) as record: ...)."""
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name, rows_in)
+
+    def run(self, name: str, func, *args, **kwargs):
+        """Spustí func(*args, **kwargs) jako fázi name; u DataFrame zapíše počet řádků výsledku."""
+        with self.stage(name) as record:
+            result = func(*args, **kwargs)
+            if isinstance(result, pd.DataFrame):
+                record["rows_out"] = len(result)
+        return result
+
+    def total_seconds(self) -> float:
+        return round(sum(record["seconds"] for record in self.records), 4)
+
+    def write_log(self, path: str, **context) -> None:
+        """Připíše měření jako jeden JSON řádek (context = např. vybraný druh a rozsah dat)."""
+        if not self.enabled or not path:
+            return
+        entry = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "pid": os.getpid(),
+            **context,
+            "total_seconds": self.total_seconds(),
+            "stages": self.records,
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with PROFILE_LOG_LOCK, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def stop(self) -> None:
+        """Ukončí tracemalloc, pokud ho spustil tento profiler."""
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+
+# ========================
+# Dataset: jednotné dotazy nad pandas i DuckDB backendem
+# ========================
+class Dataset:
+    """
+    Připravená data jednoho CSV exportu - v paměti (pandas) nebo v DuckDB úložišti
+    (viz BACKEND). Objekt se po vytvoření nemění, takže ho mohou sdílet všechny
+    relace aplikace; dotazy vrací výřezy nebo nové tabulky.
+    """
+
+    def __init__(self, file_path: str, engine: str = None):
+        self.file_path = file_path
+        self.store_mode = use_store(file_path, engine)
+        if self.store_mode:
+            self.df = None
+            self.species_index = None
+            self.store = open_store(file_path)
+            self.cube = store_cube(self.store)  # Předpočítané součty druh × rok × měsíc
+            self.occupancy = Occupancy(store_occupancy_triples(self.store))  # Obsazené kvadráty druh × rok
+            self.phenology_table = store_phenology(self.store)  # Rozložené podíly druh × rok × měsíc
+            self.animation = HeatmapFrames(store_heatmap_frames(self.store))  # Buňky heatmapy druh × měsíc
+            self.spatial = StoreSpatialIndex(self.store)  # Dotazy do tabulky points, body se nenačítají do paměti
+            observers = store_observer_counts(self.store)
+            self.info = describe_store(self.store)
+        else:
+            self.store = None
+            fingerprint = current_fingerprint(file_path)  # CSV se hashuje nejvýš jednou za načtení
+            self.df = load_data(file_path, fingerprint)
+            derived = partial(load_derived, file_path, df=self.df, fingerprint=fingerprint)
+            self.cube = derived(CUBE_SUFFIX, build_cube)  # Předpočítané součty druh × rok × měsíc
+            self.occupancy = Occupancy(derived(OCCUPANCY_SUFFIX, build_occupancy_triples))  # Obsazené kvadráty druh × rok
+            self.phenology_table = derived(PHENOLOGY_SUFFIX, build_phenology)  # Rozložené podíly druh × rok × měsíc
+            self.animation = HeatmapFrames(derived(frames_suffix(), build_heatmap_frames))  # Buňky heatmapy druh × měsíc
+            self.spatial = SpatialIndex(self.df["Zeměpisná šířka"], self.df["Zeměpisná délka"])  # Mřížkový index bodů df
+            observers = derived(OBSERVERS_SUFFIX, build_observer_counts)
+            self.species_index = build_species_index(self.df)  # Pozice bloků jednotlivých druhů v df
+            self.info = describe_frame(self.df, self.species_index)
+        # Matice druh × rok pro trendy očištěné o úsilí (viz SpeciesTrends)
+        self.trends = SpeciesTrends(self.cube, self.occupancy, observers)
+        # Otisk dat pro klíče memoizace (změní se s novým CSV)
+        self.key = (file_path, *source_stat(file_path))
+
+    def empty(self) -> pd.DataFrame:
+        """Prázdná tabulka se sloupci dat."""
+        return pd.DataFrame(columns=self.info["columns"]) if self.store_mode else self.df.iloc[0:0]
+
+    def select(self, species: str, date_from, date_to) -> pd.DataFrame:
+        """Záznamy druhu s Datum v rozsahu date_from..date_to (včetně)."""
+        if self.store_mode:
+            # Dotaz do DuckDB - načtou se jen řádky vybraného druhu a rozsahu dat
+            return store_select(self.store, species, date_from, date_to)
+        if self.species_index is not None:
+            # Druh a rozsah dat dohledáme v indexu (binární vyhledávání, výřez bez kopie)
+            return select_species_range(self.df, self.species_index, species, date_from, date_to)
+
+        filtered_data = self.df
+        if not filtered_data.empty and "Datum" in filtered_data.columns:
+            filtered_data = filtered_data[
+                (filtered_data["Datum"].dt.date >= date_from) &
+                (filtered_data["Datum"].dt.date <= date_to)
+            ]
+        if "Druh" in filtered_data.columns:
+            filtered_data = filtered_data[filtered_data["Druh"] == species]
+        return filtered_data
+
+    def select_many(self, species, date_from, date_to) -> pd.DataFrame:
+        """Záznamy více druhů s Datum v rozsahu date_from..date_to jedním výběrem (pro porovnání druhů)."""
+        if not species:
+            return self.empty()
+        if self.store_mode:
+            return store_select_many(self.store, species, date_from, date_to)
+        if self.species_index is not None:
+            return select_species_ranges(self.df, self.species_index, species, date_from, date_to)
+        return pd.concat([self.select(name, date_from, date_to) for name in species])
+
+    def species_count_by_year(self) -> pd.DataFrame:
+        """Počet různých druhů v jednotlivých letech."""
+        return species_count_by_year(self.cube)
+
+    def species_yearly_counts(self, species: str) -> pd.DataFrame:
+        """Počet pozorování druhu ve všech letech v datech."""
+        return species_yearly_counts(self.cube, species, self.info["years"])
+
+    def yearly_counts_many(self, species) -> pd.DataFrame:
+        """Počet pozorování více druhů ve všech letech v datech, viz yearly_counts_many."""
+        return yearly_counts_many(self.cube, species, self.info["years"])
+
+    def phenology_many(self, species, date_from, date_to, unit: str = "month") -> pd.DataFrame:
+        """
+        Fenologie více druhů v rozsahu date_from..date_to podle měsíců, týdnů nebo dnů
+        v roce (viz phenology_histogram), pro všechny druhy a přihrádky i s nulami.
+        Měsíce v rozsahu po celých měsících se berou z předpočítané tabulky.
+        """
+        date_min = self.info["date_min"] or date_from
+        date_max = self.info["date_max"] or date_to
+        with_counts = "Počet" in self.info["columns"]
+        if unit == "month" and month_aligned(date_from, date_to, date_min, date_max):
+            return phenology_from_table(self.phenology_table, species, date_from, date_to, with_counts)
+
+        # Záznamy začínající před date_from do rozsahu mohou zasahovat, proto výběr od začátku dat
+        data = self.select_many(species, date_min, date_to)
+        histogram = phenology_histogram(
+            data, None if date_from <= date_min else date_from, None if date_to >= date_max else date_to, unit, by="Druh"
+        )
+        label = PHENOLOGY_UNITS[unit]
+        labels = day_bins(pd.DatetimeIndex([]), unit)[1]
+        index = pd.MultiIndex.from_product([list(species), labels], names=["Druh", label])
+        return histogram.set_index(["Druh", label]).reindex(index, fill_value=0).reset_index()
+
+    def phenology(self, species: str, date_from, date_to, unit: str = "month") -> pd.DataFrame:
+        """Fenologie jednoho druhu (sloupce Měsíc / Týden / Den v roce, Počet pozorování, Počet jedinců)."""
+        return self.phenology_many([species], date_from, date_to, unit).drop(columns=["Druh"])
+
+    def select_positions(self, positions: np.ndarray, date_from, date_to, distances: np.ndarray = None,
+                         species: str = None) -> pd.DataFrame:
+        """
+        Záznamy na pozicích positions (z SpatialIndex) s Datum v rozsahu date_from..date_to,
+        případně jen druhu species; s distances navíc sloupec Vzdálenost (km).
+        """
+        if self.store_mode:
+            rows = pd.DataFrame({"row": positions})
+            if distances is not None:
+                rows["Vzdálenost (km)"] = distances
+            data = store_select_rows(self.store, rows, date_from, date_to)
+            return data if species is None else data[data["Druh"] == species].reset_index(drop=True)
+
+        keep = np.ones(len(positions), dtype=bool)
+        if "Datum" in self.df.columns:
+            dates = self.df["Datum"].to_numpy()[positions]
+            keep &= (dates >= np.datetime64(date_from)) & (dates < np.datetime64(date_to + timedelta(days=1)))
+        if species is not None:
+            keep &= np.asarray(self.df["Druh"].array.take(positions) == species)
+        data = self.df.take(positions[keep])
+        if distances is not None:
+            data = data.assign(**{"Vzdálenost (km)": distances[keep]})
+        return data
+
+    def select_radius(self, lat: float, lng: float, radius_km: float, date_from, date_to, species: str = None) -> pd.DataFrame:
+        """Záznamy do vzdálenosti radius_km od bodu (se sloupcem Vzdálenost (km)), viz SpatialIndex.radius."""
+        positions, distances = self.spatial.radius(lat, lng, radius_km)
+        return self.select_positions(positions, date_from, date_to, distances, species)
+
+    def select_bbox(self, south: float, west: float, north: float, east: float, date_from, date_to,
+                    species: str = None) -> pd.DataFrame:
+        """Záznamy uvnitř obdélníku (např. aktuální výřez mapy), viz SpatialIndex.bbox."""
+        return self.select_positions(self.spatial.bbox(south, west, north, east), date_from, date_to, species=species)
+
+    def heatmap_points(self, species: str, date_from, date_to, grid=None, cell_size=None, max_points=None) -> pd.DataFrame:
+        """Body heatmapy (lat, lng, weight) pro druh v rozsahu dat, viz bin_heatmap_points."""
+        return bin_heatmap_points(self.select(species, date_from, date_to), grid, cell_size, max_points)
+
+    def heatmap_frames(self, species: str, date_from, date_to, period: str = "month") -> dict:
+        """Snímky animované heatmapy druhu po měsících nebo letech, viz HeatmapFrames.frames."""
+        return self.animation.frames(species, date_from, date_to, period)
+
+
+# ========================
+# Načtení na pozadí a stav připravenosti
+# ========================
+class Warmup:
+    """
+    Spustí load() ve vlákně na pozadí, aby start aplikace nečekal na stažení a přípravu
+    dat. Stav ("loading", "ready", "error") se zapisuje s PID procesu do status_file
+    (hned při vytvoření se přepíše na "loading"), odkud ho čte sonda připravenosti
+    (viz status_ready); výsledek vrací result().
+    """
+
+    def __init__(self, load, status_file: str = None):
+        self.load = load
+        self.status_file = status_file
+        self.status = "loading"
+        self.error = None
+        self.value = None
+        self.started = time.time()
+        self.finished = None
+        self.done = threading.Event()
+        self.write_status()
+        self.thread = threading.Thread(target=self.run, name="ndop-warmup", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        try:
+            self.value = self.load()
+            self.status = "ready"
+        except Exception as e:
+            logger.warning("Načtení dat na pozadí selhalo: %s", e)
+            self.error = e
+            self.status = "error"
+        self.finished = time.time()
+        self.write_status()
+        self.done.set()
+
+    @property
+    def ready(self) -> bool:
+        """True, když načítání skončilo (úspěšně i chybou)."""
+        return self.done.is_set()
+
+    def elapsed(self) -> float:
+        """Doba načítání v sekundách (u běžícího načítání zatím uplynulá)."""
+        return (self.finished or time.time()) - self.started
+
+    def result(self, timeout: float = None):
+        """Počká na konec načítání a vrátí výsledek load(), případně vyhodí jeho výjimku."""
+        if not self.done.wait(timeout):
+            raise TimeoutError("Data se stále načítají.")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def write_status(self) -> None:
+        """Zapíše stav do status_file (atomicky, aby sonda nikdy nečetla rozepsaný soubor)."""
+        if not self.status_file:
+            return
+        status = {
+            "status": self.status,
+            "pid": os.getpid(),
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "seconds": round(self.elapsed(), 2),
+            "error": None if self.error is None else str(self.error),
+        }
+        tmp_path = f"{self.status_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f, ensure_ascii=False)
+            os.replace(tmp_path, self.status_file)
+        except OSError:
+            logger.warning("Nelze zapsat stav načítání do %s", self.status_file)
+
+
+def process_alive(pid: int) -> bool:
+    """Zda proces pid běží (na Windows nelze levně zjistit - bere se jako běžící)."""
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def status_ready(status_file: str, pid: int = None) -> bool:
+    """
+    Zda status_file hlásí připravená data procesu pid; bez pid procesu, který stav zapsal,
+    pokud ještě běží. "ready" po skončeném nebo jiném serveru se tak za připravenost nebere.
+    """
+    try:
+        with open(status_file, encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not isinstance(status, dict) or status.get("status") != "ready" or not isinstance(status.get("pid"), int):
+        return False
+    return status["pid"] == pid if pid is not None else process_alive(status["pid"])
+
+
+# ========================
+# Příkazová řádka
+# ========================
+QUERIES = ["species", "yearly", "species-yearly", "filter", "monthly", "heatmap", "squares", "richness", "area", "trends", "warm", "ready"]
+
+
+def main(argv=None):
+    """Spustí jeden dotaz nad CSV exportem a výsledek vypíše jako CSV."""
+    parser = argparse.ArgumentParser(description="Dotazy nad CSV exportem z NDOP bez webové aplikace.")
+    parser.add_argument("file_path", help="CSV export z NDOP, nebo adresář s exportem rozděleným do více CSV")
+    parser.add_argument("query", choices=QUERIES, help=(
+        "species = seznam druhů, yearly = počet druhů podle roku, species-yearly = počet pozorování "
+        "druhu podle roku, filter = záznamy druhu, monthly = fenologie druhu podle měsíců "
+        "(nebo týdnů a dnů v roce, viz --unit), heatmap = body heatmapy druhu (s --period po snímcích animace), squares = kvadráty obsazené druhem, richness = počet druhů "
+        "v kvadrátech, area = druhy do --radius km od bodu --lat/--lng, trends = trendy všech druhů "
+        "očištěné o úsilí (po celých letech rozsahu dat), warm = jen připravit snapshoty a kostku (např. při nasazení), "
+        "ready = sonda připravenosti serveru: návratový kód 0, pokud WARMUP['status_file'] hlásí načtená data "
+        "procesu --pid (bez --pid procesu, který stav zapsal, pokud běží), jinak 1"
+    ))
+    parser.add_argument("-s", "--species", help="název druhu (pro species-yearly, filter, monthly, heatmap a squares)")
+    parser.add_argument("--date-from", type=date.fromisoformat, help="datum od (YYYY-MM-DD), výchozí první datum v datech")
+    parser.add_argument("--date-to", type=date.fromisoformat, help="datum do (YYYY-MM-DD), výchozí poslední datum v datech")
+    parser.add_argument("--unit", choices=list(PHENOLOGY_UNITS), default="month", help="přihrádky pro monthly (výchozí month)")
+    parser.add_argument("--lat", type=float, help="zeměpisná šířka středu (WGS84) pro area")
+    parser.add_argument("--lng", type=float, help="zeměpisná délka středu (WGS84) pro area")
+    parser.add_argument("--radius", type=float, default=5, help="poloměr v km pro area (výchozí 5)")
+    parser.add_argument("--engine", choices=["auto", "pandas", "duckdb"], help="backend pro dotazy (výchozí BACKEND['engine'])")
+    parser.add_argument("--grid", choices=["degrees", "kvadrat"], help="mřížka heatmapy (výchozí HEATMAP['grid'])")
+    parser.add_argument("--cell-size", type=float, help="velikost buňky heatmapy ve stupních")
+    parser.add_argument("--max-points", type=int, help="maximální počet bodů heatmapy")
+    parser.add_argument("--period", choices=list(FRAME_PERIODS), help="snímky animované heatmapy po měsících nebo letech")
+    parser.add_argument("--workers", type=int, help="počet procesů pro export po částech (výchozí EXPORT_PARTS['workers'])")
+    parser.add_argument("--export-dir", help="adresář s exporty; nejnovější se před dotazem převezme jako file_path")
+    parser.add_argument("-o", "--output", help="výstupní CSV soubor (výchozí standardní výstup)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="vypisovat průběh načítání")
+    parser.add_argument("--pid", type=int, help="PID serveru pro ready")
+    args = parser.parse_args(argv)
+
+    if args.query == "ready":
+        parser.exit(0 if WARMUP['status_file'] and status_ready(WARMUP['status_file'], args.pid) else 1)
+
+    if args.query in ("species-yearly", "filter", "monthly", "heatmap", "squares") and not args.species:
+        parser.error(f"dotaz {args.query} vyžaduje --species")
+    if args.query == "area" and (args.lat is None or args.lng is None):
+        parser.error("dotaz area vyžaduje --lat a --lng")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+    if args.workers:
+        EXPORT_PARTS['workers'] = args.workers
+    try:
+        if args.export_dir:
+            install_latest_export(args.export_dir, args.file_path)
+        # I warm jen připraví data; stav v WARMUP['status_file'] patří serveru, ne tomuto procesu
+        dataset = Dataset(args.file_path, args.engine)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+
+    date_from = args.date_from or dataset.info["date_min"]
+    date_to = args.date_to or dataset.info["date_max"]
+    if args.query not in ("species", "yearly", "warm") and date_from is None:
+        parser.exit(1, "Data neobsahují sloupec s datem.\n")
+
+    if args.query == "species":
+        result = pd.DataFrame({"Druh": dataset.info["species"]})
+    elif args.query == "yearly":
+        result = dataset.species_count_by_year()
+    elif args.query == "species-yearly":
+        result = dataset.species_yearly_counts(args.species)
+    elif args.query == "filter":
+        result = dataset.select(args.species, date_from, date_to)
+    elif args.query == "monthly":
+        result = dataset.phenology(args.species, date_from, date_to, args.unit)
+    elif args.query == "heatmap" and args.period:
+        frames = dataset.heatmap_frames(args.species, date_from, date_to, args.period)
+        result = pd.DataFrame(
+            [(label, *point) for label, frame in zip(frames["index"], frames["data"]) for point in frame],
+            columns=[FRAME_PERIODS[args.period], "lat", "lng", "weight"],
+        )
+    elif args.query == "heatmap":
+        result = dataset.heatmap_points(args.species, date_from, date_to, args.grid, args.cell_size, args.max_points)
+    elif args.query == "squares":
+        result = dataset.occupancy.distribution(args.species, date_from.year, date_to.year)
+    elif args.query == "richness":
+        result = dataset.occupancy.richness(date_from.year, date_to.year)
+    elif args.query == "trends":
+        result = dataset.trends.ranking(date_from.year, date_to.year)
+    elif args.query == "area":
+        result = area_species_summary(dataset.select_radius(args.lat, args.lng, args.radius, date_from, date_to, args.species))
+    else:
+        info = dataset.info
+        result = pd.DataFrame([{
+            "Řádků": info["n_rows"], "Druhů": len(info["species"]), "Od": info["date_min"], "Do": info["date_max"],
+        }])
+
+    result.to_csv(args.output or sys.stdout, index=False)
+
+
+if __name__ == "__main__":
+    main()
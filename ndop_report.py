@@ -0,0 +1,348 @@
+"""
+Hromadný export statických přehledů druhů: graf počtu pozorování podle roku, fenologie
+podle měsíců, heatmapa a souhrnná čísla - totéž, co aplikace ukazuje pro vybraný druh -
+jako HTML stránky (a PNG grafy, pokud je nainstalované kaleido).
+
+    python ndop_report.py uploaded_file.csv -o reports/
+    python ndop_report.py uploaded_file.csv -o reports/ --year 2024 --workers 8
+    python ndop_report.py uploaded_file.csv -o reports/ --species "Ledňáček říční" "Skorec vodní"
+
+Hlavní proces načte data (Dataset), spočítá trendy a fenologii všech druhů najednou
+a každé úloze předá jen podklady jednoho druhu (souhrnná čísla, roční počty, fenologii
+a souřadnice záznamů). Pracovní procesy žádná celá data nedrží, jen vykreslují; úloh
+je rozpracovaných nejvýš několik na proces, takže se podklady nehromadí v paměti.
+"""
+import pandas as pd
+import plotly.express as px
+import plotly.offline
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import multiprocessing
+import unicodedata
+import argparse
+import logging
+import html
+import time
+import os
+import re
+
+from ndop_data import (
+    CONFIG, INGEST, Dataset, configure_worker, species_cube, species_yearly_counts, heatmap_html, PHENOLOGY_UNITS,
+)
+
+try:
+    import kaleido  # noqa: F401 - jen kvůli zjištění, zda jde ukládat PNG (fig.write_image)
+except ImportError:
+    kaleido = None
+
+logger = logging.getLogger("ndop_report")
+
+
+# ========================
+# Grafy druhu (sdílené s aplikací)
+# ========================
+def figure_species_yearly(cube: pd.DataFrame, species: str, years):
+    """Graf: počet pozorování druhu podle roku (všechny roky v datech, i s nulami)."""
+    # Doplníme všechny roky, které máme v datech (aby se zobrazila i nula, kde není pozorování)
+    yearly_species_counts = species_yearly_counts(cube, species, years)
+
+    fig_species_yearly = px.bar(
+        yearly_species_counts,
+        x="Rok",
+        y="Počet pozorování",
+        title=f"Počet pozorování druhu {species} podle roku",
+    )
+    fig_species_yearly.update_yaxes(dtick=max(1, yearly_species_counts["Počet pozorování"].max() // 5))
+    return fig_species_yearly
+
+
+PHENOLOGY_TITLES = {"month": "měsíců", "week": "týdnů", "day": "dnů v roce"}
+
+
+def figure_monthly(monthly_counts: pd.DataFrame, unit: str = "month"):
+    """Graf: počet pozorování podle měsíců, týdnů nebo dnů v roce (vstup z Dataset.phenology)."""
+    fig_monthly_obs = px.bar(
+        monthly_counts,
+        x=PHENOLOGY_UNITS[unit],
+        y="Počet pozorování",
+        title=f"Počet pozorování podle {PHENOLOGY_TITLES[unit]}"
+    )
+
+    # Nastavení celočíselné hodnoty na ose Y:
+    fig_monthly_obs.update_yaxes(dtick=max(1, monthly_counts["Počet pozorování"].max() // 5))
+    return fig_monthly_obs
+
+
+# ========================
+# Přehled jednoho druhu
+# ========================
+PLOTLY_JS = "plotly.min.js"  # Knihovna plotly se zapíše jednou do kořene výstupu, stránky na ni odkazují
+
+REPORT_PAGE = """<!DOCTYPE html>
+<html lang="cs">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="../{plotly_js}"></script>
+</head>
+<body>
+<p><a href="../index.html">Všechny druhy</a></p>
+<h1>{title}</h1>
+<p>Období {date_from} – {date_to}</p>
+{summary}
+{yearly}
+{monthly}
+<h2>Mapa pozorování</h2>
+{heatmap}
+</body>
+</html>
+"""
+
+# Stav pracovního procesu: nastavení exportu (data dostává každá úloha zvlášť)
+WORKER = {}
+# Sloupce záznamů, které potřebuje heatmapa (jen ty se posílají do pracovních procesů)
+HEATMAP_COLUMNS = ["Zeměpisná šířka", "Zeměpisná délka", "Počet"]
+# Nejvýš tolik úloh na proces je rozpracovaných najednou (odeslaných, ale nedokončených)
+TASKS_PER_WORKER = 4
+
+
+def species_slugs(species) -> dict:
+    """Jedinečné názvy adresářů pro druhy (bez diakritiky a mezer, např. "lednacek-ricni")."""
+    slugs = {}
+    used = set()
+    for name in species:
+        text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-").lower() or "druh"
+        candidate, i = slug, 2
+        while candidate in used:
+            candidate, i = f"{slug}-{i}", i + 1
+        used.add(candidate)
+        slugs[name] = candidate
+    return slugs
+
+
+def init_worker(config: dict, ingest: dict, options: dict) -> None:
+    """Pracovní proces: převezme nastavení hlavního procesu a exportu."""
+    configure_worker(config, ingest)
+    WORKER["options"] = options
+
+
+def species_summary(dataset: Dataset, species: str, data: pd.DataFrame, date_from, date_to, trend: dict) -> dict:
+    """Souhrnná čísla přehledu druhu (stejná jako v aplikaci a v žebříčku trendů)."""
+    summary = {
+        "Druh": species,
+        "Pozorování celkem": int(dataset.species_yearly_counts(species)["Počet pozorování"].sum()),
+        "Pozorování v období": len(data),
+        "Jedinců v období": int(data["Počet"].sum()) if "Počet" in data.columns else None,
+        "Kvadrátů v období": len(dataset.occupancy.distribution(species, date_from.year, date_to.year)),
+        "První pozorování": data["Datum"].min().date() if "Datum" in data.columns and len(data) else None,
+        "Poslední pozorování": data["Datum"].max().date() if "Datum" in data.columns and len(data) else None,
+    }
+    if summary["Pozorování celkem"]:
+        summary["1 z N pozorování"] = dataset.info["n_rows"] // summary["Pozorování celkem"]
+    summary.update(trend)
+    return summary
+
+
+def summary_html(summary: dict) -> str:
+    """Souhrnná čísla jako HTML tabulka (bez prázdných hodnot)."""
+    rows = "".join(
+        f"<tr><th>{html.escape(key)}</th><td>{html.escape(str(value))}</td></tr>"
+        for key, value in summary.items() if key != "Druh" and value is not None and not pd.isna(value)
+    )
+    return f'<table border="1">{rows}</table>'
+
+
+def report_task(dataset: Dataset, species: str, slug: str, trend: dict, phenology, date_from, date_to) -> dict:
+    """
+    Podklady přehledu jednoho druhu pro render_report (v hlavním procesu): souhrnná čísla,
+    výřez kostky druhu, fenologie (nebo None bez sloupce Datum) a souřadnice záznamů v období.
+    """
+    data = dataset.select(species, date_from, date_to)
+    return {
+        "species": species,
+        "slug": slug,
+        "summary": species_summary(dataset, species, data, date_from, date_to, trend),
+        "cube": species_cube(dataset.cube, species),
+        "years": dataset.info["years"],
+        "phenology": phenology,
+        "points": data[[col for col in HEATMAP_COLUMNS if col in data.columns]],
+    }
+
+
+def render_report(task: dict) -> dict:
+    """
+    Vykreslí přehled jednoho druhu z podkladů report_task do adresáře output_dir/<slug>/
+    (index.html, heatmap.html, případně yearly.png a monthly.png) a vrátí jeho souhrnná
+    čísla pro rejstřík.
+    """
+    species, summary, data = task["species"], task["summary"], task["points"]
+    options = WORKER["options"]
+    date_from, date_to = options["date_from"], options["date_to"]
+    report_dir = os.path.join(options["output_dir"], task["slug"])
+    os.makedirs(report_dir, exist_ok=True)
+
+    fig_yearly = figure_species_yearly(task["cube"], species, task["years"])
+    fig_monthly = figure_monthly(task["phenology"]) if task["phenology"] is not None else None
+    if options["images"]:
+        fig_yearly.write_image(os.path.join(report_dir, "yearly.png"))
+        if fig_monthly is not None:
+            fig_monthly.write_image(os.path.join(report_dir, "monthly.png"))
+
+    if len(data) and {"Zeměpisná šířka", "Zeměpisná délka"} <= set(data.columns):
+        with open(os.path.join(report_dir, "heatmap.html"), "w", encoding="utf-8") as f:
+            f.write(heatmap_html(data))
+        heatmap = '<iframe src="heatmap.html" width="700" height="510" style="border: none;"></iframe>'
+    else:
+        heatmap = "<p>V tomto období nejsou žádná pozorování se souřadnicemi.</p>"
+
+    page = REPORT_PAGE.format(
+        title=html.escape(species),
+        plotly_js=PLOTLY_JS,
+        date_from=date_from.strftime("%d. %m. %Y"),
+        date_to=date_to.strftime("%d. %m. %Y"),
+        summary=summary_html(summary),
+        yearly=fig_yearly.to_html(full_html=False, include_plotlyjs=False),
+        monthly=fig_monthly.to_html(full_html=False, include_plotlyjs=False) if fig_monthly is not None else "",
+        heatmap=heatmap,
+    )
+    with open(os.path.join(report_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(page)
+    return summary
+
+
+# ========================
+# Export všech (vybraných) druhů
+# ========================
+def bounded_map(pool: ProcessPoolExecutor, fn, tasks, window: int):
+    """
+    Jako pool.map (výsledky ve stejném pořadí), ale úlohy se z generátoru tasks berou
+    postupně a rozpracovaných je nejvýš window - podklady všech úloh nejsou v paměti najednou.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def write_index(output_dir: str, summaries: pd.DataFrame, slugs: dict, date_from, date_to) -> None:
+    """Rejstřík přehledů (index.html s odkazy) a souhrnná čísla všech druhů jako souhrn.csv."""
+    summaries.to_csv(os.path.join(output_dir, "souhrn.csv"), index=False)
+    table = summaries.assign(Druh=[
+        f'<a href="{slugs[name]}/index.html">{html.escape(name)}</a>' for name in summaries["Druh"]
+    ]).to_html(index=False, escape=False, na_rep="")
+    with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(
+            '<!DOCTYPE html>\n<html lang="cs">\n<head>\n<meta charset="utf-8">\n<title>Přehledy druhů</title>\n</head>\n'
+            f"<body>\n<h1>Přehledy druhů</h1>\n<p>Období {date_from:%d. %m. %Y} – {date_to:%d. %m. %Y}</p>\n"
+            f"{table}\n</body>\n</html>\n"
+        )
+
+
+def export_reports(file_path: str, output_dir: str, species=None, date_from=None, date_to=None,
+                   workers: int = None, engine: str = None, images: bool = True) -> pd.DataFrame:
+    """
+    Vykreslí přehledy druhů species (výchozí všechny) v rozsahu date_from..date_to (výchozí
+    celý rozsah dat) do output_dir souběžně ve workers procesech (výchozí počet jader).
+    Vrátí souhrnná čísla všech druhů (stejná jako souhrn.csv).
+    """
+    start = time.perf_counter()
+    dataset = Dataset(file_path, engine)  # Připraví snapshoty, ze kterých pak čtou pracovní procesy
+    if dataset.info["date_min"] is None:
+        raise ValueError("Data neobsahují sloupec s datem.")
+    date_from = date_from or dataset.info["date_min"]
+    date_to = date_to or dataset.info["date_max"]
+    species = list(species) if species else dataset.info["species"]
+    unknown = sorted(set(species) - set(dataset.info["species"]))
+    if unknown:
+        raise ValueError(f"Neznámé druhy: {', '.join(unknown)}")
+    if images and kaleido is None:
+        logger.warning("Balíček kaleido není nainstalovaný, PNG grafy se nevytvoří (jen HTML).")
+        images = False
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, PLOTLY_JS), "w", encoding="utf-8") as f:
+        f.write(plotly.offline.get_plotlyjs())
+
+    # Trendy všech druhů jedním výpočtem; procesům se předají jen hodnoty jejich druhů
+    ranking = dataset.trends.ranking(date_from.year, date_to.year).set_index("Druh")
+    trend_columns = [col for col in ranking.columns if col.startswith("Trend")]
+    slugs = species_slugs(species)
+    # Fenologie všech druhů jedním výpočtem (z předpočítané tabulky, nebo jedním průchodem záznamů)
+    phenology = None
+    if "Datum" in dataset.info["columns"]:
+        phenology = dict(iter(dataset.phenology_many(species, date_from, date_to).groupby("Druh", sort=False, observed=True)))
+    tasks = (
+        report_task(
+            dataset, name, slugs[name], ranking.loc[name, trend_columns].to_dict() if name in ranking.index else {},
+            phenology[name].drop(columns=["Druh"]).reset_index(drop=True) if phenology is not None else None,
+            date_from, date_to,
+        )
+        for name in species
+    )
+
+    options = {"output_dir": output_dir, "date_from": date_from, "date_to": date_to, "images": images}
+    workers = min(workers or os.cpu_count() or 1, len(species)) or 1
+    summaries = []
+    if workers == 1:
+        WORKER.update(options=options)
+        results = map(render_report, tasks)
+        pool = None
+    else:
+        # "spawn" jako u exportu po částech; procesy dostávají jen podklady jednotlivých druhů
+        pool = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker, initargs=(CONFIG, INGEST, options)
+        )
+        results = bounded_map(pool, render_report, tasks, workers * TASKS_PER_WORKER)
+    try:
+        for i, summary in enumerate(results, 1):
+            summaries.append(summary)
+            if i % 100 == 0 or i == len(species):
+                logger.info("Hotovo %d z %d přehledů (%.0f s)", i, len(species), time.perf_counter() - start)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    summaries = pd.DataFrame(summaries)
+    write_index(output_dir, summaries, slugs, date_from, date_to)
+    logger.info(
+        "%d přehledů v %s za %.1f s (%d procesů)", len(summaries), output_dir, time.perf_counter() - start, workers
+    )
+    return summaries
+
+
+def main(argv=None):
+    """Příkazová řádka hromadného exportu přehledů."""
+    parser = argparse.ArgumentParser(description="Hromadný export statických přehledů druhů z CSV exportu NDOP.")
+    parser.add_argument("file_path", help="CSV export z NDOP, nebo adresář s exportem rozděleným do více CSV")
+    parser.add_argument("-o", "--output-dir", default="reports", help="výstupní adresář (výchozí reports)")
+    parser.add_argument("-s", "--species", nargs="+", help="jen vybrané druhy (výchozí všechny)")
+    parser.add_argument("--year", type=int, help="přehledy za jeden rok (jinak --date-from/--date-to)")
+    parser.add_argument("--date-from", type=date.fromisoformat, help="datum od (YYYY-MM-DD), výchozí první datum v datech")
+    parser.add_argument("--date-to", type=date.fromisoformat, help="datum do (YYYY-MM-DD), výchozí poslední datum v datech")
+    parser.add_argument("--workers", type=int, help="počet procesů (výchozí počet jader)")
+    parser.add_argument("--engine", choices=["auto", "pandas", "duckdb"], help="backend pro dotazy (výchozí BACKEND['engine'])")
+    parser.add_argument("--no-images", action="store_true", help="neukládat PNG grafy (jen HTML)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="nevypisovat průběh")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format="%(message)s")
+    date_from, date_to = args.date_from, args.date_to
+    if args.year:
+        date_from, date_to = date(args.year, 1, 1), date(args.year, 12, 31)
+    try:
+        export_reports(
+            args.file_path, args.output_dir, args.species, date_from, date_to,
+            args.workers, args.engine, images=not args.no_images
+        )
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()